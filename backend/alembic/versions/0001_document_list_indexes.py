@@ -0,0 +1,45 @@
+"""文档列表查询的部分索引
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# 只索引未删除的文档
+NOT_DELETED = sa.column("is_deleted") == sa.false()
+PUBLIC_NOT_DELETED = sa.and_(sa.column("is_public") == sa.true(), NOT_DELETED)
+
+
+def upgrade() -> None:
+    # 表由应用启动时的 create_tables 创建，新建的库已带有这些索引，因此允许已存在
+    op.create_index(
+        "ix_markdown_documents_user_updated",
+        "markdown_documents",
+        ["user_id", "updated_at", "id"],
+        sqlite_where=NOT_DELETED,
+        postgresql_where=NOT_DELETED,
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_markdown_documents_public_views",
+        "markdown_documents",
+        ["view_count", "id"],
+        sqlite_where=PUBLIC_NOT_DELETED,
+        postgresql_where=PUBLIC_NOT_DELETED,
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_markdown_documents_public_views", table_name="markdown_documents", if_exists=True)
+    op.drop_index("ix_markdown_documents_user_updated", table_name="markdown_documents", if_exists=True)
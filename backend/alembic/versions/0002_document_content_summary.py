@@ -0,0 +1,95 @@
+"""文档正文长度与摘要列
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import re
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# 摘要生成规则的副本（迁移需与当时的规则保持一致，不引用应用代码）
+EXCERPT_LENGTH = 200
+_EXCERPT_SCAN = 4000
+_FENCED_CODE_RE = re.compile(r"^(```|~~~).*?^\1", re.S | re.M)
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_TAG_RE = re.compile(r"<[^>]+>")
+_BLOCK_MARK_RE = re.compile(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", re.M)
+_INLINE_MARK_RE = re.compile(r"[*_`~]+")
+
+BATCH_SIZE = 500
+
+
+def make_excerpt(content):
+    text = content[:_EXCERPT_SCAN]
+    text = _FENCED_CODE_RE.sub(" ", text)
+    text = _IMAGE_RE.sub(" ", text)
+    text = _LINK_RE.sub(r"\1", text)
+    text = _TAG_RE.sub(" ", text)
+    text = _BLOCK_MARK_RE.sub("", text)
+    text = _INLINE_MARK_RE.sub("", text)
+    return " ".join(text.split())[:EXCERPT_LENGTH]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # 服务启动时新建的表已包含这两列
+    existing = {column["name"] for column in sa.inspect(bind).get_columns("markdown_documents")}
+    if "content_length" not in existing:
+        op.add_column(
+            "markdown_documents",
+            sa.Column("content_length", sa.Integer(), server_default="0", nullable=False),
+        )
+    if "excerpt" not in existing:
+        op.add_column(
+            "markdown_documents",
+            sa.Column("excerpt", sa.String(length=EXCERPT_LENGTH), nullable=True),
+        )
+
+    # 为已有文档补写正文长度与摘要，按ID分批读取，只取生成摘要所需的正文开头
+    documents = sa.table(
+        "markdown_documents",
+        sa.column("id", sa.Integer),
+        sa.column("content", sa.Text),
+        sa.column("content_length", sa.Integer),
+        sa.column("excerpt", sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                documents.c.id,
+                sa.func.length(documents.c.content),
+                sa.func.substr(documents.c.content, 1, _EXCERPT_SCAN),
+            )
+            .where(documents.c.id > last_id)
+            .order_by(documents.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            documents.update()
+            .where(documents.c.id == sa.bindparam("doc_id"))
+            .values(content_length=sa.bindparam("length"), excerpt=sa.bindparam("summary")),
+            [
+                {"doc_id": doc_id, "length": length, "summary": make_excerpt(head)}
+                for doc_id, length, head in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.drop_column("markdown_documents", "excerpt")
+    op.drop_column("markdown_documents", "content_length")
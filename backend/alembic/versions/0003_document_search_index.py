@@ -0,0 +1,135 @@
+"""文档全文索引
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+import re
+import unicodedata
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# 以下为 db/search.py 中建表语句与分词规则的副本（迁移需与当时的规则保持一致，不引用应用代码）
+SEARCH_TABLE = "markdown_document_search"
+PG_MAX_INDEXED_CONTENT = 200_000
+
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+_SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(owner, title, description, content)",
+]
+
+_POSTGRES_DDL = [
+    f"""CREATE TABLE {SEARCH_TABLE} (
+        document_id INTEGER PRIMARY KEY REFERENCES markdown_documents(id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL,
+        search_vector TSVECTOR NOT NULL
+    )""",
+    f"CREATE INDEX ix_{SEARCH_TABLE}_vector ON {SEARCH_TABLE} USING GIN (search_vector)",
+    f"CREATE INDEX ix_{SEARCH_TABLE}_user_id ON {SEARCH_TABLE} (user_id)",
+]
+
+_SQLITE_INSERT = sa.text(
+    f"INSERT INTO {SEARCH_TABLE} (rowid, owner, title, description, content) "
+    "VALUES (:document_id, :owner, :title, :description, :content)"
+)
+
+_POSTGRES_INSERT = sa.text(
+    f"""INSERT INTO {SEARCH_TABLE} (document_id, user_id, search_vector)
+    VALUES (
+        :document_id,
+        :user_id,
+        setweight(to_tsvector('simple', :title), 'A')
+        || setweight(to_tsvector('simple', :description), 'B')
+        || setweight(to_tsvector('simple', :content), 'C')
+    )"""
+)
+
+BATCH_SIZE = 500
+
+
+def index_text(value):
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize("NFKC", value or "").lower()):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+            continue
+        tokens.extend(run[index:index + 2] for index in range(len(run) - 1))
+        tokens.append(run[-1])
+    return " ".join(tokens)
+
+
+def _table_exists(bind) -> bool:
+    # 服务启动时的 create_tables 可能已经建好索引（FTS5虚拟表不在 inspect 的结果中）
+    if bind.dialect.name == "postgresql":
+        return bind.execute(sa.text("SELECT to_regclass(:name) IS NOT NULL"), {"name": SEARCH_TABLE}).scalar()
+    return bind.execute(
+        sa.text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SEARCH_TABLE}
+    ).first() is not None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    # 其他数据库搜索时逐行匹配，不建索引
+    if dialect not in ("sqlite", "postgresql") or _table_exists(bind):
+        return
+    for statement in _POSTGRES_DDL if dialect == "postgresql" else _SQLITE_DDL:
+        op.execute(statement)
+
+    # 为未删除的文档补建索引，按ID分批读取
+    documents = sa.table(
+        "markdown_documents",
+        sa.column("id", sa.Integer),
+        sa.column("user_id", sa.Integer),
+        sa.column("title", sa.String),
+        sa.column("description", sa.Text),
+        sa.column("content", sa.Text),
+        sa.column("is_deleted", sa.Boolean),
+    )
+    insert = _POSTGRES_INSERT if dialect == "postgresql" else _SQLITE_INSERT
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                documents.c.id,
+                documents.c.user_id,
+                documents.c.title,
+                documents.c.description,
+                documents.c.content,
+            )
+            .where(documents.c.id > last_id, documents.c.is_deleted == sa.false())
+            .order_by(documents.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(insert, [
+            {
+                "document_id": doc_id,
+                "user_id": user_id,
+                "owner": f"u{user_id}",
+                "title": index_text(title),
+                "description": index_text(description),
+                "content": index_text(
+                    content[:PG_MAX_INDEXED_CONTENT] if dialect == "postgresql" else content
+                ),
+            }
+            for doc_id, user_id, title, description, content in rows
+        ])
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
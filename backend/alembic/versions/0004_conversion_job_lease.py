@@ -0,0 +1,35 @@
+"""转换任务的持有进程与租约
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # 任务表由服务启动时的 create_tables 创建，新建的表已包含这两列
+    if not inspector.has_table("conversion_jobs"):
+        return
+    existing = {column["name"] for column in inspector.get_columns("conversion_jobs")}
+    if "worker_id" not in existing:
+        op.add_column("conversion_jobs", sa.Column("worker_id", sa.String(length=64), nullable=True))
+    if "heartbeat_at" not in existing:
+        op.add_column("conversion_jobs", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("conversion_jobs"):
+        return
+    op.drop_column("conversion_jobs", "heartbeat_at")
+    op.drop_column("conversion_jobs", "worker_id")
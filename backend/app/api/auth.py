@@ -1,10 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from typing import Optional
 
-from db.database import get_db
+from db.database import get_async_db
 from db.schemas import UserCreate, UserResponse, Token, UserLogin
 from app.auth import (
     authenticate_user, 
@@ -18,30 +18,30 @@ from app.config import settings
 router = APIRouter(prefix="/auth", tags=["认证"])
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """用户注册"""
     # 检查用户名是否已存在
-    if UserCRUD.get_by_username(db, user.username):
+    if await UserCRUD.get_by_username(db, user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
         )
     
     # 检查邮箱是否已存在
-    if UserCRUD.get_by_email(db, user.email):
+    if await UserCRUD.get_by_email(db, user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="邮箱已被注册"
         )
     
     # 创建用户
-    db_user = UserCRUD.create(db, user)
+    db_user = await UserCRUD.create(db, user)
     return db_user
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """用户登录"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,7 +56,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         )
     
     # 更新最后登录时间
-    UserCRUD.update_last_login(db, user.id)
+    await UserCRUD.update_last_login(db, user.id)
     
     # 创建访问令牌
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
@@ -73,9 +73,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     }
 
 @router.post("/login-username", response_model=Token)
-async def login_with_username(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login_with_username(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """使用用户名登录"""
-    user = authenticate_user(db, user_data.username, user_data.password)
+    user = await authenticate_user(db, user_data.username, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -90,7 +90,7 @@ async def login_with_username(user_data: UserLogin, db: Session = Depends(get_db
         )
     
     # 更新最后登录时间
-    UserCRUD.update_last_login(db, user.id)
+    await UserCRUD.update_last_login(db, user.id)
     
     # 创建访问令牌
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
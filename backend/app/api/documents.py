@@ -1,96 +1,212 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
-from db.database import get_db
+from db.database import get_async_db
 from db.schemas import (
     MarkdownDocumentCreate, 
     MarkdownDocumentResponse, 
+    MarkdownDocumentSummary,
     MarkdownDocumentUpdate,
+    ConversionJobResponse,
+    BatchDownloadRequest,
+    PdfEncryptionRequest,
     PaginationParams,
     PaginatedResponse
 )
 from app.auth import get_current_active_user, get_current_premium_user
-from app.crud import MarkdownDocumentCRUD, UserCRUD
+from app.crud import MarkdownDocumentCRUD, QuotaExceededError, UserCRUD
 from app.config import settings
-from db.models import User
+from app.converter import ConversionError, InvalidPdfSettingsError, PdfResult, document_html_key, get_html, get_pdf, lookup_pdf, release_pdf, warm_html
+from app.batch import stream_documents_zip
+from app.converter.encrypt import encrypt_pdf_stream
+from app.downloads import encrypted_pdf_response, html_preview_response, pdf_file_response
+from app.jobs import QueueFullError, conversion_queue, job_response
+from app.pagination import InvalidCursorError, Page
+from app.views import view_counter
+from db.models import User, MarkdownDocument
+from db.search import search_snippet
 
 router = APIRouter(prefix="/documents", tags=["文档管理"])
 
+def paginated_response(result: Page, total: int, size: int) -> PaginatedResponse:
+    """组装分页响应"""
+    return PaginatedResponse(
+        items=result.items,
+        total=total,
+        size=size,
+        pages=(total + size - 1) // size,
+        next_cursor=result.next_cursor,
+        prev_cursor=result.prev_cursor
+    )
+
+async def render_pdf(db: AsyncSession, db_document: MarkdownDocument, user_id: int) -> PdfResult:
+    """获取文档PDF（优先使用缓存），并将转换错误转为HTTP异常；文件用完后须调用 release_pdf
+
+    缓存中没有时需要重新渲染，计为一次转换并检查免费用户的转换额度；
+    已渲染过的PDF（如转换任务的结果）直接返回，不再计数。
+    """
+    try:
+        cached = lookup_pdf(
+            db_document.content,
+            db_document.title,
+            db_document.pdf_settings,
+            db_document.template_name
+        )
+        if cached is not None:
+            return cached
+        await MarkdownDocumentCRUD.increment_conversion_count(db, db_document.id, user_id)
+        await db.commit()
+        return await get_pdf(
+            db_document.content,
+            db_document.title,
+            db_document.pdf_settings,
+            db_document.template_name
+        )
+    except InvalidPdfSettingsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        ) from e
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        ) from e
+    except ConversionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        ) from e
+
 @router.post("/", response_model=MarkdownDocumentResponse, status_code=status.HTTP_201_CREATED)
 async def create_document(
     document: MarkdownDocumentCreate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建新文档"""
-    # 检查用户限制
-    if current_user.role.value == "free":
-        if current_user.total_documents >= settings.free_user_document_limit:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"免费用户最多只能创建{settings.free_user_document_limit}个文档，请升级为会员"
-            )
-    
-    db_document = MarkdownDocumentCRUD.create(db, document, current_user.id)
+    # 免费用户的文档数限制在创建时与计数一起原子地检查
+    try:
+        db_document = await MarkdownDocumentCRUD.create(db, document, current_user.id)
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        ) from e
+    # 保存后预渲染HTML，首次预览时直接命中缓存
+    background_tasks.add_task(warm_html, db_document.content)
     return db_document
 
 @router.get("/", response_model=PaginatedResponse)
 async def get_my_documents(
-    page: int = Query(1, ge=1, description="页码"),
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一次响应的 next_cursor 或 prev_cursor"),
     size: int = Query(10, ge=1, le=100, description="每页数量"),
     search: Optional[str] = Query(None, description="搜索关键词"),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取我的文档列表"""
-    skip = (page - 1) * size
+    try:
+        if search:
+            result = await MarkdownDocumentCRUD.search_documents(db, current_user.id, search, size, cursor)
+            total = await MarkdownDocumentCRUD.count_search_results(db, current_user.id, search)
+        else:
+            result = await MarkdownDocumentCRUD.get_user_documents(db, current_user.id, size, cursor)
+            total = await MarkdownDocumentCRUD.count_user_documents(db, current_user.id)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        ) from e
     
     if search:
-        documents = MarkdownDocumentCRUD.search_documents(db, current_user.id, search, skip, size)
-        # 这里应该实现搜索的总数统计，暂时简化处理
-        total = len(documents)
-    else:
-        documents = MarkdownDocumentCRUD.get_user_documents(db, current_user.id, skip, size)
-        # 这里应该实现总数统计，暂时简化处理
-        total = len(documents)
-    
-    pages = (total + size - 1) // size
+        # 搜索结果附带高亮摘要，正文中没有直接命中时取描述
+        contexts = await MarkdownDocumentCRUD.get_search_contexts(
+            db, [document.id for document in result.items], search
+        )
+        items = [
+            MarkdownDocumentSummary.model_validate(document).model_copy(update={
+                "snippet": search_snippet(contexts.get(document.id), search)
+                or search_snippet(document.description, search)
+            })
+            for document in result.items
+        ]
+        result = result._replace(items=items)
     
-    return PaginatedResponse(
-        items=documents,
-        total=total,
-        page=page,
-        size=size,
-        pages=pages
-    )
+    return paginated_response(result, total, size)
 
-@router.get("/public", response_model=List[MarkdownDocumentResponse])
+@router.get("/public", response_model=PaginatedResponse)
 async def get_public_documents(
-    skip: int = Query(0, ge=0, description="跳过数量"),
-    limit: int = Query(20, ge=1, le=100, description="限制数量"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="分页游标，取自上一次响应的 next_cursor 或 prev_cursor"),
+    size: int = Query(20, ge=1, le=100, description="每页数量"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取公开文档列表"""
-    documents = MarkdownDocumentCRUD.get_public_documents(db, skip, limit)
-    return documents
+    try:
+        result = await MarkdownDocumentCRUD.get_public_documents(db, size, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        ) from e
+    total = await MarkdownDocumentCRUD.count_public_documents(db)
+    return paginated_response(result, total, size)
+
+@router.post("/batch/download")
+async def batch_download_pdfs(
+    batch: BatchDownloadRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量下载PDF（ZIP压缩包，边转换边下载）"""
+    if batch.all:
+        document_ids = await MarkdownDocumentCRUD.get_user_document_ids(db, current_user.id)
+    elif batch.document_ids:
+        document_ids = await MarkdownDocumentCRUD.get_user_document_ids(db, current_user.id, batch.document_ids)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请指定文档ID列表或选择全部文档"
+        )
+
+    if not document_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="没有可下载的文档"
+        )
+
+    if len(document_ids) > settings.batch_max_documents:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多下载{settings.batch_max_documents}个文档"
+        )
+
+    return StreamingResponse(
+        stream_documents_zip(current_user.id, document_ids, settings.batch_window),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="documents.zip"'}
+    )
 
 @router.get("/{document_id}", response_model=MarkdownDocumentResponse)
 async def get_document(
     document_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取文档详情"""
-    db_document = MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
+    db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
     if not db_document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文档不存在或无权限访问"
         )
     
-    # 增加查看次数
-    MarkdownDocumentCRUD.increment_view_count(db, document_id)
+    # 增加查看次数（先在内存中累计，定期批量写入）
+    view_counter.record(document_id)
     
     return db_document
 
@@ -98,27 +214,31 @@ async def get_document(
 async def update_document(
     document_id: int,
     document_update: MarkdownDocumentUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新文档"""
-    db_document = MarkdownDocumentCRUD.update(db, document_id, document_update, current_user.id)
+    db_document = await MarkdownDocumentCRUD.update(db, document_id, document_update, current_user.id)
     if not db_document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文档不存在或无权限修改"
         )
     
+    if document_update.content is not None:
+        background_tasks.add_task(warm_html, db_document.content)
+
     return db_document
 
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除文档"""
-    success = MarkdownDocumentCRUD.delete(db, document_id, current_user.id)
+    success = await MarkdownDocumentCRUD.delete(db, document_id, current_user.id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -127,61 +247,124 @@ async def delete_document(
     
     return {"message": "文档已删除"}
 
-@router.post("/{document_id}/convert")
+@router.post(
+    "/{document_id}/convert",
+    response_model=ConversionJobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
 async def convert_document_to_pdf(
     document_id: int,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """转换文档为PDF"""
+    """提交PDF转换任务，通过 /api/jobs/{job_id} 查询进度"""
     # 检查文档是否存在
-    db_document = MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
+    db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
     if not db_document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文档不存在或无权限访问"
         )
     
-    # 检查用户转换限制
-    if current_user.role.value == "free":
-        if current_user.total_conversions >= settings.free_user_conversion_limit:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"免费用户最多只能转换{settings.free_user_conversion_limit}次，请升级为会员"
-            )
-    
-    # 这里应该实现PDF转换逻辑
-    # 暂时模拟转换成功
-    MarkdownDocumentCRUD.increment_conversion_count(db, document_id, current_user.id)
+    # 免费用户的转换次数限制在提交时与计数一起原子地检查
+    try:
+        db_job = await conversion_queue.submit(db, db_document, current_user.id)
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        ) from e
+    except InvalidPdfSettingsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        ) from e
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(settings.conversion_queue_retry_after)}
+        ) from e
     
-    return {
-        "message": "文档转换成功",
-        "document_id": document_id,
-        "download_url": f"/api/documents/{document_id}/download"
-    }
+    response.headers["Location"] = f"/api/jobs/{db_job.id}"
+    return job_response(db_job)
 
-@router.get("/{document_id}/download")
+@router.api_route("/{document_id}/download", methods=["GET", "HEAD"])
 async def download_pdf(
     document_id: int,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """下载PDF文件"""
     # 检查文档是否存在
-    db_document = MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
+    db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
     if not db_document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="文档不存在或无权限访问"
         )
     
-    # 这里应该实现PDF文件生成和下载逻辑
-    # 暂时返回模拟响应
-    return {
-        "message": "PDF下载功能待实现",
-        "document_id": document_id,
-        "filename": f"{db_document.title}.pdf"
-    }
+    result = await render_pdf(db, db_document, current_user.id)
+    return pdf_file_response(
+        request, result.path, result.key, f"{db_document.title}.pdf",
+        BackgroundTask(release_pdf, result)
+    )
+
+@router.post("/{document_id}/download/encrypted")
+async def download_encrypted_pdf(
+    document_id: int,
+    encryption: PdfEncryptionRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """下载加密的PDF文件（密码放在请求体中，避免出现在URL和访问日志里）"""
+    db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
+    if not db_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文档不存在或无权限访问"
+        )
+
+    # 加密基于缓存中的明文PDF，不同密码共用同一次渲染
+    result = await render_pdf(db, db_document, current_user.id)
+    chunks = encrypt_pdf_stream(
+        result.path,
+        encryption.password,
+        encryption.owner_password,
+        encryption.allow_print,
+        encryption.allow_copy
+    )
+    return encrypted_pdf_response(chunks, f"{db_document.title}.pdf", BackgroundTask(release_pdf, result))
+
+@router.api_route("/{document_id}/html", methods=["GET", "HEAD"])
+async def preview_html(
+    document_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取文档的预览HTML（已清洗，可直接插入页面）"""
+    db_document = await MarkdownDocumentCRUD.get_readable(db, document_id, current_user.id)
+    if not db_document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="文档不存在或无权限访问"
+        )
+
+    content = db_document.content
+
+    async def render() -> str:
+        try:
+            return (await get_html(content)).html
+        except ConversionError as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(e)
+            ) from e
+
+    return await html_preview_response(request, document_html_key(content), render)
 
 # 会员专用接口
 @router.post("/{document_id}/share")
@@ -189,10 +372,10 @@ async def share_document(
     document_id: int,
     is_public: bool = True,
     current_user: User = Depends(get_current_premium_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """分享文档（会员功能）"""
-    db_document = MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
+    db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, current_user.id)
     if not db_document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -200,7 +383,7 @@ async def share_document(
         )
     
     db_document.is_public = is_public
-    db.commit()
+    await db.commit()
     
     return {
         "message": f"文档已{'公开' if is_public else '设为私有'}",
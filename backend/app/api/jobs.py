@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_active_user
+from app.crud import ConversionJobCRUD
+from app.jobs import job_response
+from db.database import get_async_db
+from db.models import User
+from db.schemas import ConversionJobResponse
+
+router = APIRouter(prefix="/jobs", tags=["转换任务"])
+
+@router.get("/{job_id}", response_model=ConversionJobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """查询转换任务状态"""
+    db_job = await ConversionJobCRUD.get_by_id(db, job_id, current_user.id)
+    if not db_job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在或无权限访问"
+        )
+
+    return job_response(db_job)
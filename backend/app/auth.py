@@ -4,8 +4,9 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_async_db
 from db.models import User, UserRole
 from db.schemas import TokenData
 from app.config import settings
@@ -50,7 +51,7 @@ def verify_token(token: str) -> Optional[TokenData]:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """获取当前用户"""
     credentials_exception = HTTPException(
@@ -63,7 +64,7 @@ async def get_current_user(
     if token_data is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await db.get(User, token_data.user_id)
     if user is None:
         raise credentials_exception
     
@@ -102,16 +103,17 @@ async def get_current_admin_user(current_user: User = Depends(get_current_user))
         )
     return current_user
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """用户认证"""
-    user = db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
         return None
     return user
 
-def check_user_limits(user: User, db: Session) -> bool:
+def check_user_limits(user: User, db: AsyncSession) -> bool:
     """检查用户使用限制"""
     if user.role == UserRole.FREE:
         # 检查文档数量限制
@@ -120,10 +122,4 @@ def check_user_limits(user: User, db: Session) -> bool:
         # 检查转换次数限制
         if user.total_conversions >= settings.free_user_conversion_limit:
             return False
-    return True
-
-def update_user_stats(user: User, db: Session, document_count: int = 0, conversion_count: int = 0):
-    """更新用户统计信息"""
-    user.total_documents += document_count
-    user.total_conversions += conversion_count
-    db.commit() 
\ No newline at end of file
+    return True
\ No newline at end of file
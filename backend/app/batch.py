@@ -0,0 +1,190 @@
+import asyncio
+import time
+import zipfile
+from typing import AsyncIterator, List, NamedTuple, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.converter import ConversionError, PdfResult, get_pdf, lookup_pdf, release_pdf
+from app.crud import MarkdownDocumentCRUD, QuotaExceededError
+from db.database import AsyncSessionLocal
+from db.models import MarkdownDocument
+
+# 读取PDF文件的块大小
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class RenderedDocument(NamedTuple):
+    """批量转换中单个文档的结果"""
+    document_id: int
+    title: str
+    result: Optional[PdfResult]
+    error: Optional[str]
+
+
+class ZipChunkWriter:
+    """不可seek的ZIP写入目标
+
+    zipfile 检测到目标不支持 tell/seek 时会改用数据描述符写入，
+    写入的数据暂存在这里，由生成器及时取走发送给客户端。
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_name(title: str, used: Set[str]) -> str:
+    """生成ZIP内不重复的文件名"""
+    base = title.replace("/", "_").replace("\\", "_").strip() or "document"
+    name = f"{base}.pdf"
+    index = 2
+    while name in used:
+        name = f"{base} ({index}).pdf"
+        index += 1
+    used.add(name)
+    return name
+
+
+async def _render(
+    document_id: int,
+    title: str,
+    content: str,
+    pdf_settings: Optional[str],
+    template_name: Optional[str]
+) -> RenderedDocument:
+    """渲染单个文档，转换错误记录在结果中而不中断整批"""
+    try:
+        result = await get_pdf(content, title, pdf_settings, template_name)
+    except ConversionError as e:
+        return RenderedDocument(document_id, title, None, str(e))
+    return RenderedDocument(document_id, title, result, None)
+
+
+async def _charge(db: AsyncSession, db_document: MarkdownDocument, user_id: int) -> None:
+    """文档需要重新渲染时计为一次转换（设置无效的文档渲染时会失败，不计数）"""
+    try:
+        cached = lookup_pdf(
+            db_document.content,
+            db_document.title,
+            db_document.pdf_settings,
+            db_document.template_name
+        )
+    except ConversionError:
+        return
+    if cached is not None:
+        release_pdf(cached)
+        return
+    await MarkdownDocumentCRUD.increment_conversion_count(db, db_document.id, user_id)
+    await db.commit()
+
+
+async def render_documents(
+    user_id: int,
+    document_ids: List[int],
+    window: int
+) -> AsyncIterator[RenderedDocument]:
+    """并发渲染多个文档，按完成顺序产出结果
+
+    同时处理的文档不超过 window 个，文档内容在轮到时才从数据库读取，
+    因此内存占用与文档总数无关。缓存中没有的文档需要重新渲染，每篇计为一次转换，
+    免费用户额度用完后其余文档记为失败。
+    """
+    db = AsyncSessionLocal()
+    remaining = iter(document_ids)
+    pending: Set[asyncio.Task[RenderedDocument]] = set()
+    ready: List[RenderedDocument] = []
+    try:
+        while True:
+            while len(pending) < window:
+                document_id = next(remaining, None)
+                if document_id is None:
+                    break
+                db_document = await MarkdownDocumentCRUD.get_by_id(db, document_id, user_id)
+                if db_document is None:
+                    continue
+                try:
+                    await _charge(db, db_document, user_id)
+                except QuotaExceededError as e:
+                    db.expunge(db_document)
+                    yield RenderedDocument(db_document.id, db_document.title, None, str(e))
+                    continue
+                pending.add(asyncio.create_task(_render(
+                    db_document.id,
+                    db_document.title,
+                    db_document.content,
+                    db_document.pdf_settings,
+                    db_document.template_name
+                )))
+                db.expunge(db_document)
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            ready.extend(task.result() for task in done)
+            while ready:
+                yield ready.pop(0)
+    finally:
+        for task in pending:
+            task.cancel()
+        # 客户端中途断开时，已渲染但未发送的PDF解除占用
+        for task in pending:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                ready.append(task.result())
+        for rendered in ready:
+            if rendered.result is not None:
+                release_pdf(rendered.result)
+        await db.close()
+
+
+async def stream_documents_zip(
+    user_id: int,
+    document_ids: List[int],
+    window: int
+) -> AsyncIterator[bytes]:
+    """边渲染边输出包含多个PDF的ZIP压缩包
+
+    PDF本身已经压缩，条目以存储方式写入；每个PDF按块从缓存文件读取后立即发送，
+    不会在内存中构建整个压缩包。转换失败的文档汇总到 errors.txt。
+    """
+    writer = ZipChunkWriter()
+    archive = zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED)
+    used_names: Set[str] = set()
+    errors: List[str] = []
+
+    async for rendered in render_documents(user_id, document_ids, window):
+        if rendered.result is None:
+            errors.append(f"{rendered.title} (#{rendered.document_id}): {rendered.error}")
+            continue
+
+        info = zipfile.ZipInfo(_archive_name(rendered.title, used_names), time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        try:
+            with open(rendered.result.path, "rb") as f, archive.open(info, mode="w") as entry:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = writer.drain()
+                    if data:
+                        yield data
+        finally:
+            release_pdf(rendered.result)
+
+    if errors:
+        archive.writestr("errors.txt", "\n".join(errors) + "\n")
+    archive.close()
+    yield writer.drain()
@@ -32,6 +32,64 @@ class Settings(BaseSettings):
     free_user_document_limit: int = 5
     free_user_conversion_limit: int = 10
     
+    # PDF转换配置
+    conversion_workers: int = os.cpu_count() or 1  # 转换进程数，默认与CPU核数一致
+    conversion_timeout: int = 120  # 单次转换超时（秒）
+    conversion_max_jobs_per_worker: int = 200  # 转换进程执行多少个任务后回收，0表示不限制
+    conversion_max_worker_memory: int = 512 * 1024 * 1024  # 转换进程内存超过该值后回收，0表示不限制
+    conversion_queue_size: int = 100  # 排队任务上限，超出后拒绝新任务
+    conversion_queue_retry_after: int = 10  # 队列已满时建议客户端重试的间隔（秒）
+    conversion_job_heartbeat_interval: float = 15.0  # 进程为自己持有的未完成任务续租的间隔（秒）
+    conversion_job_lease: float = 60.0  # 超过该时间未续租的未完成任务视为持有进程已退出，标记为失败
+    section_render_min_size: int = 0  # 文档超过该大小（字节）时按顶层标题分段并行渲染，0表示关闭
+    view_count_flush_interval: float = 5.0  # 查看次数在内存中累计，每隔该时间（秒）批量写入数据库
+    batch_max_documents: int = 500  # 单次批量下载的文档上限
+    batch_window: int = (os.cpu_count() or 1) * 2  # 批量下载时同时处理的文档数
+
+    # PDF缓存配置
+    pdf_cache_dir: str = "./cache/pdf"
+    pdf_cache_max_bytes: int = 1024 * 1024 * 1024  # 1GB，超出后按LRU淘汰
+    pdf_accel_redirect_prefix: Optional[str] = None  # 例如 "/_pdf_cache/"，交由Nginx sendfile发送
+
+    # 图片预取配置
+    asset_cache_dir: str = "./cache/assets"
+    asset_cache_max_bytes: int = 512 * 1024 * 1024  # 磁盘上限，超出后按LRU淘汰
+    asset_fetch_timeout: float = 5.0  # 单张图片的读取超时（秒）
+    asset_connect_timeout: float = 2.0  # 建立连接超时（秒）
+    asset_stage_timeout: float = 10.0  # 整个预取阶段的超时（秒），超时的图片使用占位图
+    asset_max_connections: int = 50  # 连接池总连接数
+    asset_per_host_connections: int = 4  # 单个主机的并发请求数
+    asset_max_bytes: int = 20 * 1024 * 1024  # 单张图片大小上限
+    asset_fresh_seconds: int = 300  # 缓存在该时间内直接使用，之后发送条件请求重新验证
+    asset_failure_ttl: int = 300  # 获取失败的图片在该时间内不再重试，使用了占位图的PDF也只缓存这么久
+    # 允许获取图片的内网主机（默认拒绝解析到回环、内网、链路本地、保留地址的主机）
+    asset_allowed_private_hosts: list = []
+    image_target_dpi: int = 150  # 超过纸张在该DPI下像素尺寸的图片会被缩小
+
+    # 图表渲染配置（Mermaid，需要安装 @mermaid-js/mermaid-cli）
+    mermaid_cli: str = "mmdc"
+    mermaid_theme: str = "default"
+    mermaid_puppeteer_config: Optional[str] = None  # 容器中运行时可指定 --no-sandbox 等启动参数
+    diagram_workers: int = 4  # 同时运行的图表渲染进程数
+    diagram_timeout: int = 30  # 单个图表的渲染超时（秒）
+    diagram_cache_dir: str = "./cache/diagrams"
+    diagram_cache_max_bytes: int = 256 * 1024 * 1024
+
+    # 嵌入字体子集缓存配置
+    font_cache_dir: str = "./cache/fonts"
+    font_cache_max_bytes: int = 256 * 1024 * 1024  # 磁盘上限，超出后按LRU淘汰
+    font_cache_memory_bytes: int = 64 * 1024 * 1024  # 每个进程的内存上限
+
+    # PDF模板编译缓存目录（Jinja2字节码），留空则不使用磁盘缓存
+    template_bytecode_cache_dir: Optional[str] = "./cache/templates"
+
+    # 渲染片段缓存配置（Markdown块等）
+    fragment_cache_path: str = "./cache/fragments.sqlite3"
+    fragment_cache_max_entries: int = 200000  # 磁盘条目上限
+    fragment_memory_entries: int = 10000  # 每个进程的内存条目上限
+    html_cache_memory_entries: int = 256  # 每个进程在内存中保留的整篇HTML数量
+    highlight_theme: str = "default"  # 代码高亮配色（Pygments样式名）
+
     # CORS配置
     cors_origins: list = [
         "http://localhost:3000",
@@ -0,0 +1,47 @@
+# PDF转换引擎包
+from .assets import Asset, AssetFetcher, asset_fetcher
+from .cache import PdfCache, make_cache_key, pdf_cache
+from .diagrams import DiagramRenderer, diagram_renderer
+from .engine import ENGINE_VERSION, ConversionEngine, conversion_engine, render_document
+from .errors import ConversionError, InvalidPdfSettingsError
+from .options import PdfOptions, parse_pdf_settings
+from .parser import document_html_key
+from .service import (
+    HtmlResult,
+    PdfResult,
+    get_html,
+    get_pdf,
+    lookup_pdf,
+    release_pdf,
+    warm_html,
+)
+from .templates import PdfTemplateRegistry, pdf_templates
+
+__all__ = [
+    "Asset",
+    "AssetFetcher",
+    "asset_fetcher",
+    "PdfCache",
+    "make_cache_key",
+    "pdf_cache",
+    "DiagramRenderer",
+    "diagram_renderer",
+    "ENGINE_VERSION",
+    "ConversionEngine",
+    "conversion_engine",
+    "render_document",
+    "ConversionError",
+    "InvalidPdfSettingsError",
+    "PdfOptions",
+    "parse_pdf_settings",
+    "document_html_key",
+    "PdfTemplateRegistry",
+    "pdf_templates",
+    "HtmlResult",
+    "PdfResult",
+    "get_html",
+    "get_pdf",
+    "lookup_pdf",
+    "release_pdf",
+    "warm_html",
+]
@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import html as html_lib
+import io
+import ipaddress
+import json
+import logging
+import math
+import re
+import socket
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, urljoin, urlsplit
+
+import httpx
+
+from app.config import settings
+from app.converter.cache import PdfCache
+from app.converter.fragments import FragmentCache, fragment_store
+from app.converter.options import PdfOptions
+
+logger = logging.getLogger(__name__)
+
+ASSET_SUFFIX = ".asset"
+
+_IMG_SRC_RE = re.compile(r'<img\b[^>]*?\ssrc="([^"]*)"', re.I)
+# 与WeasyPrint解析图片地址时的转义规则一致（iri_to_uri）
+_URL_SAFE = "/:?#[]@!$&'()*+,;=~%"
+
+# 图片无法获取时使用的占位图
+PLACEHOLDER_SVG = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    b'<rect x="0.5" y="0.5" width="319" height="179" fill="#f5f5f5" stroke="#cccccc"/>'
+    b'<circle cx="190" cy="68" r="10" fill="#c8c8c8"/>'
+    b'<path d="M120 120 L148 86 L168 108 L182 94 L206 120 Z" fill="#c8c8c8"/>'
+    b'</svg>'
+)
+PLACEHOLDER_MEDIA_TYPE = "image/svg+xml"
+
+# 手动跟随重定向的最大次数（每一跳都要重新检查目标地址）
+MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+class UnsafeUrlError(ValueError):
+    """图片地址指向回环、内网、链路本地等非公网地址"""
+
+
+class Asset(NamedTuple):
+    """预取到本地的图片"""
+    path: str
+    media_type: str
+    # 获取失败时使用的占位图，稍后重试可能得到真实的图片
+    fallback: bool = False
+
+
+def normalize_url(url: str) -> str:
+    """规范化图片地址，使其与渲染时请求的地址一致"""
+    return quote(url, safe=_URL_SAFE)
+
+
+def extract_image_urls(html: str) -> List[str]:
+    """提取HTML中需要从网络获取的图片地址（去重，保持出现顺序）"""
+    urls: List[str] = []
+    seen = set()
+    for match in _IMG_SRC_RE.finditer(html):
+        url = normalize_url(html_lib.unescape(match.group(1)).strip())
+        if urlsplit(url).scheme.lower() not in ("http", "https") or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+
+def _is_public_address(address: str) -> bool:
+    """是否为可以访问的公网地址"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_public_url(url: str) -> None:
+    """解析图片地址的主机，指向非公网地址时抛出 UnsafeUrlError
+
+    防止用户通过图片地址让服务端访问内部服务或云主机元数据接口；
+    ASSET_ALLOWED_PRIVATE_HOSTS 中列出的主机不做检查。
+    """
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise UnsafeUrlError(f"不支持的图片地址: {url}")
+    host = parts.hostname.lower()
+    if host in settings.asset_allowed_private_hosts:
+        return
+    try:
+        port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"无法解析主机 {host}: {e}") from e
+    if not infos or not all(_is_public_address(info[4][0]) for info in infos):
+        raise UnsafeUrlError(f"不允许访问非公网地址: {host}")
+
+
+def max_image_pixels(options: PdfOptions, dpi: int) -> Tuple[int, int]:
+    """按纸张尺寸和目标DPI计算图片的最大像素尺寸"""
+    width_mm, height_mm = options.page_dimensions_mm()
+    return math.ceil(width_mm / 25.4 * dpi), math.ceil(height_mm / 25.4 * dpi)
+
+
+def downscale_image(data: bytes, max_size: Tuple[int, int]) -> Optional[Tuple[bytes, str]]:
+    """将超过目标尺寸的位图按比例缩小，返回（图片数据, 媒体类型）；无需或无法处理时返回None"""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, "n_frames", 1) > 1:
+                # 动图保持原样
+                return None
+            if image.width <= max_size[0] and image.height <= max_size[1]:
+                return None
+            image_format = image.format
+            image.thumbnail(max_size, Image.LANCZOS)
+            output = io.BytesIO()
+            if image_format == "JPEG":
+                image.convert("RGB").save(output, "JPEG", quality=90, optimize=True)
+                return output.getvalue(), "image/jpeg"
+            image.save(output, "PNG", optimize=True)
+            return output.getvalue(), "image/png"
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # SVG等非位图格式或损坏的图片
+        return None
+
+
+class AssetFetcher:
+    """渲染前的图片预取
+
+    从文档HTML中提取全部图片地址，通过连接池并发下载（限制单个主机的并发数与超时），
+    下载结果按内容哈希保存在本地缓存目录；再次使用时在有效期内直接复用，
+    过期后携带 ETag/Last-Modified 条件请求重新验证。每次请求（包括重定向的每一跳）
+    之前都会检查目标主机，拒绝回环、内网、链路本地等非公网地址。超过纸张所需分辨率的图片
+    按目标DPI缩小后再交给渲染进程，无法获取的图片快速替换为占位图，并在一段时间内
+    不再重复请求。渲染进程只读取本地文件，不再访问网络。
+    """
+
+    def __init__(self, files: PdfCache, index: FragmentCache):
+        self.files = files
+        # 地址 -> 下载记录、原图 -> 缩放结果，均以JSON保存
+        self.index = index
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Task[Optional[Dict[str, Any]]]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    settings.asset_fetch_timeout, connect=settings.asset_connect_timeout
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.asset_max_connections,
+                    max_keepalive_connections=settings.asset_max_connections,
+                ),
+                # 重定向由 _download 逐跳处理，以便检查每一跳的目标地址
+                follow_redirects=False,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭HTTP连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._host_slots.clear()
+
+    def _store(self, data: bytes) -> str:
+        """按内容哈希保存文件，返回哈希"""
+        key = hashlib.sha256(data).hexdigest()
+        if self.files.get(key) is None:
+            self.files.put(key, data)
+        return key
+
+    def placeholder(self) -> Asset:
+        """占位图"""
+        return Asset(self.files.path_for(self._store(PLACEHOLDER_SVG)), PLACEHOLDER_MEDIA_TYPE, fallback=True)
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return "url:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    async def _download(self, url: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """下载图片；已有缓存时发送条件请求"""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(settings.asset_per_host_connections)
+
+        async with slot:
+            client = self._get_client()
+            for _ in range(MAX_REDIRECTS + 1):
+                await check_public_url(url)
+                request = client.build_request("GET", url, headers=headers)
+                response = await client.send(request, stream=True)
+                location = response.headers.get("location")
+                if response.status_code not in _REDIRECT_STATUSES or not location:
+                    break
+                await response.aclose()
+                url = urljoin(url, location)
+            else:
+                raise ValueError("重定向次数过多")
+
+            try:
+                if response.status_code == 304 and entry is not None:
+                    return {**entry, "checked_at": time.time()}
+                response.raise_for_status()
+                media_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if not media_type.startswith("image/"):
+                    raise ValueError(f"不是图片: {media_type or '未知类型'}")
+                chunks: List[bytes] = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > settings.asset_max_bytes:
+                        raise ValueError("图片过大")
+                    chunks.append(chunk)
+                etag = response.headers.get("etag")
+                last_modified = response.headers.get("last-modified")
+            finally:
+                await response.aclose()
+
+        key = await asyncio.to_thread(self._store, b"".join(chunks))
+        return {
+            "hash": key,
+            "media_type": media_type,
+            "etag": etag,
+            "last_modified": last_modified,
+            "checked_at": time.time(),
+        }
+
+    async def _resolve(self, url: str) -> Optional[Dict[str, Any]]:
+        """获取图片的下载记录，必要时下载或重新验证；失败时返回None"""
+        url_key = self._url_key(url)
+        raw = await self.index.aget(url_key)
+        entry = json.loads(raw) if raw else None
+        if entry is not None:
+            age = time.time() - entry["checked_at"]
+            if "error" in entry:
+                if age < settings.asset_failure_ttl:
+                    return None
+                entry = None
+            elif self.files.get(entry["hash"]) is None:
+                # 本地文件已被淘汰，重新完整下载
+                entry = None
+            elif age < settings.asset_fresh_seconds:
+                return entry
+
+        try:
+            result = await self._download(url, entry)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.info("图片获取失败 %s: %s", url, e)
+            if entry is not None:
+                # 重新验证失败时继续使用本地已有的版本
+                result = {**entry, "checked_at": time.time()}
+            else:
+                result = {"error": str(e) or type(e).__name__, "checked_at": time.time()}
+        await self.index.aput(url_key, json.dumps(result))
+        return None if "error" in result else result
+
+    def _variant(self, entry: Dict[str, Any], max_size: Tuple[int, int]) -> Asset:
+        """获取适合纸张尺寸的图片版本（缩放结果同样缓存）"""
+        variant_key = "variant:" + hashlib.sha256(
+            f"{entry['hash']}:{max_size[0]}x{max_size[1]}".encode("ascii")
+        ).hexdigest()
+        raw = self.index.get(variant_key)
+        if raw:
+            variant = json.loads(raw)
+            path = self.files.get(variant["hash"])
+            if path is not None:
+                return Asset(path, variant["media_type"])
+
+        path = self.files.get(entry["hash"])
+        if path is None:
+            raise FileNotFoundError(entry["hash"])
+        with open(path, "rb") as f:
+            data = f.read()
+        scaled = downscale_image(data, max_size)
+        if scaled is None:
+            variant = {"hash": entry["hash"], "media_type": entry["media_type"]}
+        else:
+            variant = {"hash": self._store(scaled[0]), "media_type": scaled[1]}
+        self.index.put(variant_key, json.dumps(variant))
+        return Asset(self.files.path_for(variant["hash"]), variant["media_type"])
+
+    async def _fetch(self, url: str, max_size: Tuple[int, int]) -> Optional[Asset]:
+        # 相同地址的并发请求共享同一次下载；调用方超时放弃时下载继续完成并写入缓存
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        entry = await asyncio.shield(task)
+        if entry is None:
+            return None
+        return await asyncio.to_thread(self._variant, entry, max_size)
+
+    async def prepare(self, html: str, options: PdfOptions) -> Dict[str, Asset]:
+        """预取文档中的全部图片，返回 地址 -> 本地文件 的映射
+
+        整个阶段受 ASSET_STAGE_TIMEOUT 限制，超时或失败的图片使用占位图。
+        """
+        urls = extract_image_urls(html)
+        if not urls:
+            return {}
+
+        max_size = max_image_pixels(options, settings.image_target_dpi)
+        tasks = {url: asyncio.ensure_future(self._fetch(url, max_size)) for url in urls}
+        done, pending = await asyncio.wait(tasks.values(), timeout=settings.asset_stage_timeout)
+        for task in pending:
+            task.cancel()
+
+        assets: Dict[str, Asset] = {}
+        for url, task in tasks.items():
+            asset = None
+            if task in done:
+                if task.exception() is not None:
+                    logger.warning("图片处理失败 %s: %s", url, task.exception())
+                else:
+                    asset = task.result()
+            assets[url] = asset or self.placeholder()
+        return assets
+
+
+# 全局图片预取器（在主进程的事件循环中使用）
+asset_fetcher = AssetFetcher(
+    PdfCache(settings.asset_cache_dir, settings.asset_cache_max_bytes, suffix=ASSET_SUFFIX),
+    FragmentCache("asset", fragment_store, settings.fragment_memory_entries),
+)
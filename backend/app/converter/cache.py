@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.config import settings
+from app.converter.options import PdfOptions
+from app.converter.templates import pdf_templates
+
+CACHE_SUFFIX = ".pdf"
+# 有效期有限的条目的文件名后缀（放在 suffix 之前），重启后不再加载
+TEMPORARY_SUFFIX = ".partial"
+
+
+def make_cache_key(
+    content: str,
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str],
+    engine_version: str
+) -> str:
+    """根据渲染输入计算缓存键（内容哈希），模板文件的改动也会使缓存失效"""
+    template_name = pdf_templates.resolve(template_name)
+    payload = json.dumps(
+        {
+            "engine": engine_version,
+            "title": title,
+            "options": options.render_options(),
+            "template": template_name,
+            "template_fingerprint": pdf_templates.fingerprint(template_name),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha256()
+    digest.update(payload.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PdfCache:
+    """PDF输出磁盘缓存
+
+    以渲染输入的哈希为键保存PDF文件，总大小超过预算时按最近最少使用（LRU）淘汰。
+    文件的修改时间记录最近访问时间，重启后据此恢复LRU顺序。
+    通过 acquire 取得的文件在 release 之前不会被淘汰，发送或读取期间文件始终存在。
+    写入时指定 ttl 的条目只在有效期内命中，用于保存以后可能得到不同结果的产物。
+    通过 suffix 指定其他扩展名后也可用于保存其他渲染产物（如字体子集）。
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = CACHE_SUFFIX):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        # 键 -> 正在使用该文件的次数
+        self._pins: Dict[str, int] = {}
+        # 键 -> 到期时间（只记录指定了 ttl 的条目）
+        self._expires: Dict[str, float] = {}
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def stats(self) -> Dict[str, int]:
+        """缓存条目数与总大小"""
+        with self._lock:
+            self._ensure_loaded()
+            return {"entries": len(self._entries), "bytes": self._total_bytes}
+
+    def path_for(self, key: str) -> str:
+        """缓存文件路径（按键前两位分目录）"""
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def _temporary_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + TEMPORARY_SUFFIX + self.suffix)
+
+    def _file_path(self, key: str) -> str:
+        """条目当前的文件路径"""
+        return self._temporary_path(key) if key in self._expires else self.path_for(key)
+
+    def _drop(self, key: str) -> None:
+        """移除条目并删除文件（调用方持有锁）"""
+        path = self._file_path(key)
+        self._total_bytes -= self._entries.pop(key)
+        self._expires.pop(key, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _ensure_loaded(self) -> None:
+        """扫描缓存目录，重建LRU索引"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                if name.endswith(TEMPORARY_SUFFIX + self.suffix):
+                    # 上次运行留下的临时条目，到期时间未知，直接删除
+                    try:
+                        os.remove(os.path.join(root, name))
+                    except FileNotFoundError:
+                        pass
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """查找缓存并刷新访问时间（调用方持有锁）"""
+        self._ensure_loaded()
+        if key not in self._entries:
+            return None
+        # 过期的条目在不再使用后删除，使用中的仍然返回
+        if key in self._expires and self._expires[key] <= time.time() and key not in self._pins:
+            self._drop(key)
+            return None
+        path = self._file_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # 文件被外部删除
+            self._total_bytes -= self._entries.pop(key)
+            self._expires.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存，命中时返回文件路径并刷新访问时间"""
+        with self._lock:
+            return self._lookup(key)
+
+    def ttl(self, key: str) -> Optional[float]:
+        """条目剩余的有效时间（秒），没有指定 ttl 的条目返回None"""
+        with self._lock:
+            expires = self._expires.get(key)
+            return None if expires is None else max(0.0, expires - time.time())
+
+    def acquire(self, key: str) -> Optional[str]:
+        """查找缓存并占用文件，占用期间不会被淘汰；命中时用完须调用 release"""
+        with self._lock:
+            path = self._lookup(key)
+            if path is not None:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            return path
+
+    def release(self, key: str) -> None:
+        """解除 acquire 的占用，超出预算的部分随即淘汰"""
+        with self._lock:
+            count = self._pins.pop(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            self._evict()
+
+    def reserve(self) -> str:
+        """在缓存目录中创建临时文件，用于写入渲染结果"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, key: str, tmp_path: str, ttl: Optional[float] = None) -> str:
+        """将写好的临时文件原子地放入缓存，并按预算淘汰旧文件
+
+        指定 ttl（秒）时条目到期后不再命中，且重启后不再加载。
+        """
+        path = self._temporary_path(key) if ttl is not None else self.path_for(key)
+        with self._lock:
+            # 先完成目录扫描，否则扫描会把刚放入的临时条目当作上次运行的遗留删除
+            self._ensure_loaded()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._ensure_loaded()
+            if key in self._entries:
+                if self._file_path(key) != path:
+                    self._drop(key)
+                else:
+                    self._total_bytes -= self._entries.pop(key)
+            if ttl is not None:
+                self._expires[key] = time.time() + ttl
+            else:
+                self._expires.pop(key, None)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict(keep=key)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """写入文件内容"""
+        tmp_path = self.reserve()
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+        return self.commit(key, tmp_path)
+
+    def discard(self, tmp_path: str) -> None:
+        """删除未提交的临时文件"""
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """淘汰最久未访问的文件，直到总大小不超过预算"""
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            # 刚写入的结果与正在使用的文件保留，即使因此暂时超出预算
+            if key == keep or key in self._pins:
+                continue
+            self._drop(key)
+
+
+# 全局PDF缓存实例
+pdf_cache = PdfCache(settings.pdf_cache_dir, settings.pdf_cache_max_bytes)
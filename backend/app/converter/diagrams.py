@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import html as html_lib
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.converter.assets import Asset
+from app.converter.cache import PdfCache
+from app.converter.fragments import FragmentCache, fragment_store
+
+logger = logging.getLogger(__name__)
+
+# 图表渲染版本号，渲染方式变化时需要递增，使已缓存的SVG失效
+DIAGRAM_VERSION = "2"
+DIAGRAM_SUFFIX = ".svg"
+DIAGRAM_MEDIA_TYPE = "image/svg+xml"
+# 渲染进程通过这个前缀从预取结果中读取图表
+DIAGRAM_URL_PREFIX = "diagram:"
+
+# Mermaid配置：默认的HTML标签放在 <foreignObject> 中，WeasyPrint无法渲染，
+# 导致PDF中流程图等图表的文字缺失，改为SVG原生的 <text> 标签
+MERMAID_CONFIG = {
+    "htmlLabels": False,
+    "flowchart": {"htmlLabels": False},
+}
+
+_DIAGRAM_RE = re.compile(r'<pre><code class="language-mermaid">(.*?)</code></pre>', re.S)
+
+
+def diagram_key(source: str) -> str:
+    """图表源码的缓存键"""
+    digest = hashlib.sha256(f"{DIAGRAM_VERSION}\0{settings.mermaid_theme}\0".encode())
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def extract_diagrams(html: str) -> Dict[str, str]:
+    """提取HTML中的Mermaid代码块，返回 缓存键 -> 源码"""
+    diagrams: Dict[str, str] = {}
+    for match in _DIAGRAM_RE.finditer(html):
+        source = html_lib.unescape(match.group(1))
+        diagrams[diagram_key(source)] = source
+    return diagrams
+
+
+def embed_diagrams(html: str, assets: Dict[str, Asset]) -> str:
+    """将已渲染的图表代码块替换为图片，渲染失败的图表保留源码"""
+    def replace(match: "re.Match[str]") -> str:
+        url = DIAGRAM_URL_PREFIX + diagram_key(html_lib.unescape(match.group(1)))
+        if url not in assets:
+            return match.group(0)
+        return f'<figure class="diagram"><img src="{url}" alt="diagram"></figure>'
+
+    return _DIAGRAM_RE.sub(replace, html)
+
+
+class DiagramRenderer:
+    """图表渲染阶段
+
+    Mermaid代码块由独立的 mermaid-cli 进程渲染为SVG，并发数由 DIAGRAM_WORKERS 单独限制，
+    不占用PDF转换进程；一篇文档中的全部图表并行渲染，耗时约等于最慢的一张。
+    SVG按源码哈希缓存在磁盘，未修改的图表再次转换时不再渲染；语法错误的图表记录失败原因，
+    同样不会重复渲染。
+    """
+
+    def __init__(self, files: PdfCache, failures: FragmentCache):
+        self.files = files
+        self.failures = failures
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task[Optional[str]]] = {}
+
+    def _command(self, input_path: str, output_path: str, config_path: str) -> list:
+        command = [
+            settings.mermaid_cli,
+            "-i", input_path,
+            "-o", output_path,
+            "-c", config_path,
+            "-t", settings.mermaid_theme,
+            "-b", "transparent",
+            "-q",
+        ]
+        if settings.mermaid_puppeteer_config:
+            command += ["-p", settings.mermaid_puppeteer_config]
+        return command
+
+    async def _render(self, key: str, source: str) -> Optional[str]:
+        """渲染单个图表并写入缓存，返回SVG文件路径；失败时返回None"""
+        path = self.files.get(key)
+        if path is not None:
+            return path
+        if self.failures.get(key) is not None:
+            return None
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.diagram_workers)
+        async with self._slots:
+            with tempfile.TemporaryDirectory() as directory:
+                input_path = os.path.join(directory, "diagram.mmd")
+                output_path = os.path.join(directory, "diagram" + DIAGRAM_SUFFIX)
+                config_path = os.path.join(directory, "config.json")
+                with open(input_path, "w", encoding="utf-8") as f:
+                    f.write(source)
+                with open(config_path, "w", encoding="utf-8") as f:
+                    json.dump(MERMAID_CONFIG, f)
+
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *self._command(input_path, output_path, config_path),
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.PIPE,
+                    )
+                except OSError as e:
+                    logger.warning("Mermaid渲染工具不可用: %s", e)
+                    return None
+
+                try:
+                    _, stderr = await asyncio.wait_for(
+                        process.communicate(), timeout=settings.diagram_timeout
+                    )
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    logger.warning("图表渲染超时")
+                    return None
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+
+                if process.returncode != 0 or not os.path.exists(output_path):
+                    error = stderr.decode("utf-8", "replace").strip() or f"退出码 {process.returncode}"
+                    logger.info("图表渲染失败: %s", error)
+                    self.failures.put(key, error)
+                    return None
+
+                with open(output_path, "rb") as f:
+                    data = f.read()
+        return self.files.put(key, data)
+
+    async def render(self, key: str, source: str) -> Optional[str]:
+        """渲染图表，相同图表的并发请求共享同一次渲染"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(key, source))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def prepare(self, html: str) -> Tuple[Dict[str, Asset], bool]:
+        """并行渲染文档中的全部图表，返回（图表地址 -> SVG文件 的映射, 是否完整）
+
+        语法错误的图表每次渲染结果都相同，仍算完整；渲染工具不可用、超时等
+        临时原因未能渲染的图表使结果不完整，稍后重试可能成功。
+        """
+        diagrams = extract_diagrams(html)
+        if not diagrams:
+            return {}, True
+
+        keys = list(diagrams)
+        results = await asyncio.gather(
+            *(self.render(key, diagrams[key]) for key in keys), return_exceptions=True
+        )
+        assets: Dict[str, Asset] = {}
+        complete = True
+        for key, result in zip(keys, results):
+            if isinstance(result, BaseException):
+                logger.warning("图表渲染失败: %s", result)
+                complete = False
+            elif result is not None:
+                assets[DIAGRAM_URL_PREFIX + key] = Asset(result, DIAGRAM_MEDIA_TYPE)
+            elif self.failures.get(key) is None:
+                complete = False
+        return assets, complete
+
+
+# 全局图表渲染器（在主进程的事件循环中使用）
+diagram_renderer = DiagramRenderer(
+    PdfCache(settings.diagram_cache_dir, settings.diagram_cache_max_bytes, suffix=DIAGRAM_SUFFIX),
+    FragmentCache("diagram-error", fragment_store, settings.fragment_memory_entries),
+)
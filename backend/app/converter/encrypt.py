@@ -0,0 +1,143 @@
+import asyncio
+import io
+import secrets
+import threading
+from concurrent.futures import CancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Optional
+
+from app.converter.errors import ConversionError
+
+# 每次交给响应的数据块大小，以及最多缓冲的块数（加密输出占用的内存上限约为二者之积）
+CHUNK_SIZE = 64 * 1024
+MAX_PENDING_CHUNKS = 16
+
+# 输出结束标记
+_END = object()
+
+
+class _ChunkWriter(io.RawIOBase):
+    """qpdf的输出流
+
+    写入的数据攒成固定大小的块，放入事件循环中的有界队列，由响应协程取走发送；
+    队列满时写入线程阻塞，加密速度跟随客户端的接收速度。响应中止后写入立即失败，qpdf随之停止。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.chunks: asyncio.Queue[Any] = asyncio.Queue(MAX_PENDING_CHUNKS)
+        self.aborted = threading.Event()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self._buffer += data
+        while len(self._buffer) >= CHUNK_SIZE:
+            self._put(bytes(self._buffer[:CHUNK_SIZE]))
+            del self._buffer[:CHUNK_SIZE]
+        return len(data)
+
+    def _put(self, item: Any) -> None:
+        future = asyncio.run_coroutine_threadsafe(self.chunks.put(item), self.loop)
+        while True:
+            if self.aborted.is_set():
+                future.cancel()
+                raise BrokenPipeError("响应已中止")
+            try:
+                future.result(timeout=0.5)
+                return
+            except FutureTimeoutError:
+                continue
+            except CancelledError as e:
+                raise BrokenPipeError("响应已中止") from e
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """写入剩余数据和结束标记；出错时把异常交给响应协程"""
+        if error is None and self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        self._put(error if error is not None else _END)
+
+
+def _write_encrypted(
+    path: str,
+    writer: _ChunkWriter,
+    user_password: str,
+    owner_password: str,
+    allow_print: bool,
+    allow_copy: bool
+) -> None:
+    """读取PDF并以AES-256加密写出（在独立线程中执行）
+
+    qpdf逐个对象读取、加密并写出，数据流按需从文件读取，不会把整个文档读入内存；
+    原文件已线性化时输出同样线性化。
+    """
+    import pikepdf
+
+    try:
+        with pikepdf.open(path) as pdf:
+            permissions = pikepdf.Permissions(
+                extract=allow_copy,
+                print_lowres=allow_print,
+                print_highres=allow_print,
+            )
+            pdf.save(
+                writer,
+                encryption=pikepdf.Encryption(
+                    owner=owner_password, user=user_password, R=6, allow=permissions
+                ),
+                linearize=pdf.is_linearized,
+            )
+        writer.finish()
+    except BrokenPipeError:
+        pass
+    except BaseException as e:
+        if writer.aborted.is_set():
+            return
+        try:
+            writer.finish(e)
+        except BrokenPipeError:
+            pass
+
+
+async def encrypt_pdf_stream(
+    path: str,
+    user_password: str,
+    owner_password: Optional[str] = None,
+    allow_print: bool = True,
+    allow_copy: bool = True
+) -> AsyncIterator[bytes]:
+    """边加密边输出缓存中的PDF
+
+    加密在后台线程中进行，按块产出密文，不在内存中保留完整文档，也不写第二份文件；
+    每次调用使用新的随机密钥材料，相同密码两次加密的结果也不同。
+    未指定所有者密码时使用随机密码，打开者无法解除权限限制。
+    """
+    writer = _ChunkWriter(asyncio.get_running_loop())
+    thread = threading.Thread(
+        target=_write_encrypted,
+        args=(
+            path,
+            writer,
+            user_password,
+            owner_password or secrets.token_urlsafe(24),
+            allow_print,
+            allow_copy,
+        ),
+        name="pdf-encrypt",
+        daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            item = await writer.chunks.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise ConversionError(f"PDF加密失败: {item}") from item
+            yield item
+    finally:
+        # 客户端断开或出错时通知加密线程停止
+        writer.aborted.set()
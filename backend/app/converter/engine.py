@@ -0,0 +1,401 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import psutil
+
+from app.config import settings
+from app.converter.assets import Asset
+from app.converter.diagrams import embed_diagrams
+from app.converter.errors import ConversionError
+from app.converter.fonts import font_subset_cache, install_font_subset_cache
+from app.converter.highlight import highlight_cache
+from app.converter.optimize import OptimizeResult, optimize_pdf
+from app.converter.options import PdfOptions, WatermarkOptions
+from app.converter.parser import block_cache, html_cache, render_document_html
+from app.converter.renderer import build_document_html, html_to_pdf
+from app.converter.sections import (
+    group_sections,
+    link_across_sections,
+    merge_section_pdfs,
+    page_number_html,
+)
+from app.converter.templates import pdf_templates
+from app.converter.watermark import render_watermark_to_file, stamp_watermark
+
+# 引擎版本号，渲染结果发生变化时需要递增
+ENGINE_VERSION = "3"
+
+
+def render_document(
+    content: str,
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str] = None,
+    assets: Optional[Dict[str, Asset]] = None
+) -> bytes:
+    """渲染Markdown文档为PDF（在转换进程中执行），assets 为已预取到本地的图片和图表"""
+    body = render_document_html(content)
+    if assets:
+        body = embed_diagrams(body, assets)
+    html = build_document_html(body, title, options)
+    return html_to_pdf(html, template_name, assets)
+
+
+def render_document_to_file(
+    path: str,
+    content: str,
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str] = None,
+    assets: Optional[Dict[str, Asset]] = None
+) -> int:
+    """渲染PDF并直接写入文件，避免在进程间传递大块字节，返回文件大小"""
+    pdf = render_document(content, title, options, template_name, assets)
+    with open(path, "wb") as f:
+        f.write(pdf)
+    return len(pdf)
+
+
+def render_section_to_file(
+    path: str,
+    body: str,
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str] = None,
+    assets: Optional[Dict[str, Asset]] = None
+) -> int:
+    """渲染文档HTML中的一段并写入文件（分段并行渲染时在各转换进程中执行）"""
+    if assets:
+        body = embed_diagrams(body, assets)
+    html = build_document_html(link_across_sections(body), title, options)
+    pdf = html_to_pdf(html, template_name, assets)
+    with open(path, "wb") as f:
+        f.write(pdf)
+    return len(pdf)
+
+
+def merge_sections_to_file(
+    path: str,
+    part_paths: List[str],
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str] = None
+) -> int:
+    """合并各段PDF并补上连续页码，返回文件大小"""
+    def page_numbers(pages: int) -> bytes:
+        html = build_document_html(page_number_html(pages), title, options)
+        return html_to_pdf(html, template_name)
+
+    return merge_section_pdfs(
+        path, part_paths, page_numbers if options.page_numbers else None, title
+    )
+
+
+def render_html(content: str) -> str:
+    """渲染文档HTML（在转换进程中执行）"""
+    return render_document_html(content)
+
+
+def collect_cache_stats() -> Dict[str, Dict[str, int]]:
+    """当前进程各渲染缓存的命中统计"""
+    return {
+        "block": block_cache.stats(),
+        "html": html_cache.stats(),
+        "highlight": highlight_cache.stats(),
+        "font": font_subset_cache.stats(),
+    }
+
+
+def _init_worker() -> None:
+    """转换进程初始化：预先导入渲染库并加载模板，避免首个任务承担这些开销"""
+    try:
+        pdf_templates.load(parse_stylesheets=True)
+        install_font_subset_cache(font_subset_cache)
+    except (ImportError, OSError):
+        # 渲染依赖缺失时在实际渲染时再报错
+        pass
+
+
+def _worker_pid() -> int:
+    """返回转换进程的PID（用于预热进程并记录PID）"""
+    return os.getpid()
+
+
+class RendererProcess:
+    """常驻的渲染进程
+
+    每个实例是一个单进程的执行器，启动时完成初始化（导入渲染库、加载模板），
+    之后被多个任务复用；记录已执行的任务数，供引擎判断是否需要回收。
+    """
+
+    def __init__(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self.jobs = 0
+        self.broken = False
+        # 提交一个空任务，使进程立即启动并完成初始化
+        self._pid_future = self.executor.submit(_worker_pid)
+
+    @property
+    def pid(self) -> Optional[int]:
+        if not self._pid_future.done() or self._pid_future.exception() is not None:
+            return None
+        return self._pid_future.result()
+
+    def memory_usage(self) -> int:
+        """进程常驻内存（字节），无法获取时返回0"""
+        pid = self.pid
+        if pid is None:
+            return 0
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+
+    def shutdown(self, kill: bool = False) -> None:
+        """关闭进程；kill 为真时直接结束进程（用于超时或卡死的任务）"""
+        pid = self.pid
+        if kill and pid is not None:
+            try:
+                psutil.Process(pid).kill()
+            except psutil.Error:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ConversionEngine:
+    """PDF转换引擎
+
+    维护一组预热好的常驻渲染进程，每个任务借出一个进程执行，完成后归还；
+    CPU密集的渲染工作不会阻塞事件循环，空闲进程不足时请求在事件循环中异步等待。
+    进程执行 max_jobs_per_worker 个任务或内存超过 max_worker_memory 后被回收，
+    并立即启动新的进程替换，避免渲染库的内存增长和碎片长期累积。
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        timeout: float,
+        max_jobs_per_worker: int = 0,
+        max_worker_memory: int = 0
+    ):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_memory = max_worker_memory
+        self.recycled = 0
+        self._idle: Optional[asyncio.Queue[RendererProcess]] = None
+        self._workers: Set[RendererProcess] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._idle is not None
+
+    def start(self) -> None:
+        """启动并预热渲染进程"""
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.max_workers):
+            self._idle.put_nowait(self._spawn())
+
+    def shutdown(self) -> None:
+        """关闭全部渲染进程"""
+        if self._idle is None:
+            return
+        for worker in self._workers:
+            worker.shutdown()
+        self._workers.clear()
+        self._idle = None
+
+    def _spawn(self) -> RendererProcess:
+        worker = RendererProcess()
+        self._workers.add(worker)
+        return worker
+
+    def _should_recycle(self, worker: RendererProcess) -> bool:
+        if worker.broken:
+            return True
+        if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+            return True
+        if self.max_worker_memory and worker.memory_usage() > self.max_worker_memory:
+            return True
+        return False
+
+    def _release(self, worker: RendererProcess) -> None:
+        """归还渲染进程，达到回收条件时用新进程替换"""
+        if self._idle is None or worker not in self._workers:
+            # 引擎已关闭
+            worker.shutdown(kill=worker.broken)
+            return
+        if self._should_recycle(worker):
+            self._workers.discard(worker)
+            worker.shutdown(kill=worker.broken)
+            worker = self._spawn()
+            self.recycled += 1
+        self._idle.put_nowait(worker)
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """借出一个渲染进程执行渲染函数"""
+        if self._idle is None:
+            self.start()
+
+        worker = await self._idle.get()
+        try:
+            future = asyncio.wrap_future(worker.executor.submit(func, *args))
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError as e:
+            # 超时的任务仍在进程中运行，直接结束该进程
+            worker.broken = True
+            raise ConversionError("PDF转换超时") from e
+        except BrokenProcessPool as e:
+            # 转换进程异常退出，归还时替换为新进程
+            worker.broken = True
+            raise ConversionError("PDF转换进程异常退出") from e
+        except ConversionError:
+            raise
+        except Exception as e:
+            raise ConversionError(f"PDF转换失败: {e}") from e
+        finally:
+            worker.jobs += 1
+            self._release(worker)
+
+    async def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """汇总各渲染进程的缓存命中统计（进程被回收后其计数随之清零）"""
+        futures = []
+        for worker in list(self._workers):
+            try:
+                futures.append(asyncio.wrap_future(worker.executor.submit(collect_cache_stats)))
+            except (RuntimeError, BrokenProcessPool):
+                # 进程正在被回收
+                continue
+        if not futures:
+            return {}
+
+        # 正在执行长任务的进程不等待
+        done, pending = await asyncio.wait(futures, timeout=1)
+        for future in pending:
+            future.cancel()
+
+        total: Dict[str, Dict[str, int]] = {}
+        for future in done:
+            if future.exception() is not None:
+                continue
+            for name, stats in future.result().items():
+                bucket = total.setdefault(name, {})
+                for field, value in stats.items():
+                    bucket[field] = bucket.get(field, 0) + value
+        return total
+
+    async def render_html(self, content: str) -> str:
+        """渲染清洗后的文档HTML"""
+        return await self._run(render_html, content)
+
+    async def convert(
+        self,
+        content: str,
+        title: str,
+        options: PdfOptions,
+        template_name: Optional[str] = None,
+        assets: Optional[Dict[str, Asset]] = None
+    ) -> bytes:
+        """将Markdown文档转换为PDF字节"""
+        return await self._run(render_document, content, title, options, template_name, assets)
+
+    async def convert_to_file(
+        self,
+        path: str,
+        content: str,
+        title: str,
+        options: PdfOptions,
+        template_name: Optional[str] = None,
+        assets: Optional[Dict[str, Asset]] = None
+    ) -> int:
+        """将Markdown文档转换为PDF并写入指定文件，返回文件大小"""
+        return await self._run(
+            render_document_to_file, path, content, title, options, template_name, assets
+        )
+
+    async def convert_sections_to_file(
+        self,
+        path: str,
+        sections: List[str],
+        title: str,
+        options: PdfOptions,
+        template_name: Optional[str] = None,
+        assets: Optional[Dict[str, Asset]] = None
+    ) -> int:
+        """分段并行渲染长文档并写入指定文件，返回文件大小
+
+        相邻分段按大小合并为不超过进程数的几组，分别交给不同的渲染进程，
+        全部完成后合并为一个PDF：书签随各段一并合并，跨段的目录和脚注链接改为文档内跳转，
+        页码在合并后统一叠加。每组单独计算超时。
+        """
+        groups = group_sections(sections, self.max_workers)
+        part_options = options.model_copy(update={"page_numbers": False})
+        directory = os.path.dirname(path) or "."
+        part_paths = []
+        for _ in groups:
+            fd, part_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+            os.close(fd)
+            part_paths.append(part_path)
+
+        try:
+            # 等待全部分段结束后再清理临时文件，避免仍在渲染的进程写入已删除的文件
+            results = await asyncio.gather(
+                *(
+                    self._run(
+                        render_section_to_file, part_path, group, title, part_options,
+                        template_name, assets
+                    )
+                    for part_path, group in zip(part_paths, groups)
+                ),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            return await self._run(
+                merge_sections_to_file, path, part_paths, title, options, template_name
+            )
+        finally:
+            for part_path in part_paths:
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+
+    async def optimize_file(self, path: str) -> OptimizeResult:
+        """优化已渲染的PDF文件（原地替换），返回优化前后的大小"""
+        return await self._run(optimize_pdf, path)
+
+    async def render_watermark(self, path: str, watermark: WatermarkOptions, options: PdfOptions) -> int:
+        """渲染单页水印PDF并写入指定文件"""
+        return await self._run(render_watermark_to_file, path, watermark, options)
+
+    async def stamp_watermark(
+        self,
+        base_path: str,
+        watermark_path: str,
+        output_path: str,
+        optimize: bool = False
+    ) -> int:
+        """将水印叠加到已渲染的PDF上，写入指定文件"""
+        return await self._run(stamp_watermark, base_path, watermark_path, output_path, optimize)
+
+
+# 全局转换引擎实例
+conversion_engine = ConversionEngine(
+    max_workers=settings.conversion_workers,
+    timeout=settings.conversion_timeout,
+    max_jobs_per_worker=settings.conversion_max_jobs_per_worker,
+    max_worker_memory=settings.conversion_max_worker_memory,
+)
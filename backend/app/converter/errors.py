@@ -0,0 +1,6 @@
+class ConversionError(Exception):
+    """PDF转换失败"""
+
+
+class InvalidPdfSettingsError(ConversionError):
+    """PDF设置无效"""
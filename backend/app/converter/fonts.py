@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from app.config import settings
+from app.converter.cache import PdfCache
+
+logger = logging.getLogger(__name__)
+
+FONT_SUFFIX = ".font"
+
+
+class FontSubsetCache:
+    """嵌入字体缓存
+
+    WeasyPrint 只嵌入文档实际用到的字形（字体子集），但每次渲染都要对完整字体重新做一次子集化，
+    中文字体动辄十几MB，这一步很耗时。这里按（字体文件, 字形集合哈希）缓存子集化结果：
+    进程内按字节预算做LRU，同时写入磁盘供其他转换进程和重启后复用。
+    表情符号等回退字体同样经过这一步，一并缓存。
+    """
+
+    def __init__(self, store: PdfCache, memory_bytes: int):
+        self.store = store
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_total = 0
+        # 原始字体文件的摘要，同一进程内每个字体只计算一次
+        self._digests: Dict[Tuple[str, int], str] = {}
+        self._lock = threading.Lock()
+
+    def font_digest(self, font: Any) -> str:
+        """原始字体文件的摘要"""
+        identity = (font.hash, len(font.file_content))
+        digest = self._digests.get(identity)
+        if digest is None:
+            digest = self._digests[identity] = hashlib.sha256(font.file_content).hexdigest()
+        return digest
+
+    def make_key(self, font: Any, to_unicode: Mapping[int, Any], hinting: bool) -> str:
+        """根据字体与使用到的字形计算缓存键"""
+        digest = hashlib.sha256()
+        digest.update(self.font_digest(font).encode("ascii"))
+        digest.update(f"\0{font.index}\0{int(bool(hinting))}\0{int(bool(font.missing))}\0".encode("ascii"))
+        if "fvar" in font.tables:
+            # 可变字体会按字重、字号等实例化为静态字体
+            variations = sorted(font.variations.items())
+            digest.update(repr((variations, font.weight, font.style, font.font_size)).encode("ascii"))
+        digest.update(b"\0")
+        digest.update(",".join(str(gid) for gid in sorted(to_unicode)).encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = None
+        path = self.store.get(key)
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # 被其他进程淘汰
+                data = None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._remember(key, data)
+        try:
+            self.store.put(key, data)
+        except OSError as e:
+            logger.warning("写入字体缓存失败: %s", e)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if key in self._memory:
+            self._memory_total -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_total += len(data)
+        while self._memory_total > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_total -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_total,
+        }
+
+
+def install_font_subset_cache(cache: "FontSubsetCache") -> bool:
+    """让WeasyPrint的字体清理步骤（子集化、可变字体实例化、移除彩色字形）走缓存
+
+    在转换进程初始化时调用；WeasyPrint内部接口不符合预期时保持原样并返回False。
+    """
+    try:
+        from weasyprint.pdf.fonts import Font
+    except (ImportError, OSError):
+        return False
+
+    original_clean = getattr(Font, "clean", None)
+    if original_clean is None:
+        logger.warning("当前WeasyPrint版本不支持字体子集缓存")
+        return False
+    if getattr(original_clean, "_subset_cache", None) is cache:
+        return True
+    original_clean = getattr(original_clean, "__wrapped__", original_clean)
+
+    def clean(font: Any, to_unicode: Mapping[int, Any], hinting: bool) -> None:
+        if not to_unicode:
+            # 表单中使用的字体需要完整嵌入
+            return original_clean(font, to_unicode, hinting)
+        key = cache.make_key(font, to_unicode, hinting)
+        data = cache.get(key)
+        if data is not None:
+            font.file_content = data
+            return None
+        original_clean(font, to_unicode, hinting)
+        cache.put(key, font.file_content)
+        return None
+
+    clean.__wrapped__ = original_clean
+    clean._subset_cache = cache
+    Font.clean = clean
+    return True
+
+
+# 全局字体子集缓存（各转换进程各自维护内存部分，磁盘部分共享）
+font_subset_cache = FontSubsetCache(
+    PdfCache(settings.font_cache_dir, settings.font_cache_max_bytes, suffix=FONT_SUFFIX),
+    settings.font_cache_memory_bytes,
+)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少条检查一次磁盘条目上限
+_PRUNE_INTERVAL = 1000
+# 读取时的最近使用时间先在内存中累计，攒够这么多条或超过这么久（秒）才写入一次
+_TOUCH_BATCH = 200
+_TOUCH_INTERVAL = 60
+
+
+class FragmentStore:
+    """渲染片段的持久化存储（SQLite）
+
+    多个转换进程共享同一个数据库文件，任一进程渲染过的片段其他进程都可以复用。
+    数据库不可用时只记录日志，调用方退化为仅使用内存缓存。
+    最近使用时间只用于淘汰排序，读取时不单独提交写事务，而是攒批后与写入一同提交。
+    所有方法都是同步的，在事件循环中应通过 FragmentCache.aget/aput 调用。
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self._touched: Dict[str, int] = {}
+        self._touched_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        # 进程fork后不能复用父进程的连接
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fragments ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_fragments_last_used ON fragments (last_used)"
+            )
+        except sqlite3.Error as e:
+            logger.warning("片段缓存数据库不可用: %s", e)
+            return None
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT value FROM fragments WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._touched[key] = int(time.time())
+                    if (
+                        len(self._touched) >= _TOUCH_BATCH
+                        or time.monotonic() - self._touched_at >= _TOUCH_INTERVAL
+                    ):
+                        self._flush_touched(conn)
+                        conn.commit()
+            except sqlite3.Error as e:
+                logger.warning("读取片段缓存失败: %s", e)
+                return None
+            return row[0] if row is not None else None
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO fragments (key, value, last_used) VALUES (?, ?, ?)",
+                    (key, value, int(time.time())),
+                )
+                self._writes += 1
+                self._flush_touched(conn)
+                if self._writes % _PRUNE_INTERVAL == 0:
+                    self._prune(conn)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning("写入片段缓存失败: %s", e)
+
+    def _flush_touched(self, conn: sqlite3.Connection) -> None:
+        """写入累计的最近使用时间（由调用方提交）"""
+        if self._touched:
+            conn.executemany(
+                "UPDATE fragments SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_at = time.monotonic()
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """删除最久未使用的条目，使总数不超过上限"""
+        (count,) = conn.execute("SELECT COUNT(*) FROM fragments").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM fragments WHERE key IN "
+                "(SELECT key FROM fragments ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+class FragmentCache:
+    """两级片段缓存：进程内LRU + 共享的持久化存储
+
+    键为调用方计算好的内容哈希，不同用途通过命名空间区分。
+    """
+
+    def __init__(self, namespace: str, store: FragmentStore, memory_entries: int):
+        self.namespace = namespace
+        self.store = store
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get_memory(key)
+        if value is None:
+            value = self._loaded(key, self.store.get(f"{self.namespace}:{key}"))
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        """在事件循环中读取：内存未命中时在线程中查询持久化存储，不阻塞事件循环"""
+        value = self._get_memory(key)
+        if value is None:
+            value = self._loaded(key, await asyncio.to_thread(self.store.get, f"{self.namespace}:{key}"))
+        return value
+
+    def put(self, key: str, value: str, persist: bool = True) -> None:
+        """写入缓存；persist=False 时只写入进程内存（例如已由其他进程持久化）"""
+        with self._lock:
+            self._remember(key, value)
+        if persist:
+            self.store.put(f"{self.namespace}:{key}", value)
+
+    async def aput(self, key: str, value: str) -> None:
+        """在事件循环中写入：持久化存储的写入在线程中执行"""
+        with self._lock:
+            self._remember(key, value)
+        await asyncio.to_thread(self.store.put, f"{self.namespace}:{key}", value)
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _loaded(self, key: str, value: Optional[str]) -> Optional[str]:
+        """记录从持久化存储读取的结果"""
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key: str, value: str) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+
+# 全局片段存储（各转换进程各自打开连接）
+fragment_store = FragmentStore(settings.fragment_cache_path, settings.fragment_cache_max_entries)
@@ -0,0 +1,66 @@
+import hashlib
+import html as html_lib
+import re
+from typing import Optional
+
+import pygments
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from app.config import settings
+from app.converter.fragments import FragmentCache, fragment_store
+
+# 高亮输出格式版本号，输出结构变化时需要递增，使已缓存的结果失效
+HIGHLIGHT_VERSION = "1"
+CSS_CLASS = "codehilite"
+
+# fenced_code 扩展输出的带语言标记的代码块
+_CODE_BLOCK_RE = re.compile(r'<pre><code class="language-([\w+#.-]+)">(.*?)</code></pre>', re.S)
+
+# 高亮结果只包含token的class，配色由样式表决定，因此同一段代码在各主题间共用
+highlight_cache = FragmentCache("highlight", fragment_store, settings.fragment_memory_entries)
+
+_formatter = HtmlFormatter(nowrap=True)
+
+
+def highlight_key(language: str, code: str) -> str:
+    """高亮结果的缓存键：（语言, 代码哈希, 输出格式）"""
+    digest = hashlib.sha256(
+        f"{HIGHLIGHT_VERSION}\0{pygments.__version__}\0{language}\0".encode()
+    )
+    digest.update(code.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def highlight_code(language: str, code: str) -> Optional[str]:
+    """高亮一段代码，结果按内容哈希缓存；不支持的语言返回None"""
+    key = highlight_key(language, code)
+    html = highlight_cache.get(key)
+    if html is not None:
+        return html
+    try:
+        lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        return None
+    html = highlight(code, lexer, _formatter)
+    highlight_cache.put(key, html)
+    return html
+
+
+def highlight_code_blocks(html: str) -> str:
+    """为HTML中标注了语言的代码块添加语法高亮"""
+    def replace(match: "re.Match[str]") -> str:
+        language = match.group(1).lower()
+        highlighted = highlight_code(language, html_lib.unescape(match.group(2)))
+        if highlighted is None:
+            return match.group(0)
+        return f'<pre class="{CSS_CLASS}"><code class="language-{match.group(1)}">{highlighted}</code></pre>'
+
+    return _CODE_BLOCK_RE.sub(replace, html)
+
+
+def theme_stylesheet(theme: str) -> str:
+    """高亮主题的样式表"""
+    return "\n".join(HtmlFormatter(style=theme).get_token_style_defs(f".{CSS_CLASS}"))
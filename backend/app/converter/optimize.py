@@ -0,0 +1,122 @@
+import hashlib
+import os
+from typing import Any, Dict, NamedTuple, Set, Tuple
+
+# 去重时比较的流类型：图片与嵌入字体文件
+_FONT_FILE_KEYS = ("/FontFile", "/FontFile2", "/FontFile3")
+
+
+class OptimizeResult(NamedTuple):
+    """PDF优化前后的文件大小（字节）"""
+    original_size: int
+    size: int
+
+
+def _stream_digest(stream: Any) -> str:
+    """流的内容摘要：原始数据 + 除 /Length 外的字典项"""
+    import pikepdf
+
+    stream_dict = pikepdf.Dictionary(stream.stream_dict)
+    if "/Length" in stream_dict:
+        del stream_dict["/Length"]
+    digest = hashlib.sha256(stream_dict.unparse())
+    digest.update(b"\0")
+    digest.update(stream.read_raw_bytes())
+    return digest.hexdigest()
+
+
+def _font_file_ids(pdf: Any) -> Set[Tuple[int, int]]:
+    """全部嵌入字体文件流的对象编号"""
+    import pikepdf
+
+    ids = set()
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Dictionary) or obj.get("/Type") != "/FontDescriptor":
+            continue
+        for key in _FONT_FILE_KEYS:
+            font_file = obj.get(key)
+            if font_file is not None and font_file.is_indirect:
+                ids.add(font_file.objgen)
+    return ids
+
+
+def _redirect(obj: Any, mapping: Dict[Tuple[int, int], Any]) -> None:
+    """将对象中指向重复流的引用改为指向保留的那一份"""
+    import pikepdf
+
+    if isinstance(obj, pikepdf.Stream):
+        obj = obj.stream_dict
+    if isinstance(obj, pikepdf.Dictionary):
+        items = [(key, obj[key]) for key in obj.keys()]
+    elif isinstance(obj, pikepdf.Array):
+        items = list(enumerate(obj))
+    else:
+        return
+    for key, value in items:
+        if not isinstance(value, pikepdf.Object):
+            # 数字、布尔值等已转换为Python类型
+            continue
+        if value.is_indirect:
+            if value.objgen in mapping:
+                obj[key] = mapping[value.objgen]
+        elif isinstance(value, (pikepdf.Dictionary, pikepdf.Array)):
+            _redirect(value, mapping)
+
+
+def dedupe_streams(pdf: Any) -> int:
+    """合并内容完全相同的图片和字体文件，返回去掉的对象数
+
+    图片的软蒙版（/SMask）本身也是图片，先合并蒙版后其所属图片才可能相同，因此重复到不再有变化为止。
+    """
+    import pikepdf
+
+    # 已被合并的对象仍留在文件对象表中（保存时才丢弃），之后不再参与比较
+    merged: Set[Tuple[int, int]] = set()
+    while True:
+        font_files = _font_file_ids(pdf)
+        canonical: Dict[str, Any] = {}
+        mapping: Dict[Tuple[int, int], Any] = {}
+        for obj in pdf.objects:
+            if not isinstance(obj, pikepdf.Stream) or obj.objgen in merged:
+                continue
+            if obj.stream_dict.get("/Subtype") != "/Image" and obj.objgen not in font_files:
+                continue
+            digest = _stream_digest(obj)
+            first = canonical.setdefault(digest, obj)
+            if first.objgen != obj.objgen:
+                mapping[obj.objgen] = first
+        if not mapping:
+            return len(merged)
+        for obj in pdf.objects:
+            _redirect(obj, mapping)
+        merged.update(mapping)
+
+
+def optimize_pdf(path: str) -> OptimizeResult:
+    """优化PDF文件（原地替换）
+
+    合并重复的图片和字体，移除页面未使用的资源，将对象打包进压缩的对象流，
+    重新以最高压缩级别压缩数据流，并线性化（Fast Web View），阅读器下载完首页即可显示。
+    """
+    import pikepdf
+
+    original_size = os.path.getsize(path)
+    tmp_path = path + ".opt"
+    pikepdf.settings.set_flate_compression_level(9)
+    try:
+        with pikepdf.open(path) as pdf:
+            dedupe_streams(pdf)
+            pdf.remove_unreferenced_resources()
+            pdf.save(
+                tmp_path,
+                compress_streams=True,
+                recompress_flate=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=True,
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return OptimizeResult(original_size, os.path.getsize(path))
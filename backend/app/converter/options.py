@@ -0,0 +1,130 @@
+import json
+import re
+from typing import Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from app.converter.errors import InvalidPdfSettingsError
+
+# 支持的纸张尺寸（CSS @page size 关键字）
+PAGE_SIZES = ("A3", "A4", "A5", "B4", "B5", "Letter", "Legal")
+
+# 纸张纵向宽高（毫米）
+PAGE_DIMENSIONS_MM = {
+    "A3": (297.0, 420.0),
+    "A4": (210.0, 297.0),
+    "A5": (148.0, 210.0),
+    "B4": (250.0, 353.0),
+    "B5": (176.0, 250.0),
+    "Letter": (215.9, 279.4),
+    "Legal": (215.9, 355.6),
+}
+
+# CSS长度，例如 20mm、1.5cm、12pt
+_LENGTH = r"\d+(\.\d+)?(mm|cm|in|pt|px)"
+_LENGTH_RE = re.compile(rf"^{_LENGTH}$")
+_MARGIN_RE = re.compile(rf"^{_LENGTH}( {_LENGTH}){{0,3}}$")
+_COLOR_RE = re.compile(r"^#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+
+
+class WatermarkOptions(BaseModel):
+    """文字水印设置"""
+    text: str = Field(..., min_length=1, max_length=100)
+    font_size: str = "48pt"
+    color: str = "#888888"
+    opacity: float = Field(0.15, gt=0, le=1.0)
+    angle: float = Field(-30, ge=-90, le=90)
+
+    class Config:
+        extra = "ignore"
+
+    @field_validator("text")
+    @classmethod
+    def check_text(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError("水印文字不能为空")
+        return value
+
+    @field_validator("font_size")
+    @classmethod
+    def check_font_size(cls, value: str) -> str:
+        if not _LENGTH_RE.match(value.strip()):
+            raise ValueError(f"无效的水印字号: {value}")
+        return value.strip()
+
+    @field_validator("color")
+    @classmethod
+    def check_color(cls, value: str) -> str:
+        if not _COLOR_RE.match(value.strip()):
+            raise ValueError(f"无效的水印颜色: {value}")
+        return value.strip().lower()
+
+
+class PdfOptions(BaseModel):
+    """PDF输出设置（MarkdownDocument.pdf_settings 中的JSON）"""
+    page_size: str = "A4"
+    orientation: Literal["portrait", "landscape"] = "portrait"
+    margin: str = "20mm"
+    font_size: str = "12pt"
+    line_height: float = Field(1.6, ge=1.0, le=3.0)
+    page_numbers: bool = True
+    # 面向分享的体积优化：合并重复图片与字体、压缩对象流、线性化
+    optimize: bool = False
+    # 水印在渲染后单独叠加，不参与文档渲染
+    watermark: Optional[WatermarkOptions] = None
+
+    class Config:
+        extra = "ignore"
+
+    def render_options(self) -> dict:
+        """影响文档渲染的设置（不含水印），用于计算渲染结果的缓存键"""
+        return self.model_dump(exclude={"watermark"})
+
+    def page_dimensions_mm(self) -> Tuple[float, float]:
+        """纸张宽高（毫米），已按方向调整"""
+        width, height = PAGE_DIMENSIONS_MM[self.page_size]
+        if self.orientation == "landscape":
+            return height, width
+        return width, height
+
+    @field_validator("page_size")
+    @classmethod
+    def check_page_size(cls, value: str) -> str:
+        for size in PAGE_SIZES:
+            if value.lower() == size.lower():
+                return size
+        raise ValueError(f"不支持的纸张尺寸: {value}")
+
+    @field_validator("margin")
+    @classmethod
+    def check_margin(cls, value: str) -> str:
+        if not _MARGIN_RE.match(value.strip()):
+            raise ValueError(f"无效的页边距: {value}")
+        return value.strip()
+
+    @field_validator("font_size")
+    @classmethod
+    def check_font_size(cls, value: str) -> str:
+        if not _LENGTH_RE.match(value.strip()):
+            raise ValueError(f"无效的字号: {value}")
+        return value.strip()
+
+
+def parse_pdf_settings(raw: Optional[str]) -> PdfOptions:
+    """解析文档的 pdf_settings JSON 字符串"""
+    if not raw:
+        return PdfOptions()
+
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise InvalidPdfSettingsError(f"PDF设置不是有效的JSON: {e}") from e
+
+    if not isinstance(data, dict):
+        raise InvalidPdfSettingsError("PDF设置必须是JSON对象")
+
+    try:
+        return PdfOptions(**data)
+    except ValidationError as e:
+        raise InvalidPdfSettingsError(f"PDF设置无效: {e.errors()[0]['msg']}") from e
@@ -0,0 +1,217 @@
+import hashlib
+import re
+import threading
+from typing import List, Optional
+
+import markdown
+from markdown.extensions.toc import unique
+from markdown.postprocessors import Postprocessor
+
+from app.config import settings
+from app.converter.fragments import FragmentCache, fragment_store
+from app.converter.highlight import highlight_code_blocks
+from app.converter.sanitize import SANITIZER_VERSION, sanitize_html
+
+# Markdown扩展：表格、脚注、围栏代码块、目录锚点等
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "toc"]
+
+# 解析器版本号，扩展或渲染方式变化时需要递增，使已缓存的片段失效
+PARSER_VERSION = "4"
+
+_FENCE_RE = re.compile(r"^(`{3,}|~{3,})")
+_LIST_RE = re.compile(r"^ {0,3}([*+-]|\d+[.)])\s")
+_QUOTE_RE = re.compile(r"^ {0,3}>")
+_HTML_RE = re.compile(r"^ {0,3}<([a-zA-Z][a-zA-Z0-9-]*)")
+_COMMENT_RE = re.compile(r"^ {0,3}<!--")
+# 定义列表的定义行（与def_list扩展的规则一致），可以接在空行之后的术语上
+_DEFINITION_RE = re.compile(r"^ {0,3}: {1,3}")
+_VOID_TAGS = {"area", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+# 引用式链接定义、脚注、缩写和 [TOC] 作用于全文，出现时整篇渲染
+_GLOBAL_RE = re.compile(r"^ {0,3}(\[[^\]]+\]:|\*\[[^\]]+\]:|\[TOC\])|\[\^[^\]]+\]", re.M)
+# 标题锚点（toc扩展生成的 <hN id="...">），其他元素的id保持原样
+_HEADING_ID_RE = re.compile(r'(<h[1-6]\b[^>]*?\sid=")([^"]*)(")')
+
+# 按块哈希缓存渲染结果
+block_cache = FragmentCache("block", fragment_store, settings.fragment_memory_entries)
+# 按文档内容哈希缓存清洗后的完整HTML（单条可能很大，内存中只保留少量）
+html_cache = FragmentCache("html", fragment_store, settings.html_cache_memory_entries)
+
+# Markdown实例创建开销较大且不是线程安全的，每个线程复用一个
+_local = threading.local()
+
+
+class _TrailingNewline(Postprocessor):
+    """记录输出末尾是否有换行
+
+    原样保留的HTML块之后带有一个换行，Markdown.convert 会去掉整篇末尾的空白；
+    逐块渲染时需要知道被去掉的换行，拼接结果才能与整篇渲染一致。
+    """
+
+    def run(self, text: str) -> str:
+        self.md.trailing_newline = text.endswith("\n")
+        return text
+
+
+def get_markdown() -> markdown.Markdown:
+    """获取当前线程的Markdown实例（已重置）"""
+    md = getattr(_local, "md", None)
+    if md is None:
+        md = _local.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, output_format="html")
+        # 优先级最低，在其他后处理之后执行
+        md.postprocessors.register(_TrailingNewline(md), "trailing_newline", 0)
+    md.reset()
+    md.trailing_newline = False
+    return md
+
+
+def _block_kind(line: str) -> Optional[str]:
+    """块首行的类型，决定空行之后的内容能否接续到同一块"""
+    if _LIST_RE.match(line):
+        return "list"
+    if _QUOTE_RE.match(line):
+        return "quote"
+    if _COMMENT_RE.match(line):
+        return "comment"
+    if _HTML_RE.match(line):
+        return "html"
+    return None
+
+
+def _html_closed(lines: List[str]) -> bool:
+    """HTML块是否已闭合（块内允许出现空行）"""
+    tag = _HTML_RE.match(lines[0]).group(1).lower()
+    if tag in _VOID_TAGS:
+        return True
+    text = "\n".join(lines).lower()
+    return text.count(f"</{tag}") >= text.count(f"<{tag}")
+
+
+def _comment_closed(lines: List[str]) -> bool:
+    """HTML注释块是否已结束（注释内允许出现空行）"""
+    text = "\n".join(lines)
+    return "-->" in text[text.index("<!--") + 4:]
+
+
+def _has_definition(lines: List[str], start: int) -> bool:
+    """从 start 开始到下一个空行之前的段落中是否有定义行"""
+    for line in lines[start:]:
+        if not line.strip():
+            return False
+        if _DEFINITION_RE.match(line):
+            return True
+    return False
+
+
+def split_blocks(content: str) -> List[str]:
+    """将Markdown按顶层块切分
+
+    块之间以空行分隔；围栏代码块、缩进的接续内容、被空行隔开的同一列表或
+    引用、未闭合的HTML块与注释、定义列表的定义行及其后续条目都保留在同一块中，
+    保证逐块渲染与整篇渲染结果一致。
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    blanks: List[str] = []
+    kind: Optional[str] = None
+    fence: Optional[str] = None
+
+    lines = content.split("\n")
+    last_seen = {line.rstrip(" "): index for index, line in enumerate(lines)}
+    for index, line in enumerate(lines):
+        if fence is not None:
+            current.append(line)
+            if line.rstrip(" ") == fence:
+                fence = None
+            continue
+
+        if not line.strip():
+            if current:
+                blanks.append(line)
+            continue
+
+        if current and blanks:
+            continuation = (
+                line[:1] in (" ", "\t")
+                or (kind == "list" and _LIST_RE.match(line) is not None)
+                or (kind == "quote" and _QUOTE_RE.match(line) is not None)
+                or (kind == "html" and not _html_closed(current))
+                or (kind == "comment" and not _comment_closed(current))
+                # 定义行会与前面的术语段落或定义列表合并成同一个 <dl>
+                or _has_definition(lines, index)
+            )
+            if continuation:
+                current.extend(blanks)
+            else:
+                blocks.append("\n".join(current))
+                current = []
+        blanks = []
+
+        if not current:
+            kind = _block_kind(line)
+        current.append(line)
+
+        # 与fenced_code扩展一致：只有存在相同的结束标记时才算围栏代码块
+        match = _FENCE_RE.match(line)
+        if match and last_seen.get(match.group(1), -1) > index:
+            fence = match.group(1)
+
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _fragment_key(text: str) -> str:
+    digest = hashlib.sha256(f"{PARSER_VERSION}\0".encode())
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _dedupe_ids(html: str) -> str:
+    """逐块渲染后标题锚点可能重复，按toc扩展的规则重新编号（只处理标题）"""
+    ids = set()
+    return _HEADING_ID_RE.sub(lambda m: m.group(1) + unique(m.group(2), ids) + m.group(3), html)
+
+
+def render_fragment(text: str) -> str:
+    """渲染片段，结果按内容哈希缓存"""
+    key = _fragment_key(text)
+    html = block_cache.get(key)
+    if html is None:
+        md = get_markdown()
+        html = highlight_code_blocks(md.convert(text))
+        if md.trailing_newline:
+            html += "\n"
+        block_cache.put(key, html)
+    return html
+
+
+def markdown_to_html(content: str) -> str:
+    """将Markdown文本转换为HTML片段
+
+    内容按顶层块切分并逐块缓存，编辑后只有改动过的块需要重新渲染。
+    """
+    content = content.replace("\r\n", "\n")
+
+    if _GLOBAL_RE.search(content):
+        return render_fragment(content).strip()
+
+    parts = [render_fragment(block) for block in split_blocks(content)]
+    return _dedupe_ids("\n".join(parts).strip())
+
+
+def document_html_key(content: str) -> str:
+    """文档HTML的缓存键，同时作为预览接口的ETag"""
+    digest = hashlib.sha256(f"{PARSER_VERSION}\0{SANITIZER_VERSION}\0".encode())
+    digest.update(content.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def render_document_html(content: str) -> str:
+    """渲染并清洗整篇文档的HTML，预览接口与PDF渲染共用"""
+    key = document_html_key(content)
+    html = html_cache.get(key)
+    if html is None:
+        html = sanitize_html(markdown_to_html(content))
+        html_cache.put(key, html)
+    return html
+
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Optional
+
+from app.converter.assets import Asset
+from app.converter.options import PdfOptions
+from app.converter.templates import pdf_templates
+
+# 网络图片由预取阶段下载到本地，渲染时只允许内联数据，禁止访问网络和读取服务器本地文件
+ALLOWED_PROTOCOLS = ("data",)
+FETCH_TIMEOUT = 10
+
+
+def build_document_html(
+    body: str,
+    title: str,
+    options: PdfOptions,
+) -> str:
+    """将HTML片段套入PDF页面模板（样式表在渲染时以预解析的CSS对象传入）"""
+    return pdf_templates.document_template().render(
+        title=title,
+        body=body,
+        options=options,
+    )
+
+
+def make_url_fetcher(assets: Optional[Dict[str, Asset]] = None) -> Any:
+    """创建WeasyPrint资源加载器：已预取的图片从本地缓存读取"""
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+    class AssetURLFetcher(URLFetcher):
+        def fetch(self, url, headers=None):
+            asset = (assets or {}).get(url)
+            if asset is None:
+                return super().fetch(url, headers)
+            with open(asset.path, "rb") as f:
+                body = f.read()
+            return URLFetcherResponse(url, body, {"Content-Type": asset.media_type})
+
+    return AssetURLFetcher(timeout=FETCH_TIMEOUT, allowed_protocols=ALLOWED_PROTOCOLS)
+
+
+def layout_document(
+    html: str,
+    template_name: Optional[str] = None,
+    assets: Optional[Dict[str, Asset]] = None
+) -> Any:
+    """使用WeasyPrint排版HTML，返回分页后的文档对象（尚未生成PDF）"""
+    from weasyprint import HTML
+
+    template_name = pdf_templates.resolve(template_name)
+    url_fetcher = make_url_fetcher(assets)
+    return HTML(string=html, url_fetcher=url_fetcher).render(
+        font_config=pdf_templates.font_config(),
+        stylesheets=[pdf_templates.parsed_stylesheet(template_name)],
+    )
+
+
+def html_to_pdf(
+    html: str,
+    template_name: Optional[str] = None,
+    assets: Optional[Dict[str, Asset]] = None
+) -> bytes:
+    """使用WeasyPrint将HTML渲染为矢量PDF"""
+    return layout_document(html, template_name, assets).write_pdf()
@@ -0,0 +1,45 @@
+import re
+from typing import Optional
+
+import nh3
+
+# 清洗规则版本号，规则变化时需要递增，使已缓存的HTML失效
+SANITIZER_VERSION = "2"
+
+ALLOWED_TAGS = set(nh3.ALLOWED_TAGS) | {"tfoot"}
+
+ALLOWED_ATTRIBUTES = {tag: set(attrs) for tag, attrs in nh3.ALLOWED_ATTRIBUTES.items()}
+# 标题锚点、脚注、代码高亮依赖 id 和 class
+ALLOWED_ATTRIBUTES["*"] = {"id", "class", "title"}
+ALLOWED_ATTRIBUTES["a"] = ALLOWED_ATTRIBUTES["a"] | {"title"}
+ALLOWED_ATTRIBUTES["img"] = ALLOWED_ATTRIBUTES["img"] | {"title"}
+# 表格扩展通过 style="text-align: ..." 设置对齐方式
+ALLOWED_ATTRIBUTES["th"] = ALLOWED_ATTRIBUTES["th"] | {"style"}
+ALLOWED_ATTRIBUTES["td"] = ALLOWED_ATTRIBUTES["td"] | {"style"}
+
+URL_SCHEMES = {"http", "https", "mailto", "data"}
+# data: 地址只允许出现在图片的 src 中，且必须是图片类型（内嵌的base64图片）
+_URL_ATTRIBUTES = {"href", "src", "cite"}
+_DATA_IMAGE_RE = re.compile(r"^\s*data:image/(png|jpeg|gif|webp|bmp|svg\+xml)[;,]", re.I)
+
+
+def _filter_attribute(element: str, attribute: str, value: str) -> Optional[str]:
+    """移除图片 src 以外的 data: 地址和非图片类型的 data: 地址"""
+    if attribute not in _URL_ATTRIBUTES or value.lstrip()[:5].lower() != "data:":
+        return value
+    if element == "img" and attribute == "src" and _DATA_IMAGE_RE.match(value):
+        return value
+    return None
+
+
+def sanitize_html(html: str) -> str:
+    """清洗渲染后的HTML，移除脚本、事件属性和危险链接"""
+    return nh3.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        clean_content_tags={"script", "style"},
+        attributes=ALLOWED_ATTRIBUTES,
+        url_schemes=URL_SCHEMES,
+        attribute_filter=_filter_attribute,
+        filter_style_properties={"text-align"},
+    )
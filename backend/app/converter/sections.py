@@ -0,0 +1,168 @@
+import io
+import os
+import re
+from html.parser import HTMLParser
+from typing import Any, Callable, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+from app.config import settings
+
+# 切分规则版本号，切分方式变化时需要递增，使分段渲染的PDF缓存失效
+SPLIT_VERSION = "2"
+
+# 指向其他分段锚点的链接在分段渲染时改写为这个前缀，合并后再恢复为文档内跳转
+SECTION_LINK_PREFIX = "section:"
+
+_HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+_ID_RE = re.compile(r'\sid="([^"]*)"')
+_HREF_RE = re.compile(r'(<a\b[^>]*?\shref=")#([^"]*)(")')
+
+
+def should_split(content: str) -> bool:
+    """文档是否使用分段并行渲染"""
+    min_size = settings.section_render_min_size
+    return min_size > 0 and len(content.encode("utf-8")) >= min_size
+
+
+class _TopLevelHeadings(HTMLParser):
+    """找出不在任何元素内的标题，记录（位置, 级别）
+
+    引用、列表、表格或原始HTML容器中的标题不作为切分点，否则切开后各段的标签不再配对。
+    """
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=False)
+        self.headings: List[Tuple[int, int]] = []
+        self._open: List[str] = []
+        self._line_starts = [0] + [match.end() for match in re.finditer("\n", html)]
+        self.feed(html)
+        self.close()
+
+    def handle_starttag(self, tag: str, attrs: Any) -> None:
+        if tag in _VOID_TAGS:
+            return
+        if not self._open and tag in _HEADINGS:
+            line, column = self.getpos()
+            self.headings.append((self._line_starts[line - 1] + column, int(tag[1])))
+        self._open.append(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        # 关闭到最近的同名元素；没有对应开始标签的结束标签忽略
+        if tag in self._open:
+            while self._open.pop() != tag:
+                pass
+
+
+def split_sections(html: str) -> List[str]:
+    """按顶层标题（文档中出现的最高级标题）切分文档HTML
+
+    只在位于文档最外层的标题处切分；第一个标题之前的内容归入第一段，没有标题时整篇作为一段。
+    """
+    headings = _TopLevelHeadings(html).headings
+    if not headings:
+        return [html]
+    top = min(level for _, level in headings)
+    starts = [offset for offset, level in headings if level == top]
+    bounds = [0] + starts[1:] + [len(html)]
+    return [html[begin:end] for begin, end in zip(bounds, bounds[1:])]
+
+
+def group_sections(sections: List[str], parts: int) -> List[str]:
+    """将相邻分段合并为不超过 parts 组，各组大小尽量接近"""
+    parts = max(1, min(parts, len(sections)))
+    total = sum(len(section) for section in sections)
+    groups: List[str] = []
+    current: List[str] = []
+    size = 0
+    for index, section in enumerate(sections):
+        current.append(section)
+        size += len(section)
+        remaining_sections = len(sections) - index - 1
+        remaining_groups = parts - len(groups) - 1
+        # 达到平均大小或剩余分段只够每组一段时结束当前组
+        if remaining_groups > 0 and (
+            size * parts >= total * (len(groups) + 1) or remaining_sections <= remaining_groups
+        ):
+            groups.append("".join(current))
+            current = []
+    if current:
+        groups.append("".join(current))
+    return groups
+
+
+def link_across_sections(html: str) -> str:
+    """将指向本段之外锚点的文档内链接（目录、脚注等）改写，合并时再修正为跳转"""
+    ids: Set[str] = set(_ID_RE.findall(html))
+
+    def replace(match: "re.Match[str]") -> str:
+        anchor = match.group(2)
+        if not anchor or anchor in ids or unquote(anchor) in ids:
+            return match.group(0)
+        return match.group(1) + SECTION_LINK_PREFIX + quote(unquote(anchor), safe="") + match.group(3)
+
+    return _HREF_RE.sub(replace, html)
+
+
+def _resolve_section_links(writer: Any, names: Set[str]) -> None:
+    """将跨分段链接改为指向合并后文档中的命名目标，目标不存在时移除链接"""
+    from pypdf.generic import NameObject, TextStringObject
+
+    for page in writer.pages:
+        for ref in page.get("/Annots") or []:
+            annotation = ref.get_object()
+            action = annotation.get("/A")
+            if action is None:
+                continue
+            action = action.get_object()
+            uri = str(action.get("/URI", ""))
+            if action.get("/S") != "/URI" or not uri.startswith(SECTION_LINK_PREFIX):
+                continue
+            name = unquote(uri[len(SECTION_LINK_PREFIX):])
+            del annotation["/A"]
+            if name in names:
+                annotation[NameObject("/Dest")] = TextStringObject(name)
+
+
+def merge_section_pdfs(
+    output_path: str,
+    paths: Iterable[str],
+    page_numbers: Optional[Callable[[int], bytes]] = None,
+    title: Optional[str] = None
+) -> int:
+    """按顺序合并各段PDF并写入文件，返回文件大小
+
+    书签与命名目标随页面一并复制并重新定位；page_numbers 按总页数渲染只有页码的PDF，
+    逐页叠加到合并结果上，使页码连续。
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(PdfReader(path), import_outline=True)
+
+    names = {str(name) for name in writer.get_named_dest_root()[::2]}
+    _resolve_section_links(writer, names)
+
+    if page_numbers is not None:
+        overlay = PdfReader(io.BytesIO(page_numbers(len(writer.pages))))
+        for page, numbers in zip(writer.pages, overlay.pages):
+            page.merge_page(numbers)
+
+    if title:
+        writer.add_metadata({"/Title": title})
+    if writer.get_outline_root().get("/First") is not None:
+        writer.page_mode = "/UseOutlines"
+
+    with open(output_path, "wb") as f:
+        writer.write(f)
+    return os.path.getsize(output_path)
+
+
+def page_number_html(pages: int) -> str:
+    """只包含 pages 个空白页的文档正文，用于单独渲染连续页码"""
+    blank = '<div style="break-before: page"></div>'
+    return "<div></div>" + blank * (pages - 1)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.converter.assets import asset_fetcher
+from app.converter.cache import make_cache_key, pdf_cache
+from app.converter.diagrams import diagram_renderer
+from app.converter.engine import ENGINE_VERSION, conversion_engine
+from app.converter.errors import ConversionError
+from app.converter.fragments import FragmentCache, fragment_store
+from app.converter.options import PdfOptions, WatermarkOptions, parse_pdf_settings
+from app.converter.parser import document_html_key, html_cache
+from app.converter.sections import SPLIT_VERSION, should_split, split_sections
+from app.converter.watermark import stamped_key, watermark_key
+
+logger = logging.getLogger(__name__)
+
+
+class HtmlResult(NamedTuple):
+    """HTML预览获取结果"""
+    key: str
+    html: str
+
+
+class PdfResult(NamedTuple):
+    """PDF获取结果（缓存文件在 release_pdf 之前不会被淘汰）"""
+    path: str
+    key: str
+    cached: bool
+    size: int
+    # 经过体积优化时为优化前的大小
+    original_size: Optional[int] = None
+
+
+# 缓存键 -> 优化前的PDF大小（只记录经过优化的PDF）
+pdf_info_cache = FragmentCache("pdf-info", fragment_store, settings.fragment_memory_entries)
+
+
+def _engine_version(content: str) -> str:
+    """缓存键中的引擎版本；分段渲染时每段从新的一页开始，输出与整篇渲染不同"""
+    if should_split(content):
+        return f"{ENGINE_VERSION}-sections{SPLIT_VERSION}"
+    return ENGINE_VERSION
+
+
+# 正在渲染中的缓存键，相同内容的并发请求共享同一次渲染
+_inflight: Dict[str, "asyncio.Task[str]"] = {}
+
+
+async def _render_into_cache(
+    key: str,
+    content: str,
+    title: str,
+    options: PdfOptions,
+    template_name: Optional[str]
+) -> str:
+    """预取图片、渲染图表，再渲染PDF并写入缓存
+
+    有图片使用了占位图或图表因临时原因未能渲染时，结果只缓存 ASSET_FAILURE_TTL 秒，
+    到期后重新获取图片和渲染图表。
+    """
+    html = await get_html(content)
+    images, (diagrams, diagrams_complete) = await asyncio.gather(
+        asset_fetcher.prepare(html.html, options),
+        diagram_renderer.prepare(html.html),
+    )
+    assets = {**images, **diagrams}
+    complete = diagrams_complete and not any(asset.fallback for asset in images.values())
+    # 长文档按顶层标题分段，由多个渲染进程并行渲染后合并
+    sections = split_sections(html.html) if should_split(content) else []
+    tmp_path = pdf_cache.reserve()
+    try:
+        if len(sections) > 1:
+            await conversion_engine.convert_sections_to_file(
+                tmp_path, sections, title, options, template_name, assets
+            )
+        else:
+            await conversion_engine.convert_to_file(
+                tmp_path, content, title, options, template_name, assets
+            )
+        if options.optimize:
+            result = await conversion_engine.optimize_file(tmp_path)
+            logger.info("PDF优化: %d -> %d 字节", result.original_size, result.size)
+            pdf_info_cache.put(key, str(result.original_size))
+    except BaseException:
+        pdf_cache.discard(tmp_path)
+        raise
+    return pdf_cache.commit(key, tmp_path, ttl=None if complete else settings.asset_failure_ttl)
+
+
+def _pdf_result(path: str, key: str, cached: bool) -> PdfResult:
+    original_size = pdf_info_cache.get(key)
+    return PdfResult(
+        path=path,
+        key=key,
+        cached=cached,
+        size=os.path.getsize(path),
+        original_size=int(original_size) if original_size else None,
+    )
+
+
+def release_pdf(result: PdfResult) -> None:
+    """用完 get_pdf/lookup_pdf 返回的文件后解除占用，此后文件可以被淘汰"""
+    pdf_cache.release(result.key)
+
+
+def _shared(key: str, factory: Callable[[], Awaitable[str]]) -> "asyncio.Future[str]":
+    """相同缓存键的并发请求共享同一次生成"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield：单个请求断开不会取消其他请求共享的渲染
+    return asyncio.shield(task)
+
+
+async def _acquire(key: str, factory: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+    """占用缓存中的文件，未命中时生成后再占用，返回（路径, 是否命中缓存）
+
+    生成的文件在占用之前可能已被其他写入淘汰，这时重新生成。
+    """
+    cached = True
+    while True:
+        path = pdf_cache.acquire(key)
+        if path is not None:
+            return path, cached
+        cached = False
+        await _shared(key, factory)
+
+
+async def _render_watermark_into_cache(key: str, watermark: WatermarkOptions, options: PdfOptions) -> str:
+    """渲染水印页面并写入缓存"""
+    tmp_path = pdf_cache.reserve()
+    try:
+        await conversion_engine.render_watermark(tmp_path, watermark, options)
+    except BaseException:
+        pdf_cache.discard(tmp_path)
+        raise
+    return pdf_cache.commit(key, tmp_path)
+
+
+async def _stamp_into_cache(key: str, base_key: str, base_path: str, options: PdfOptions) -> str:
+    """在已缓存的PDF上叠加水印并写入缓存（原PDF只临时缓存时，结果同样只缓存到原PDF到期）"""
+    form_key = watermark_key(options.watermark, options)
+    form_path, _ = await _acquire(
+        form_key, lambda: _render_watermark_into_cache(form_key, options.watermark, options)
+    )
+    tmp_path = pdf_cache.reserve()
+    try:
+        await conversion_engine.stamp_watermark(base_path, form_path, tmp_path, options.optimize)
+    except BaseException:
+        pdf_cache.discard(tmp_path)
+        raise
+    finally:
+        pdf_cache.release(form_key)
+    return pdf_cache.commit(key, tmp_path, ttl=pdf_cache.ttl(base_key))
+
+
+def lookup_pdf(
+    content: str,
+    title: str,
+    pdf_settings: Optional[str] = None,
+    template_name: Optional[str] = None
+) -> Optional[PdfResult]:
+    """只查缓存、不渲染，未命中时返回None；命中时用完须调用 release_pdf"""
+    options = parse_pdf_settings(pdf_settings)
+    key = make_cache_key(content, title, options, template_name, _engine_version(content))
+    if options.watermark is not None:
+        key = stamped_key(key, watermark_key(options.watermark, options))
+    path = pdf_cache.acquire(key)
+    if path is None:
+        return None
+    return _pdf_result(path, key, cached=True)
+
+
+async def get_pdf(
+    content: str,
+    title: str,
+    pdf_settings: Optional[str] = None,
+    template_name: Optional[str] = None
+) -> PdfResult:
+    """获取文档PDF：优先读取缓存，未命中时渲染并写入缓存
+
+    设置了水印时，先获取不含水印的PDF（同样走缓存），再叠加水印；
+    只修改水印不会重新渲染文档。返回的文件用完后须调用 release_pdf。
+    """
+    options = parse_pdf_settings(pdf_settings)
+    base_key = make_cache_key(content, title, options, template_name, _engine_version(content))
+    if options.watermark is not None:
+        key = stamped_key(base_key, watermark_key(options.watermark, options))
+        path = pdf_cache.acquire(key)
+        if path is not None:
+            return _pdf_result(path, key, cached=True)
+
+    base_path, cached = await _acquire(
+        base_key, lambda: _render_into_cache(base_key, content, title, options, template_name)
+    )
+    if options.watermark is None:
+        return _pdf_result(base_path, base_key, cached)
+
+    try:
+        path, _ = await _acquire(key, lambda: _stamp_into_cache(key, base_key, base_path, options))
+    finally:
+        pdf_cache.release(base_key)
+    return _pdf_result(path, key, cached=False)
+
+
+async def get_html(content: str) -> HtmlResult:
+    """获取文档清洗后的HTML：优先读取缓存，未命中时在转换进程中渲染"""
+    key = document_html_key(content)
+    html = await html_cache.aget(key)
+    if html is None:
+        html = await conversion_engine.render_html(content)
+        # 转换进程已写入共享存储，这里只需放入本进程内存
+        html_cache.put(key, html, persist=False)
+    return HtmlResult(key=key, html=html)
+
+
+async def warm_html(content: str) -> None:
+    """预先渲染文档HTML（文档保存后在后台执行）"""
+    try:
+        await get_html(content)
+    except ConversionError as e:
+        logger.warning("预渲染文档HTML失败: %s", e)
+
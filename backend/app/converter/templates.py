@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+    select_autoescape,
+)
+
+from app.config import settings
+from app.converter.highlight import theme_stylesheet
+
+logger = logging.getLogger(__name__)
+
+# PDF模板目录：document.html 为页面骨架，*.css 为可选样式
+PDF_TEMPLATES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "templates", "pdf"
+)
+DOCUMENT_TEMPLATE = "document.html"
+DEFAULT_TEMPLATE = "default"
+
+
+class PdfTemplateRegistry:
+    """PDF模板注册表
+
+    启动时一次性编译页面模板并读入全部样式表，之后每次转换直接复用：
+    - 编译后的Jinja2字节码写入磁盘缓存，新启动的转换进程无需重新编译
+    - 样式表按模板名解析为WeasyPrint的CSS对象，在进程内常驻
+    - 每个模板有一个内容指纹，模板文件变化后PDF缓存自动失效
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        bytecode_cache_dir: Optional[str] = None,
+        highlight_theme: str = "default"
+    ):
+        self.directory = directory
+        self.highlight_theme = highlight_theme
+        self.bytecode_cache_dir = bytecode_cache_dir
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            bytecode_cache=bytecode_cache,
+        )
+        self._document: Optional[Template] = None
+        self._stylesheets: Dict[str, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._parsed: Dict[str, Any] = {}
+        self._font_config: Any = None
+        self._lock = threading.Lock()
+
+    def load(self, parse_stylesheets: bool = False) -> None:
+        """编译页面模板并读入样式表；parse_stylesheets 为真时同时预解析CSS（转换进程中使用）"""
+        if self.bytecode_cache_dir:
+            os.makedirs(self.bytecode_cache_dir, exist_ok=True)
+        document = self.env.get_template(DOCUMENT_TEMPLATE)
+        with open(os.path.join(self.directory, DOCUMENT_TEMPLATE), "rb") as f:
+            document_source = f.read()
+
+        # 代码高亮配色附加在每个模板样式表之后
+        highlight_css = theme_stylesheet(self.highlight_theme)
+        stylesheets: Dict[str, str] = {}
+        fingerprints: Dict[str, str] = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".css"):
+                continue
+            with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                css = f.read() + "\n" + highlight_css
+            name = filename[:-len(".css")]
+            stylesheets[name] = css
+            digest = hashlib.sha256(document_source)
+            digest.update(css.encode("utf-8"))
+            fingerprints[name] = digest.hexdigest()
+
+        with self._lock:
+            self._document = document
+            self._stylesheets = stylesheets
+            self._fingerprints = fingerprints
+            self._parsed = {}
+
+        if parse_stylesheets:
+            for name in stylesheets:
+                self.parsed_stylesheet(name)
+        logger.info("已加载PDF模板: %s", ", ".join(stylesheets))
+
+    def _ensure_loaded(self) -> None:
+        if self._document is None:
+            self.load()
+
+    @property
+    def names(self) -> List[str]:
+        """可用的模板名称"""
+        self._ensure_loaded()
+        return sorted(self._stylesheets)
+
+    def resolve(self, template_name: Optional[str]) -> str:
+        """解析模板名称，未知模板回退到默认模板"""
+        self._ensure_loaded()
+        if template_name and template_name in self._stylesheets:
+            return template_name
+        return DEFAULT_TEMPLATE
+
+    def document_template(self) -> Template:
+        """编译好的页面骨架模板"""
+        self._ensure_loaded()
+        return self._document
+
+    def stylesheet(self, template_name: str) -> str:
+        """模板样式表源码"""
+        self._ensure_loaded()
+        return self._stylesheets[template_name]
+
+    def fingerprint(self, template_name: str) -> str:
+        """模板内容指纹（页面骨架 + 样式表）"""
+        self._ensure_loaded()
+        return self._fingerprints[template_name]
+
+    def font_config(self) -> Any:
+        """进程内共享的字体配置，解析样式表与渲染PDF时必须使用同一个实例"""
+        if self._font_config is None:
+            from weasyprint.text.fonts import FontConfiguration
+
+            self._font_config = FontConfiguration()
+        return self._font_config
+
+    def parsed_stylesheet(self, template_name: str) -> Any:
+        """解析后的样式表（WeasyPrint CSS对象），每个进程只解析一次"""
+        parsed = self._parsed.get(template_name)
+        if parsed is not None:
+            return parsed
+
+        from weasyprint import CSS
+
+        source = self.stylesheet(template_name)
+        with self._lock:
+            parsed = self._parsed.get(template_name)
+            if parsed is None:
+                parsed = CSS(
+                    string=source,
+                    base_url=self.directory,
+                    font_config=self.font_config(),
+                )
+                self._parsed[template_name] = parsed
+        return parsed
+
+
+# 全局模板注册表
+pdf_templates = PdfTemplateRegistry(
+    PDF_TEMPLATES_DIR,
+    settings.template_bytecode_cache_dir,
+    settings.highlight_theme,
+)
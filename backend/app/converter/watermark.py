@@ -0,0 +1,86 @@
+import hashlib
+import html as html_lib
+import json
+import os
+
+from app.converter.options import PdfOptions, WatermarkOptions
+from app.converter.renderer import layout_document
+
+# 水印页面版本号，水印排版方式变化时需要递增，使已缓存的水印与加水印的PDF失效
+WATERMARK_VERSION = "1"
+
+
+def watermark_key(watermark: WatermarkOptions, options: PdfOptions) -> str:
+    """水印页面的缓存键：（水印设置, 纸张尺寸与方向）"""
+    payload = json.dumps(
+        {
+            "version": WATERMARK_VERSION,
+            "watermark": watermark.model_dump(),
+            "page_size": options.page_size,
+            "orientation": options.orientation,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def stamped_key(base_key: str, watermark_key: str) -> str:
+    """加水印后PDF的缓存键"""
+    return hashlib.sha256(f"watermark\0{base_key}\0{watermark_key}".encode("ascii")).hexdigest()
+
+
+def watermark_html(watermark: WatermarkOptions, options: PdfOptions) -> str:
+    """只包含一段居中旋转文字的透明页面"""
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="UTF-8">
+<style>
+    @page {{ size: {options.page_size} {options.orientation}; margin: 0; }}
+    html, body {{ margin: 0; padding: 0; background: transparent; }}
+    .watermark {{
+        position: absolute;
+        top: 50%;
+        left: 50%;
+        transform: translate(-50%, -50%) rotate({watermark.angle}deg);
+        font-size: {watermark.font_size};
+        color: {watermark.color};
+        opacity: {watermark.opacity};
+        white-space: nowrap;
+    }}
+</style>
+</head>
+<body><div class="watermark">{html_lib.escape(watermark.text)}</div></body>
+</html>"""
+
+
+def render_watermark_to_file(path: str, watermark: WatermarkOptions, options: PdfOptions) -> int:
+    """渲染单页水印PDF并写入文件（在转换进程中执行），字体与默认模板一致"""
+    pdf = layout_document(watermark_html(watermark, options)).write_pdf()
+    with open(path, "wb") as f:
+        f.write(pdf)
+    return len(pdf)
+
+
+def stamp_watermark(base_path: str, watermark_path: str, output_path: str, optimize: bool = False) -> int:
+    """将水印叠加到已渲染的PDF上并写入新文件，返回文件大小
+
+    水印页面转换为一个表单XObject，只复制进文档一次，各页只增加一条引用它的绘制指令，
+    开销与页数成正比且远小于重新渲染。optimize 为真时同样以压缩对象流和线性化方式保存。
+    """
+    import pikepdf
+
+    with pikepdf.open(base_path) as pdf, pikepdf.open(watermark_path) as source:
+        form = pdf.copy_foreign(source.pages[0].as_form_xobject())
+        for page in pdf.pages:
+            page.add_overlay(form)
+        if optimize:
+            pdf.save(
+                output_path,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=True,
+            )
+        else:
+            pdf.save(output_path)
+    return os.path.getsize(output_path)
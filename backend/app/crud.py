@@ -1,30 +1,72 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, bindparam, case, desc, false, func, select, true, update
+from sqlalchemy.orm import defer
+from collections import Counter
+from typing import Dict, List, Optional
 from datetime import datetime
-from db.models import User, MarkdownDocument, UserRole
+from db.models import User, MarkdownDocument, UserRole, ConversionJob, JobStatus, make_excerpt
 from db.schemas import UserCreate, UserUpdate, MarkdownDocumentCreate, MarkdownDocumentUpdate
 from app.auth import get_password_hash
+from app.config import settings
+from app.pagination import Page, keyset_paginate
+from db.search import SEARCH_DIALECTS, index_document, remove_document, search_hits
+
+class QuotaExceededError(Exception):
+    """超出免费用户的使用额度"""
+
 
 # 用户CRUD操作
 class UserCRUD:
     @staticmethod
-    def get_by_id(db: Session, user_id: int) -> Optional[User]:
+    async def get_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
         """根据ID获取用户"""
-        return db.query(User).filter(User.id == user_id).first()
+        return await db.get(User, user_id)
     
     @staticmethod
-    def get_by_username(db: Session, username: str) -> Optional[User]:
+    async def get_by_username(db: AsyncSession, username: str) -> Optional[User]:
         """根据用户名获取用户"""
-        return db.query(User).filter(User.username == username).first()
+        result = await db.execute(select(User).where(User.username == username))
+        return result.scalars().first()
     
     @staticmethod
-    def get_by_email(db: Session, email: str) -> Optional[User]:
+    async def get_by_email(db: AsyncSession, email: str) -> Optional[User]:
         """根据邮箱获取用户"""
-        return db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[User]:
+        """获取用户列表"""
+        result = await db.execute(select(User).offset(skip).limit(limit))
+        return list(result.scalars().all())
     
     @staticmethod
-    def create(db: Session, user: UserCreate) -> User:
+    async def add_usage(db: AsyncSession, user_id: int, documents: int = 0, conversions: int = 0) -> bool:
+        """累加用户的文档数与转换次数（不提交，随调用方的事务一起提交）
+
+        以一条 UPDATE users SET total_x = total_x + n 原子地修改，并发请求不会互相覆盖；
+        增加用量时免费用户的额度检查作为同一条语句的条件，并发请求也不会超出额度。
+        返回 False 表示额度不足，未做修改。
+        """
+        query = update(User).where(User.id == user_id).values(
+            total_documents=User.total_documents + documents,
+            total_conversions=User.total_conversions + conversions
+        )
+        if documents > 0:
+            query = query.where(or_(
+                User.role != UserRole.FREE,
+                User.total_documents + documents <= settings.free_user_document_limit
+            ))
+        if conversions > 0:
+            query = query.where(or_(
+                User.role != UserRole.FREE,
+                User.total_conversions + conversions <= settings.free_user_conversion_limit
+            ))
+        result = await db.execute(query)
+        return result.rowcount == 1
+
+    @staticmethod
+    async def create(db: AsyncSession, user: UserCreate) -> User:
         """创建用户"""
         hashed_password = get_password_hash(user.password)
         db_user = User(
@@ -36,14 +78,14 @@ class UserCRUD:
             role=UserRole.FREE
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     
     @staticmethod
-    def update(db: Session, user_id: int, user_update: UserUpdate) -> Optional[User]:
+    async def update(db: AsyncSession, user_id: int, user_update: UserUpdate) -> Optional[User]:
         """更新用户信息"""
-        db_user = UserCRUD.get_by_id(db, user_id)
+        db_user = await UserCRUD.get_by_id(db, user_id)
         if not db_user:
             return None
         
@@ -51,22 +93,24 @@ class UserCRUD:
         for field, value in update_data.items():
             setattr(db_user, field, value)
         
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     
     @staticmethod
-    def update_last_login(db: Session, user_id: int) -> None:
+    async def update_last_login(db: AsyncSession, user_id: int) -> None:
         """更新最后登录时间"""
-        db_user = UserCRUD.get_by_id(db, user_id)
+        db_user = await UserCRUD.get_by_id(db, user_id)
         if db_user:
             db_user.last_login_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
+            # updated_at 由数据库更新，提交后需重新加载
+            await db.refresh(db_user)
     
     @staticmethod
-    def upgrade_to_premium(db: Session, user_id: int, months: int) -> Optional[User]:
+    async def upgrade_to_premium(db: AsyncSession, user_id: int, months: int) -> Optional[User]:
         """升级为会员"""
-        db_user = UserCRUD.get_by_id(db, user_id)
+        db_user = await UserCRUD.get_by_id(db, user_id)
         if not db_user:
             return None
         
@@ -79,14 +123,14 @@ class UserCRUD:
             db_user.premium_expires_at = datetime.utcnow() + timedelta(days=30 * months)
         
         db_user.role = UserRole.PREMIUM
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     
     @staticmethod
-    def check_premium_status(db: Session, user_id: int) -> bool:
+    async def check_premium_status(db: AsyncSession, user_id: int) -> bool:
         """检查会员状态"""
-        db_user = UserCRUD.get_by_id(db, user_id)
+        db_user = await UserCRUD.get_by_id(db, user_id)
         if not db_user:
             return False
         
@@ -98,12 +142,75 @@ class UserCRUD:
         
         return False
 
+# 列表查询不加载正文；误用时直接报错，而不是在异步会话中隐式再查一次
+WITHOUT_CONTENT = defer(MarkdownDocument.content, raiseload=True)
+
+# 搜索结果摘要：正文中第一个匹配处前后截取的字符数
+SEARCH_CONTEXT_BEFORE = 60
+SEARCH_CONTEXT_LENGTH = 240
+
+# 文档列表的排序键，最后一列为主键，保证顺序唯一、游标可以准确定位
+RECENT_ORDER = (MarkdownDocument.updated_at, MarkdownDocument.id)
+POPULAR_ORDER = (MarkdownDocument.view_count, MarkdownDocument.id)
+
+def _user_documents_filter(user_id: int, include_public: bool = False):
+    """用户文档列表的过滤条件"""
+    # 不包含公开文档时只按所有者过滤，条件与 (user_id, updated_at, id) 索引一致
+    owner = MarkdownDocument.user_id == user_id
+    if include_public:
+        owner = or_(owner, MarkdownDocument.is_public == true())
+    return and_(MarkdownDocument.is_deleted == false(), owner)
+
+def _search_filter(user_id: int, search_term: str):
+    """文档搜索的过滤条件（不支持全文索引的数据库使用）"""
+    return and_(
+        MarkdownDocument.user_id == user_id,
+        MarkdownDocument.is_deleted == false(),
+        or_(
+            MarkdownDocument.title.contains(search_term),
+            MarkdownDocument.content.contains(search_term),
+            MarkdownDocument.description.contains(search_term)
+        )
+    )
+
+def _public_filter():
+    """公开文档列表的过滤条件"""
+    return and_(
+        MarkdownDocument.is_public == true(),
+        MarkdownDocument.is_deleted == false()
+    )
+
+async def _count(db: AsyncSession, condition) -> int:
+    """统计满足条件的文档数量"""
+    result = await db.execute(
+        select(func.count()).select_from(MarkdownDocument).where(condition)
+    )
+    return result.scalar_one()
+
+def _search_query(db: AsyncSession, user_id: int, search_term: str, query):
+    """在 query 上加入全文索引匹配条件，返回（查询, 排序键）；搜索词中没有可检索内容时返回 None"""
+    dialect = db.bind.dialect.name
+    if dialect not in SEARCH_DIALECTS:
+        return query.where(_search_filter(user_id, search_term)), RECENT_ORDER
+
+    hits = search_hits(dialect, user_id, search_term)
+    if hits is None:
+        return None
+    hits = hits.subquery()
+    query = query.join(hits, hits.c.document_id == MarkdownDocument.id).where(
+        and_(
+            MarkdownDocument.user_id == user_id,
+            MarkdownDocument.is_deleted == false()
+        )
+    )
+    return query, (hits.c.relevance, MarkdownDocument.id)
+
 # Markdown文档CRUD操作
 class MarkdownDocumentCRUD:
     @staticmethod
-    def get_by_id(db: Session, doc_id: int, user_id: Optional[int] = None) -> Optional[MarkdownDocument]:
+    async def get_by_id(db: AsyncSession, doc_id: int, user_id: Optional[int] = None) -> Optional[MarkdownDocument]:
         """根据ID获取文档"""
-        query = db.query(MarkdownDocument).filter(
+        query = select(MarkdownDocument).where(
             and_(
                 MarkdownDocument.id == doc_id,
                 MarkdownDocument.is_deleted == False
@@ -111,52 +218,92 @@ class MarkdownDocumentCRUD:
         )
         
         if user_id:
-            query = query.filter(MarkdownDocument.user_id == user_id)
+            query = query.where(MarkdownDocument.user_id == user_id)
         
-        return query.first()
+        result = await db.execute(query)
+        return result.scalars().first()
     
     @staticmethod
-    def get_user_documents(
-        db: Session, 
-        user_id: int, 
-        skip: int = 0, 
-        limit: int = 100,
-        include_public: bool = False
-    ) -> List[MarkdownDocument]:
-        """获取用户的文档列表"""
-        query = db.query(MarkdownDocument).filter(
+    async def get_readable(db: AsyncSession, doc_id: int, user_id: int) -> Optional[MarkdownDocument]:
+        """获取用户可查看的文档（自己的文档或公开文档）"""
+        result = await db.execute(select(MarkdownDocument).where(
             and_(
+                MarkdownDocument.id == doc_id,
                 MarkdownDocument.is_deleted == False,
                 or_(
                     MarkdownDocument.user_id == user_id,
-                    and_(MarkdownDocument.is_public == True, include_public)
+                    MarkdownDocument.is_public == true()
                 )
             )
-        ).order_by(desc(MarkdownDocument.updated_at))
+        ))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_user_documents(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        include_public: bool = False
+    ) -> Page:
+        """获取用户的文档列表（按更新时间倒序，游标分页）"""
+        query = select(MarkdownDocument).options(WITHOUT_CONTENT).where(
+            _user_documents_filter(user_id, include_public)
+        )
+        return await keyset_paginate(db, query, RECENT_ORDER, limit, cursor)
+
+    @staticmethod
+    async def count_user_documents(db: AsyncSession, user_id: int, include_public: bool = False) -> int:
+        """统计用户的文档数量"""
+        return await _count(db, _user_documents_filter(user_id, include_public))
+
+    @staticmethod
+    async def get_user_document_ids(
+        db: AsyncSession,
+        user_id: int,
+        document_ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """获取用户拥有的文档ID，指定 document_ids 时按给定顺序过滤"""
+        query = select(MarkdownDocument.id).where(
+            and_(
+                MarkdownDocument.user_id == user_id,
+                MarkdownDocument.is_deleted == false()
+            )
+        )
         
-        return query.offset(skip).limit(limit).all()
+        if document_ids is None:
+            result = await db.execute(query.order_by(desc(MarkdownDocument.updated_at)))
+            return list(result.scalars().all())
+
+        result = await db.execute(query.where(MarkdownDocument.id.in_(document_ids)))
+        owned = set(result.scalars().all())
+        return [doc_id for doc_id in dict.fromkeys(document_ids) if doc_id in owned]
     
     @staticmethod
-    def create(db: Session, doc: MarkdownDocumentCreate, user_id: int) -> MarkdownDocument:
-        """创建文档"""
+    async def create(db: AsyncSession, doc: MarkdownDocumentCreate, user_id: int) -> MarkdownDocument:
+        """创建文档，文档与用户的文档数在同一事务中写入"""
+        if not await UserCRUD.add_usage(db, user_id, documents=1):
+            raise QuotaExceededError(
+                f"免费用户最多只能创建{settings.free_user_document_limit}个文档，请升级为会员"
+            )
+
         db_doc = MarkdownDocument(
             **doc.dict(),
-            user_id=user_id
+            user_id=user_id,
+            content_length=len(doc.content),
+            excerpt=make_excerpt(doc.content)
         )
         db.add(db_doc)
-        db.commit()
-        db.refresh(db_doc)
-        
-        # 更新用户统计
-        from app.auth import update_user_stats
-        update_user_stats(db.query(User).filter(User.id == user_id).first(), db, document_count=1)
-        
+        await db.flush()
+        await index_document(db, db_doc)
+        await db.commit()
+        await db.refresh(db_doc)
         return db_doc
     
     @staticmethod
-    def update(db: Session, doc_id: int, doc_update: MarkdownDocumentUpdate, user_id: int) -> Optional[MarkdownDocument]:
+    async def update(db: AsyncSession, doc_id: int, doc_update: MarkdownDocumentUpdate, user_id: int) -> Optional[MarkdownDocument]:
         """更新文档"""
-        db_doc = MarkdownDocumentCRUD.get_by_id(db, doc_id, user_id)
+        db_doc = await MarkdownDocumentCRUD.get_by_id(db, doc_id, user_id)
         if not db_doc:
             return None
         
@@ -164,74 +311,279 @@ class MarkdownDocumentCRUD:
         for field, value in update_data.items():
             setattr(db_doc, field, value)
         
-        db.commit()
-        db.refresh(db_doc)
+        if update_data.get("content") is not None:
+            db_doc.content_length = len(db_doc.content)
+            db_doc.excerpt = make_excerpt(db_doc.content)
+        if update_data.keys() & {"title", "description", "content"}:
+            await index_document(db, db_doc)
+        await db.commit()
+        await db.refresh(db_doc)
         return db_doc
     
     @staticmethod
-    def delete(db: Session, doc_id: int, user_id: int) -> bool:
-        """删除文档（软删除）"""
-        db_doc = MarkdownDocumentCRUD.get_by_id(db, doc_id, user_id)
-        if not db_doc:
+    async def delete(db: AsyncSession, doc_id: int, user_id: int) -> bool:
+        """删除文档（软删除）
+
+        以条件更新标记删除，同一文档被并发删除时只有一次生效，用户的文档数只减一次。
+        """
+        result = await db.execute(
+            update(MarkdownDocument)
+            .where(
+                MarkdownDocument.id == doc_id,
+                MarkdownDocument.user_id == user_id,
+                MarkdownDocument.is_deleted == false()
+            )
+            .values(is_deleted=True)
+        )
+        if result.rowcount == 0:
             return False
         
-        db_doc.is_deleted = True
-        db.commit()
-        
-        # 更新用户统计
-        from app.auth import update_user_stats
-        update_user_stats(db.query(User).filter(User.id == user_id).first(), db, document_count=-1)
-        
+        await remove_document(db, doc_id)
+        await UserCRUD.add_usage(db, user_id, documents=-1)
+        await db.commit()
         return True
     
     @staticmethod
-    def increment_view_count(db: Session, doc_id: int) -> None:
-        """增加查看次数"""
-        db_doc = db.query(MarkdownDocument).filter(MarkdownDocument.id == doc_id).first()
-        if db_doc:
-            db_doc.view_count += 1
-            db.commit()
+    async def add_view_counts(db: AsyncSession, counts: Dict[int, int]) -> None:
+        """批量累加查看次数
+
+        每篇文档一条 view_count = view_count + n，在一个事务中批量执行；
+        按ID顺序更新，多个进程同时写入时加锁顺序一致。查看不算修改，不更新 updated_at。
+        """
+        if not counts:
+            return
+        documents = MarkdownDocument.__table__
+        await db.execute(
+            update(documents)
+            .where(documents.c.id == bindparam("doc_id"))
+            .values(
+                view_count=documents.c.view_count + bindparam("delta"),
+                updated_at=documents.c.updated_at,
+            ),
+            [{"doc_id": doc_id, "delta": counts[doc_id]} for doc_id in sorted(counts)],
+        )
+        await db.commit()
     
     @staticmethod
-    def increment_conversion_count(db: Session, doc_id: int, user_id: int) -> None:
-        """增加转换次数"""
-        db_doc = db.query(MarkdownDocument).filter(MarkdownDocument.id == doc_id).first()
-        if db_doc:
-            db_doc.conversion_count += 1
-            db_doc.last_converted_at = datetime.utcnow()
-            db.commit()
-            
-            # 更新用户统计
-            from app.auth import update_user_stats
-            update_user_stats(db.query(User).filter(User.id == user_id).first(), db, conversion_count=1)
+    async def increment_conversion_count(db: AsyncSession, doc_id: int, user_id: int) -> None:
+        """增加文档与用户的转换次数（不提交，与转换任务一起提交）
+
+        免费用户额度不足时抛出 QuotaExceededError。
+        """
+        if not await UserCRUD.add_usage(db, user_id, conversions=1):
+            raise QuotaExceededError(
+                f"免费用户最多只能转换{settings.free_user_conversion_limit}次，请升级为会员"
+            )
+        await db.execute(
+            update(MarkdownDocument)
+            .where(MarkdownDocument.id == doc_id)
+            .values(
+                conversion_count=MarkdownDocument.conversion_count + 1,
+                last_converted_at=datetime.utcnow()
+            )
+        )
     
     @staticmethod
-    def search_documents(
-        db: Session, 
+    async def search_documents(
+        db: AsyncSession,
         user_id: int, 
         search_term: str,
-        skip: int = 0, 
-        limit: int = 100
-    ) -> List[MarkdownDocument]:
-        """搜索文档"""
-        return db.query(MarkdownDocument).filter(
-            and_(
-                MarkdownDocument.user_id == user_id,
-                MarkdownDocument.is_deleted == False,
-                or_(
-                    MarkdownDocument.title.contains(search_term),
-                    MarkdownDocument.content.contains(search_term),
-                    MarkdownDocument.description.contains(search_term)
-                )
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Page:
+        """搜索文档（按相关度排序，游标分页）"""
+        search = _search_query(db, user_id, search_term, select(MarkdownDocument).options(WITHOUT_CONTENT))
+        if search is None:
+            return Page([], None, None)
+        query, order = search
+        return await keyset_paginate(db, query, order, limit, cursor)
+
+    @staticmethod
+    async def count_search_results(db: AsyncSession, user_id: int, search_term: str) -> int:
+        """统计搜索结果数量"""
+        search = _search_query(db, user_id, search_term, select(func.count()).select_from(MarkdownDocument))
+        if search is None:
+            return 0
+        result = await db.execute(search[0])
+        return result.scalar_one()
+
+    @staticmethod
+    async def get_search_contexts(db: AsyncSession, doc_ids: List[int], search_term: str) -> Dict[int, str]:
+        """截取各文档正文中第一个匹配处附近的一段，用于生成搜索摘要
+
+        截取在数据库中完成，只传回有限长度的片段；没有直接匹配的文档不返回。
+        """
+        terms = search_term.split()
+        if not doc_ids or not terms:
+            return {}
+        term = max(terms, key=len).lower()
+        content = func.lower(MarkdownDocument.content)
+        if db.bind.dialect.name == "postgresql":
+            position = func.strpos(content, term)
+        else:
+            position = func.instr(content, term)
+        start = case(
+            (position > SEARCH_CONTEXT_BEFORE, position - SEARCH_CONTEXT_BEFORE),
+            else_=1
+        )
+        result = await db.execute(
+            select(
+                MarkdownDocument.id,
+                func.substr(MarkdownDocument.content, start, SEARCH_CONTEXT_LENGTH)
+            ).where(
+                and_(MarkdownDocument.id.in_(doc_ids), position > 0)
             )
-        ).order_by(desc(MarkdownDocument.updated_at)).offset(skip).limit(limit).all()
+        )
+        return dict(result.all())
     
     @staticmethod
-    def get_public_documents(db: Session, skip: int = 0, limit: int = 100) -> List[MarkdownDocument]:
-        """获取公开文档"""
-        return db.query(MarkdownDocument).filter(
-            and_(
-                MarkdownDocument.is_public == True,
-                MarkdownDocument.is_deleted == False
+    async def get_public_documents(db: AsyncSession, limit: int = 100, cursor: Optional[str] = None) -> Page:
+        """获取公开文档（按查看次数倒序，游标分页）"""
+        query = select(MarkdownDocument).options(WITHOUT_CONTENT).where(_public_filter())
+        return await keyset_paginate(db, query, POPULAR_ORDER, limit, cursor)
+
+    @staticmethod
+    async def count_public_documents(db: AsyncSession) -> int:
+        """统计公开文档数量"""
+        return await _count(db, _public_filter())
+
+# 转换任务CRUD操作
+class ConversionJobCRUD:
+    @staticmethod
+    async def get_by_id(db: AsyncSession, job_id: int, user_id: Optional[int] = None) -> Optional[ConversionJob]:
+        """根据ID获取转换任务"""
+        query = select(ConversionJob).where(ConversionJob.id == job_id)
+
+        if user_id:
+            query = query.where(ConversionJob.user_id == user_id)
+
+        result = await db.execute(query)
+        return result.scalars().first()
+
+    @staticmethod
+    async def create(
+        db: AsyncSession,
+        user_id: int,
+        document_id: int,
+        status: JobStatus = JobStatus.QUEUED,
+        cache_key: Optional[str] = None,
+        pdf_size: Optional[int] = None,
+        original_pdf_size: Optional[int] = None,
+        worker_id: Optional[str] = None
+    ) -> ConversionJob:
+        """创建转换任务，worker_id 为持有该任务的进程"""
+        db_job = ConversionJob(
+            user_id=user_id,
+            document_id=document_id,
+            status=status,
+            cache_key=cache_key,
+            pdf_size=pdf_size,
+            original_pdf_size=original_pdf_size,
+            worker_id=worker_id
+        )
+        if worker_id is not None:
+            db_job.heartbeat_at = datetime.utcnow()
+        if status == JobStatus.DONE:
+            db_job.started_at = db_job.finished_at = datetime.utcnow()
+        db.add(db_job)
+        await db.commit()
+        await db.refresh(db_job)
+        return db_job
+
+    @staticmethod
+    async def mark_running(db: AsyncSession, job_id: int) -> None:
+        """标记任务开始执行"""
+        await db.execute(update(ConversionJob).where(ConversionJob.id == job_id).values(
+            status=JobStatus.RUNNING, started_at=datetime.utcnow()
+        ))
+        await db.commit()
+
+    @staticmethod
+    async def mark_done(
+        db: AsyncSession,
+        job_id: int,
+        cache_key: str,
+        pdf_size: Optional[int] = None,
+        original_pdf_size: Optional[int] = None
+    ) -> None:
+        """标记任务完成，记录输出大小"""
+        await db.execute(update(ConversionJob).where(ConversionJob.id == job_id).values(
+            status=JobStatus.DONE,
+            cache_key=cache_key,
+            pdf_size=pdf_size,
+            original_pdf_size=original_pdf_size,
+            finished_at=datetime.utcnow(),
+        ))
+        await db.commit()
+
+    @staticmethod
+    async def mark_failed(db: AsyncSession, job_id: int, error: str) -> None:
+        """标记任务失败，退还提交时计入的转换次数"""
+        await ConversionJobCRUD._fail_jobs(db, [ConversionJob.id == job_id], error)
+
+    @staticmethod
+    async def renew_lease(db: AsyncSession, worker_id: str) -> int:
+        """为进程持有的未完成任务续租"""
+        result = await db.execute(
+            update(ConversionJob).where(
+                ConversionJob.worker_id == worker_id,
+                ConversionJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+            ).values(heartbeat_at=datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def fail_unfinished(
+        db: AsyncSession,
+        error: str,
+        worker_id: Optional[str] = None,
+        stale_before: Optional[datetime] = None
+    ) -> int:
+        """将未完成的任务标记为失败并退还转换次数（持有进程已退出，内存中的队列已丢失）
+
+        worker_id 只处理该进程持有的任务；stale_before 只处理在此之前没有续租的任务
+        （包括没有持有进程记录的旧任务）。
+        """
+        conditions = []
+        if worker_id is not None:
+            conditions.append(ConversionJob.worker_id == worker_id)
+        if stale_before is not None:
+            conditions.append(or_(
+                ConversionJob.heartbeat_at.is_(None), ConversionJob.heartbeat_at < stale_before
+            ))
+        return await ConversionJobCRUD._fail_jobs(db, conditions, error)
+
+    @staticmethod
+    async def _fail_jobs(db: AsyncSession, conditions: list, error: str) -> int:
+        """将符合条件的未完成任务标记为失败，并在同一事务中退还转换次数
+
+        提交任务时已计入用户和文档的转换次数，没有产出PDF的任务不应占用额度。
+        只处理排队中和执行中的任务，同一任务不会被重复退还。
+        """
+        unfinished = ConversionJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+        result = await db.execute(
+            select(ConversionJob.id, ConversionJob.user_id, ConversionJob.document_id)
+            .where(unfinished, *conditions)
+        )
+        failed = []
+        for job_id, user_id, doc_id in result.all():
+            # 逐条带状态条件更新：查询之后被其他进程完成的任务不再标记和退还
+            updated = await db.execute(
+                update(ConversionJob).where(ConversionJob.id == job_id, unfinished).values(
+                    status=JobStatus.FAILED, error=error, finished_at=datetime.utcnow()
+                ).execution_options(synchronize_session=False)
+            )
+            if updated.rowcount == 1:
+                failed.append((user_id, doc_id))
+        for user_id, count in Counter(user_id for user_id, _ in failed).items():
+            await UserCRUD.add_usage(db, user_id, conversions=-count)
+        for doc_id, count in Counter(doc_id for _, doc_id in failed).items():
+            await db.execute(
+                update(MarkdownDocument)
+                .where(MarkdownDocument.id == doc_id)
+                .values(conversion_count=MarkdownDocument.conversion_count - count)
             )
-        ).order_by(desc(MarkdownDocument.view_count)).offset(skip).limit(limit).all() 
\ No newline at end of file
+        await db.commit()
+        return len(failed)
+
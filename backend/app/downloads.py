@@ -0,0 +1,103 @@
+import os
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from urllib.parse import quote
+
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.config import settings
+
+PDF_MEDIA_TYPE = "application/pdf"
+
+# 预览HTML已经过清洗，再通过CSP禁止脚本执行作为第二道防线
+PREVIEW_CSP = "default-src 'none'; img-src http: https: data:; style-src 'unsafe-inline'"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 是否命中当前ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def pdf_file_response(
+    request: Request,
+    path: str,
+    etag: str,
+    filename: str,
+    background: Optional[BackgroundTask] = None
+) -> Response:
+    """以文件流方式返回PDF
+
+    - 文件按块读取发送，内存占用与文件大小无关；ASGI服务器支持
+      http.response.pathsend 扩展时直接交给服务器零拷贝发送
+    - 支持 Range/If-Range 断点续传和PDF阅读器的分段读取
+    - 配置 PDF_ACCEL_REDIRECT_PREFIX 后交由Nginx通过sendfile发送
+    - background 在响应发送完毕后执行（如解除缓存文件的占用）
+    """
+    etag = f'"{etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+    }
+
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers, background=background)
+
+    if settings.pdf_accel_redirect_prefix:
+        # Nginx 内部location负责 Range 处理与 sendfile 零拷贝发送
+        relative_path = os.path.relpath(path, settings.pdf_cache_dir).replace(os.sep, "/")
+        headers.update({
+            "X-Accel-Redirect": settings.pdf_accel_redirect_prefix.rstrip("/") + "/" + quote(relative_path),
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        })
+        return Response(media_type=PDF_MEDIA_TYPE, headers=headers, background=background)
+
+    return FileResponse(path, media_type=PDF_MEDIA_TYPE, filename=filename, headers=headers, background=background)
+
+
+def encrypted_pdf_response(
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    background: Optional[BackgroundTask] = None
+) -> StreamingResponse:
+    """以分块传输返回边加密边生成的PDF
+
+    每次加密结果都不同且大小事先未知，因此不提供ETag、Content-Length和Range，也不允许缓存。
+    """
+    return StreamingResponse(
+        chunks,
+        media_type=PDF_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+            "Cache-Control": "no-store",
+        },
+        background=background,
+    )
+
+
+async def html_preview_response(
+    request: Request,
+    etag: str,
+    render: Callable[[], Awaitable[str]]
+) -> Response:
+    """返回预览HTML，支持基于内容哈希的条件请求
+
+    ETag由文档内容计算，客户端缓存仍有效时直接返回304，不读取也不渲染HTML。
+    """
+    etag = f'"{etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Security-Policy": PREVIEW_CSP,
+        "X-Content-Type-Options": "nosniff",
+    }
+
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return HTMLResponse(await render(), headers=headers)
+
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.converter import ConversionError, get_pdf, lookup_pdf, release_pdf
+from app.crud import ConversionJobCRUD, MarkdownDocumentCRUD
+from db.database import AsyncSessionLocal
+from db.models import ConversionJob, JobStatus, MarkdownDocument
+from db.schemas import ConversionJobResponse
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """转换队列已满"""
+
+
+class ConversionTask(NamedTuple):
+    """队列中的转换任务（入队时的文档快照）"""
+    job_id: int
+    document_id: int
+    content: str
+    title: str
+    pdf_settings: Optional[str]
+    template_name: Optional[str]
+
+
+class ConversionQueue:
+    """异步PDF转换队列
+
+    请求只负责入队并立即返回任务ID，后台消费者按顺序交给转换引擎执行。
+    队列有长度上限，饱和时直接拒绝新任务，由客户端稍后重试。
+
+    队列只保存在本进程内存中。任务记录持有进程的ID并由该进程定期续租，
+    多个进程（uvicorn --workers、滚动重启）共用数据库时，只有租约过期的任务
+    （持有进程已退出）才会被标记为失败，不影响其他进程正在执行的任务。
+    """
+
+    def __init__(self, maxsize: int, concurrency: int):
+        self.maxsize = maxsize
+        self.concurrency = max(1, concurrency)
+        self.worker_id = f"{uuid.uuid4().hex[:12]}@{socket.gethostname()}:{os.getpid()}"[:64]
+        self._queue: Optional[asyncio.Queue[ConversionTask]] = None
+        self._workers: List[asyncio.Task[None]] = []
+        self._heartbeat: Optional[asyncio.Task[None]] = None
+        # 已通过容量检查、尚未入队的任务数（提交过程中要等待数据库写入）
+        self._reserved = 0
+
+    @property
+    def depth(self) -> int:
+        """当前排队的任务数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """启动队列消费者"""
+        if self._queue is not None:
+            return
+        # 先创建队列再清理，清理期间的并发调用不会重复启动
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        await self._fail_stale()
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self) -> None:
+        """停止队列消费者，本进程中未完成的任务随队列丢失，标记为失败"""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._queue = None
+        try:
+            async with AsyncSessionLocal() as db:
+                await ConversionJobCRUD.fail_unfinished(db, "服务已停止，任务已中断", worker_id=self.worker_id)
+        except Exception:
+            logger.exception("关闭时标记未完成的转换任务失败，将在租约过期后由其他进程处理")
+
+    async def _fail_stale(self) -> None:
+        """将租约过期（持有进程已退出）的未完成任务标记为失败"""
+        stale_before = datetime.utcnow() - timedelta(seconds=settings.conversion_job_lease)
+        async with AsyncSessionLocal() as db:
+            interrupted = await ConversionJobCRUD.fail_unfinished(
+                db, "服务重启，任务已中断", stale_before=stale_before
+            )
+        if interrupted:
+            logger.warning("已将 %d 个中断的转换任务标记为失败", interrupted)
+
+    async def _run_heartbeat(self) -> None:
+        """定期为本进程的任务续租，并清理其他已退出进程遗留的任务"""
+        while True:
+            await asyncio.sleep(settings.conversion_job_heartbeat_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await ConversionJobCRUD.renew_lease(db, self.worker_id)
+                await self._fail_stale()
+            except Exception:
+                logger.exception("转换任务续租失败，将在下次重试")
+
+    async def submit(self, db: AsyncSession, db_document: MarkdownDocument, user_id: int) -> ConversionJob:
+        """提交转换任务
+
+        PDF已在缓存中时直接创建已完成的任务，不占用队列。
+        转换次数与任务在同一事务中写入，额度不足时抛出 QuotaExceededError。
+        """
+        if self._queue is None:
+            await self.start()
+
+        cached = lookup_pdf(
+            db_document.content,
+            db_document.title,
+            db_document.pdf_settings,
+            db_document.template_name
+        )
+        if cached is not None:
+            # 任务记录写入之前保持占用，避免缓存文件在客户端下载前被淘汰
+            try:
+                await MarkdownDocumentCRUD.increment_conversion_count(db, db_document.id, user_id)
+                return await ConversionJobCRUD.create(
+                    db, user_id, db_document.id, status=JobStatus.DONE, cache_key=cached.key,
+                    pdf_size=cached.size, original_pdf_size=cached.original_size
+                )
+            finally:
+                release_pdf(cached)
+
+        # 在等待数据库之前同步占用队列位置，并发提交不会在入队时才发现队列已满
+        if 0 < self.maxsize <= self._queue.qsize() + self._reserved:
+            raise QueueFullError("转换队列已满，请稍后重试")
+        self._reserved += 1
+        try:
+            await MarkdownDocumentCRUD.increment_conversion_count(db, db_document.id, user_id)
+            db_job = await ConversionJobCRUD.create(db, user_id, db_document.id, worker_id=self.worker_id)
+            self._queue.put_nowait(ConversionTask(
+                job_id=db_job.id,
+                document_id=db_document.id,
+                content=db_document.content,
+                title=db_document.title,
+                pdf_settings=db_document.pdf_settings,
+                template_name=db_document.template_name
+            ))
+        finally:
+            self._reserved -= 1
+        return db_job
+
+    async def _worker(self) -> None:
+        """队列消费者"""
+        while True:
+            task = await self._queue.get()
+            try:
+                await self._process(task)
+            except Exception:
+                logger.exception("转换任务 %d 处理异常", task.job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, task: ConversionTask) -> None:
+        """执行单个转换任务并记录结果"""
+        async with AsyncSessionLocal() as db:
+            await ConversionJobCRUD.mark_running(db, task.job_id)
+            try:
+                result = await get_pdf(
+                    task.content, task.title, task.pdf_settings, task.template_name
+                )
+            except ConversionError as e:
+                await ConversionJobCRUD.mark_failed(db, task.job_id, str(e))
+                return
+            try:
+                await ConversionJobCRUD.mark_done(
+                    db, task.job_id, result.key, result.size, result.original_size
+                )
+            finally:
+                release_pdf(result)
+
+
+def job_response(db_job: ConversionJob) -> ConversionJobResponse:
+    """转换任务响应，完成后附带下载地址"""
+    response = ConversionJobResponse.model_validate(db_job)
+    if db_job.status == JobStatus.DONE:
+        response.download_url = f"/api/documents/{db_job.document_id}/download"
+    return response
+
+
+# 全局转换队列实例
+conversion_queue = ConversionQueue(
+    maxsize=settings.conversion_queue_size,
+    concurrency=settings.conversion_workers,
+)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
@@ -8,17 +8,33 @@ import uvicorn
 import os
 
 from app.config import settings
-from app.api import auth, users, documents
-from db.database import create_tables
+from app.api import auth, users, documents, jobs
+from app.auth import get_current_admin_user
+from app.converter import asset_fetcher, conversion_engine, pdf_cache, pdf_templates
+from app.converter.parser import html_cache
+from app.jobs import conversion_queue
+from app.views import view_counter
+from db.database import async_engine, create_tables
+from db.models import User
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时创建数据库表
     create_tables()
+    # 编译PDF模板（写入字节码缓存，转换进程启动时直接加载）
+    pdf_templates.load()
+    # 启动PDF转换进程池
+    conversion_engine.start()
+    await conversion_queue.start()
+    await view_counter.start()
     yield
     # 关闭时的清理工作
-    pass
+    await conversion_queue.stop()
+    await view_counter.stop()
+    conversion_engine.shutdown()
+    await asset_fetcher.aclose()
+    await async_engine.dispose()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -55,6 +71,7 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(documents.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
 
 # 根路径 - 提供HTML页面
 @app.get("/", response_class=HTMLResponse)
@@ -87,6 +104,19 @@ async def health_check():
         "version": settings.app_version
     }
 
+# 缓存统计（管理员）
+@app.get("/health/cache")
+async def cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """渲染缓存命中统计，用于评估缓存容量（管理员）"""
+    return {
+        "workers": await conversion_engine.cache_stats(),
+        "server": {
+            "html": html_cache.stats(),
+            "asset": asset_fetcher.index.stats(),
+            "pdf": pdf_cache.stats(),
+        },
+    }
+
 # 模板演示页面
 @app.get("/template-demo", response_class=HTMLResponse)
 async def template_demo(request: Request):
@@ -109,7 +139,8 @@ async def http_exception_handler(request, exc):
         content={
             "error": exc.detail,
             "status_code": exc.status_code
-        }
+        },
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
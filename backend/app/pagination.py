@@ -0,0 +1,94 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, asc, desc, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无效"""
+
+
+class Page(NamedTuple):
+    """一页查询结果与前后页游标（没有更多数据时游标为空）"""
+    items: List[Any]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence[Any], backward: bool = False) -> str:
+    """将排序键编码为不透明的游标字符串"""
+    payload = {
+        "k": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        "b": backward,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _restore_key(column: Any, key: Any) -> Any:
+    """按排序列的类型还原游标中的值"""
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(key)
+    if not isinstance(key, python_type) or isinstance(key, bool):
+        raise TypeError(f"游标值类型错误: {key!r}")
+    return key
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> Tuple[List[Any], bool]:
+    """解析游标，返回（排序键, 是否向前翻页）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        keys, backward = payload["k"], payload["b"]
+        if len(keys) != len(columns) or not isinstance(backward, bool):
+            raise ValueError("游标格式错误")
+        return [_restore_key(column, key) for column, key in zip(columns, keys)], backward
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError("分页游标无效") from e
+
+
+async def keyset_paginate(
+    db: AsyncSession,
+    query: Select,
+    columns: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Page:
+    """按 columns 降序做键集分页
+
+    query 只选出一个实体；columns 可以是该实体的列或查询中可用的表达式（如相关度），
+    最后一列必须唯一（通常是主键）。翻页条件为 (列...) < (游标值...)，
+    可以直接利用以这些列结尾的索引定位，任何一页的开销都与第一页相同，不随页码增长。
+    """
+    keyset = tuple_(*columns)
+    backward = False
+    if cursor:
+        values, backward = decode_cursor(cursor, columns)
+        bound = tuple_(*[literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.where(keyset > bound if backward else keyset < bound)
+    # 向前翻页时反向排序取紧挨着游标的一页，取出后再恢复为降序
+    order = asc if backward else desc
+    query = query.add_columns(*columns).order_by(*[order(column) for column in columns]).limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = list(result.all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return Page([], None, None)
+
+    # 沿翻页方向是否还有数据由多取的一条判断；反方向只要是从游标翻过来的就一定有
+    has_next = has_more if not backward else True
+    has_prev = has_more if backward else cursor is not None
+    return Page(
+        [row[0] for row in rows],
+        encode_cursor(rows[-1][1:]) if has_next else None,
+        encode_cursor(rows[0][1:], backward=True) if has_prev else None,
+    )
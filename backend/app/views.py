@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional
+
+from app.config import settings
+from app.crud import MarkdownDocumentCRUD
+from db.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """文档查看次数的写缓冲
+
+    查看文档只在内存中为该文档计数，不产生写事务；后台任务定期把累计的增量
+    合并成一次批量更新写入数据库，服务关闭时写入剩余的计数。
+    计数只保存在本进程内存中，进程异常退出时最近一个周期的查看次数会丢失。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Counter[int] = Counter()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+
+    def record(self, doc_id: int) -> None:
+        """记录一次查看"""
+        self._pending[doc_id] += 1
+
+    async def start(self) -> None:
+        """启动定期写入任务"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定期写入并写入剩余计数"""
+        if self._task is not None:
+            # 通知后台任务退出而不是取消它，正在进行的写入不会被打断
+            self._stopping.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("关闭时写入查看次数失败，%d 次查看未记录", sum(self._pending.values()))
+
+    async def flush(self) -> None:
+        """将累计的查看次数写入数据库，失败时保留计数等待下次写入"""
+        async with self._lock:
+            if not self._pending:
+                return
+            # 写入期间新的查看计入新的计数器
+            counts, self._pending = self._pending, Counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await MarkdownDocumentCRUD.add_view_counts(db, dict(counts))
+            except Exception:
+                # 只在确定写入失败时放回计数；被取消时事务可能已经提交，放回会重复计数
+                self._pending.update(counts)
+                raise
+
+    async def _run(self) -> None:
+        """定期写入，收到停止通知后退出"""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("查看次数写入失败，将在下次重试")
+
+
+# 全局查看计数实例
+view_counter = ViewCounter(interval=settings.view_count_flush_interval)
@@ -1,12 +1,15 @@
-from .database import get_db, create_tables, drop_tables
-from .models import Base, User, MarkdownDocument, UserRole
+from .database import get_db, get_async_db, create_tables, drop_tables
+from .models import Base, User, MarkdownDocument, UserRole, ConversionJob, JobStatus
 
 __all__ = [
     "get_db",
+    "get_async_db",
     "create_tables", 
     "drop_tables",
     "Base",
     "User",
     "MarkdownDocument",
-    "UserRole"
+    "UserRole",
+    "ConversionJob",
+    "JobStatus"
 ] 
\ No newline at end of file
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -13,7 +15,24 @@ DATABASE_URL = os.getenv(
     "sqlite:///./markdown_to_pdf.db"  # 默认使用SQLite
 )
 
-# 创建数据库引擎
+# 异步驱动：SQLite使用aiosqlite，PostgreSQL使用asyncpg
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    """将数据库连接地址转换为对应异步驱动的地址，其他数据库需通过 ASYNC_DATABASE_URL 指定"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+# 请求处理使用的异步连接地址，可通过 ASYNC_DATABASE_URL 单独指定
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(DATABASE_URL)
+
+# 创建数据库引擎（建表、迁移和脚本使用）
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
@@ -21,9 +40,24 @@ engine = create_engine(
     echo=True  # 开发环境显示SQL语句
 )
 
+# 创建异步数据库引擎（接口请求使用，查询期间不阻塞事件循环）
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=True  # 开发环境显示SQL语句
+)
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步会话工厂
+# 提交后不使对象过期：异步会话中访问已过期的属性会触发隐式IO而报错
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # 创建基础模型类
 Base = declarative_base()
 
@@ -35,12 +69,21 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """获取异步数据库会话"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def create_tables():
     """创建所有表"""
     from .models import Base
+    from .search import create_search_index
     Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
 
 def drop_tables():
     """删除所有表"""
     from .models import Base
+    from .search import drop_search_index
+    drop_search_index(engine)
     Base.metadata.drop_all(bind=engine) 
\ No newline at end of file
@@ -1,17 +1,55 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum, Index, false, true
+from sqlalchemy.dialects.sqlite import DATETIME as SQLiteDateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
+import re
 
 Base = declarative_base()
 
+# 由数据库生成的时间戳：SQLite中参数按 CURRENT_TIMESTAMP 的格式（精确到秒）写入，
+# 与库中的值按字符串比较时顺序一致，游标分页的比较条件才能正确定位
+Timestamp = DateTime(timezone=True).with_variant(
+    SQLiteDateTime(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+# 文档摘要长度（字符）；生成摘要时只读取正文开头这部分
+EXCERPT_LENGTH = 200
+_EXCERPT_SCAN = 4000
+
+_FENCED_CODE_RE = re.compile(r"^(```|~~~).*?^\1", re.S | re.M)
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_TAG_RE = re.compile(r"<[^>]+>")
+_BLOCK_MARK_RE = re.compile(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", re.M)
+_INLINE_MARK_RE = re.compile(r"[*_`~]+")
+
+def make_excerpt(content: str) -> str:
+    """由Markdown正文生成纯文本摘要（去掉代码块、图片、链接地址、HTML标签与标记符号）"""
+    text = content[:_EXCERPT_SCAN]
+    text = _FENCED_CODE_RE.sub(" ", text)
+    text = _IMAGE_RE.sub(" ", text)
+    text = _LINK_RE.sub(r"\1", text)
+    text = _TAG_RE.sub(" ", text)
+    text = _BLOCK_MARK_RE.sub("", text)
+    text = _INLINE_MARK_RE.sub("", text)
+    return " ".join(text.split())[:EXCERPT_LENGTH]
+
 class UserRole(enum.Enum):
     """用户角色枚举"""
     FREE = "free"           # 免费用户
     PREMIUM = "premium"     # 会员用户
     ADMIN = "admin"         # 管理员
 
+class JobStatus(enum.Enum):
+    """转换任务状态枚举"""
+    QUEUED = "queued"       # 排队中
+    RUNNING = "running"     # 转换中
+    DONE = "done"           # 已完成
+    FAILED = "failed"       # 失败
+
 class User(Base):
     """用户表"""
     __tablename__ = "users"
@@ -59,6 +97,10 @@ class MarkdownDocument(Base):
     content = Column(Text, nullable=False)
     description = Column(Text, nullable=True)
     
+    # 正文概要，随正文一起写入，列表查询只读这两列而不加载正文
+    content_length = Column(Integer, default=0, server_default="0", nullable=False)  # 正文字符数
+    excerpt = Column(String(EXCERPT_LENGTH), nullable=True)  # 纯文本摘要
+
     # 文档状态
     is_public = Column(Boolean, default=False, nullable=False)
     is_deleted = Column(Boolean, default=False, nullable=False)
@@ -72,12 +114,58 @@ class MarkdownDocument(Base):
     conversion_count = Column(Integer, default=0, nullable=False)
     
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now(), nullable=False)
     last_converted_at = Column(DateTime(timezone=True), nullable=True)
     
     # 关系
     user = relationship("User", back_populates="markdown_documents")
     
+    # 列表查询的索引：只包含未删除的文档，列顺序与过滤条件和排序键一致，
+    # 按索引倒序读取即得到所需顺序，无需排序，游标分页可直接定位
+    __table_args__ = (
+        # 我的文档：user_id = ? AND is_deleted = false ORDER BY updated_at DESC, id DESC
+        Index(
+            "ix_markdown_documents_user_updated",
+            "user_id", "updated_at", "id",
+            sqlite_where=is_deleted == false(),
+            postgresql_where=is_deleted == false()
+        ),
+        # 公开文档：is_public = true AND is_deleted = false ORDER BY view_count DESC, id DESC
+        Index(
+            "ix_markdown_documents_public_views",
+            "view_count", "id",
+            sqlite_where=(is_public == true()) & (is_deleted == false()),
+            postgresql_where=(is_public == true()) & (is_deleted == false())
+        ),
+    )
+
+    def __repr__(self):
+        return f"<MarkdownDocument(id={self.id}, title='{self.title}', user_id={self.user_id})>"
+
+class ConversionJob(Base):
+    """PDF转换任务表"""
+    __tablename__ = "conversion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    document_id = Column(Integer, ForeignKey("markdown_documents.id"), nullable=False)
+
+    # 任务状态
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    cache_key = Column(String(64), nullable=True)  # 转换结果在PDF缓存中的键
+    pdf_size = Column(Integer, nullable=True)  # 输出PDF大小（字节）
+    original_pdf_size = Column(Integer, nullable=True)  # 体积优化前的大小，未优化时为空
+    error = Column(Text, nullable=True)
+
+    # 任务只保存在提交它的进程的内存队列中，由该进程定期续租；租约过期说明进程已退出
+    worker_id = Column(String(64), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
     def __repr__(self):
-        return f"<MarkdownDocument(id={self.id}, title='{self.title}', user_id={self.user_id})>" 
\ No newline at end of file
+        return f"<ConversionJob(id={self.id}, document_id={self.document_id}, status='{self.status.value}')>"
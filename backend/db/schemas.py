@@ -87,6 +87,61 @@ class MarkdownDocumentResponse(MarkdownDocumentBase):
     class Config:
         from_attributes = True
 
+# 文档列表项（不包含正文）
+class MarkdownDocumentSummary(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    description: Optional[str] = None
+    is_public: bool
+    template_name: Optional[str] = None
+    content_length: int = Field(..., description="正文字符数")
+    excerpt: Optional[str] = Field(None, description="正文开头的纯文本摘要")
+    view_count: int
+    conversion_count: int
+    created_at: datetime
+    updated_at: datetime
+    last_converted_at: Optional[datetime] = None
+    snippet: Optional[str] = Field(None, description="搜索结果摘要，匹配处以<mark>标出，仅搜索时返回")
+
+    class Config:
+        from_attributes = True
+
+# 批量下载Schema
+class BatchDownloadRequest(BaseModel):
+    document_ids: Optional[List[int]] = Field(None, description="文档ID列表")
+    all: bool = Field(False, description="下载我的全部文档")
+
+# 加密下载Schema
+class PdfEncryptionRequest(BaseModel):
+    password: str = Field(..., min_length=1, max_length=127, description="打开密码")
+    owner_password: Optional[str] = Field(None, min_length=1, max_length=127, description="权限密码，留空时随机生成")
+    allow_print: bool = Field(True, description="允许打印")
+    allow_copy: bool = Field(True, description="允许复制内容")
+
+# 转换任务状态枚举
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+# 转换任务Schema
+class ConversionJobResponse(BaseModel):
+    id: int
+    document_id: int
+    status: JobStatus
+    error: Optional[str] = None
+    pdf_size: Optional[int] = None
+    original_pdf_size: Optional[int] = None
+    download_url: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # 会员升级Schema
 class PremiumUpgrade(BaseModel):
     plan_type: str = Field(..., description="会员计划类型")
@@ -101,12 +156,13 @@ class UserStats(BaseModel):
 
 # 分页Schema
 class PaginationParams(BaseModel):
-    page: int = Field(1, ge=1, description="页码")
+    cursor: Optional[str] = Field(None, description="分页游标，取自上一次响应的 next_cursor 或 prev_cursor")
     size: int = Field(10, ge=1, le=100, description="每页数量")
 
 class PaginatedResponse(BaseModel):
-    items: List[MarkdownDocumentResponse]
+    items: List[MarkdownDocumentSummary]
     total: int
-    page: int
     size: int
-    pages: int 
\ No newline at end of file
+    pages: int
+    next_cursor: Optional[str] = Field(None, description="下一页游标，没有更多数据时为空")
+    prev_cursor: Optional[str] = Field(None, description="上一页游标，已是第一页时为空")
\ No newline at end of file
@@ -0,0 +1,282 @@
+import html
+import re
+import unicodedata
+from typing import Iterator, List, Optional
+
+from sqlalchemy import (
+    Float,
+    bindparam,
+    cast,
+    column,
+    false,
+    func,
+    select,
+    table,
+    text,
+    type_coerce,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+# 全文索引表：SQLite中为FTS5虚拟表（rowid即文档ID），PostgreSQL中为带GIN索引的tsvector列
+SEARCH_TABLE = "markdown_document_search"
+
+# 支持全文索引的数据库，其他数据库搜索时退回逐行匹配
+SEARCH_DIALECTS = ("sqlite", "postgresql")
+
+# 相关度中各字段的权重：标题 > 描述 > 正文
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+
+# PostgreSQL的单个tsvector不能超过1MB，正文只索引开头这部分
+PG_MAX_INDEXED_CONTENT = 200_000
+
+# 中日韩文字（假名、汉字、谚文）：没有空格分词，按相邻两字切分
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+_SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(owner, title, description, content)",
+]
+
+_POSTGRES_DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        document_id INTEGER PRIMARY KEY REFERENCES markdown_documents(id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL,
+        search_vector TSVECTOR NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_vector ON {SEARCH_TABLE} USING GIN (search_vector)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_user_id ON {SEARCH_TABLE} (user_id)",
+]
+
+_SQLITE_UPSERT = text(
+    f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, owner, title, description, content) "
+    "VALUES (:document_id, :owner, :title, :description, :content)"
+)
+
+_POSTGRES_UPSERT = text(
+    f"""INSERT INTO {SEARCH_TABLE} (document_id, user_id, search_vector)
+    VALUES (
+        :document_id,
+        :user_id,
+        setweight(to_tsvector('simple', :title), 'A')
+        || setweight(to_tsvector('simple', :description), 'B')
+        || setweight(to_tsvector('simple', :content), 'C')
+    )
+    ON CONFLICT (document_id) DO UPDATE
+    SET user_id = EXCLUDED.user_id, search_vector = EXCLUDED.search_vector"""
+)
+
+_SQLITE_DELETE = text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :document_id")
+_POSTGRES_DELETE = text(f"DELETE FROM {SEARCH_TABLE} WHERE document_id = :document_id")
+
+
+def _normalize(value: str) -> str:
+    """统一全角/半角与大小写"""
+    return unicodedata.normalize("NFKC", value).lower()
+
+
+def _run_tokens(run: str, last: bool = False) -> List[str]:
+    """切分一段连续文字
+
+    中日韩文字按相邻两字切分，末尾再补一个单字，使任意单字都是某个词的开头。
+    last 为真表示这是搜索词的最后一段，文档中同一段可能还有后续文字，
+    因此不补末尾单字；只有一个字时改为前缀词（以 * 结尾）。
+    """
+    if not _CJK_RE.match(run):
+        return [run]
+    tokens = [run[index:index + 2] for index in range(len(run) - 1)]
+    if not last:
+        tokens.append(run[-1])
+    elif not tokens:
+        tokens.append(run + "*")
+    return tokens
+
+
+def tokenize(value: str) -> Iterator[str]:
+    """索引用分词：拉丁字母与数字按词切分，中日韩文字按相邻两字切分"""
+    for run in _TOKEN_RE.findall(_normalize(value)):
+        yield from _run_tokens(run)
+
+
+def index_text(value: Optional[str]) -> str:
+    """分词后以空格连接的索引文本"""
+    return " ".join(tokenize(value or ""))
+
+
+def parse_query(search_term: str) -> List[List[str]]:
+    """将搜索词解析为若干短语，每个短语是在文档中按顺序相邻的词"""
+    phrases = []
+    for term in search_term.split():
+        runs = _TOKEN_RE.findall(_normalize(term))
+        tokens = [
+            token
+            for index, run in enumerate(runs)
+            for token in _run_tokens(run, last=index == len(runs) - 1)
+        ]
+        if tokens:
+            phrases.append(tokens)
+    return phrases
+
+
+def _fts5_query(phrases: List[List[str]], user_id: int) -> str:
+    """FTS5查询表达式：限定所有者，各短语同时出现在标题、描述或正文中"""
+    def phrase(tokens: List[str]) -> str:
+        if tokens[-1].endswith("*"):
+            return '"' + " ".join(tokens[:-1] + [tokens[-1][:-1]]) + '"*'
+        return '"' + " ".join(tokens) + '"'
+
+    terms = " AND ".join(phrase(tokens) for tokens in phrases)
+    return f"owner : u{user_id} AND {{title description content}} : ({terms})"
+
+
+def _tsquery(phrases: List[List[str]]) -> str:
+    """PostgreSQL tsquery表达式：短语内用 <-> 表示相邻，前缀词用 :*"""
+    def lexeme(token: str) -> str:
+        if token.endswith("*"):
+            return f"'{token[:-1]}':*"
+        return f"'{token}'"
+
+    return " & ".join(
+        "(" + " <-> ".join(lexeme(token) for token in tokens) + ")" for tokens in phrases
+    )
+
+
+def search_hits(dialect: str, user_id: int, search_term: str) -> Optional[Select]:
+    """匹配文档的查询：(document_id, relevance)，relevance 越大越相关
+
+    搜索词中没有可检索的内容时返回 None。
+    """
+    phrases = parse_query(search_term)
+    if not phrases:
+        return None
+
+    if dialect == "postgresql":
+        index = table(SEARCH_TABLE, column("document_id"), column("user_id"), column("search_vector"))
+        query = func.to_tsquery("simple", bindparam("search_query", _tsquery(phrases)))
+        return select(
+            index.c.document_id,
+            cast(func.ts_rank_cd(index.c.search_vector, query), Float).label("relevance"),
+        ).where(
+            index.c.user_id == user_id,
+            index.c.search_vector.op("@@")(query),
+        )
+
+    # bm25 分数越小越相关，取负值使排序方向与PostgreSQL一致
+    bm25 = func.bm25(
+        text(SEARCH_TABLE), 0.0, TITLE_WEIGHT, DESCRIPTION_WEIGHT, CONTENT_WEIGHT
+    )
+    return select(
+        column("rowid").label("document_id"),
+        type_coerce(-bm25, Float).label("relevance"),
+    ).select_from(text(SEARCH_TABLE)).where(
+        text(f"{SEARCH_TABLE} MATCH :search_query").bindparams(
+            search_query=_fts5_query(phrases, user_id)
+        )
+    )
+
+
+def _index_params(dialect: str, document_id: int, user_id: int, title: str, description: Optional[str], content: str) -> dict:
+    """写入索引的参数"""
+    if dialect == "postgresql":
+        content = content[:PG_MAX_INDEXED_CONTENT]
+    return {
+        "document_id": document_id,
+        "user_id": user_id,
+        "owner": f"u{user_id}",
+        "title": index_text(title),
+        "description": index_text(description),
+        "content": index_text(content),
+    }
+
+
+async def index_document(db: AsyncSession, document) -> None:
+    """写入或更新文档的索引（与文档修改在同一事务中提交）"""
+    dialect = db.bind.dialect.name
+    if dialect not in SEARCH_DIALECTS:
+        return
+    statement = _POSTGRES_UPSERT if dialect == "postgresql" else _SQLITE_UPSERT
+    await db.execute(statement, _index_params(
+        dialect, document.id, document.user_id, document.title, document.description, document.content
+    ))
+
+
+async def remove_document(db: AsyncSession, document_id: int) -> None:
+    """从索引中移除文档（与文档删除在同一事务中提交）"""
+    dialect = db.bind.dialect.name
+    if dialect not in SEARCH_DIALECTS:
+        return
+    statement = _POSTGRES_DELETE if dialect == "postgresql" else _SQLITE_DELETE
+    await db.execute(statement, {"document_id": document_id})
+
+
+def _search_table_exists(connection: Connection) -> bool:
+    """索引表是否已存在"""
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": SEARCH_TABLE}
+        ).scalar()
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SEARCH_TABLE}
+    ).first() is not None
+
+
+def create_search_index(engine: Engine) -> None:
+    """创建全文索引；新建时为已有文档补建索引"""
+    from .models import MarkdownDocument
+
+    with engine.begin() as connection:
+        dialect = connection.dialect.name
+        if dialect not in SEARCH_DIALECTS or _search_table_exists(connection):
+            return
+        for statement in _POSTGRES_DDL if dialect == "postgresql" else _SQLITE_DDL:
+            connection.execute(text(statement))
+
+        upsert = _POSTGRES_UPSERT if dialect == "postgresql" else _SQLITE_UPSERT
+        documents = connection.execution_options(yield_per=100).execute(
+            select(
+                MarkdownDocument.id,
+                MarkdownDocument.user_id,
+                MarkdownDocument.title,
+                MarkdownDocument.description,
+                MarkdownDocument.content,
+            ).where(MarkdownDocument.is_deleted == false())
+        )
+        for partition in documents.partitions():
+            connection.execute(upsert, [_index_params(dialect, *row) for row in partition])
+
+
+def drop_search_index(engine: Engine) -> None:
+    """删除全文索引"""
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def search_snippet(value: Optional[str], search_term: str, width: int = 120) -> Optional[str]:
+    """截取包含搜索词的片段，匹配处以 <mark> 标出（其余内容已转义，可直接插入页面）"""
+    if not value:
+        return None
+    terms = sorted({term for term in search_term.split() if term}, key=len, reverse=True)
+    if not terms:
+        return None
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    match = pattern.search(value)
+    if match is None:
+        return None
+
+    start = max(0, match.start() - width // 3)
+    end = min(len(value), start + width)
+    excerpt = value[start:end]
+    parts = []
+    position = 0
+    for found in pattern.finditer(excerpt):
+        parts.append(html.escape(excerpt[position:found.start()]))
+        parts.append(f"<mark>{html.escape(found.group(0))}</mark>")
+        position = found.end()
+    parts.append(html.escape(excerpt[position:]))
+    snippet = " ".join("".join(parts).split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(value) else "")
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+离线转换性能测试
+
+复用 test/cases.py 中的样本，外加合成的大文档与中文密集文档，逐个在全新的子进程中
+以冷缓存执行完整转换流程，记录各阶段耗时（解析、图片预取、代码高亮、排版、PDF写入）、
+峰值内存与输出大小，并与保存的基线比较，超出容差时以非零状态退出。
+
+    uv run python scripts/benchmark.py                    # 与基线比较
+    uv run python scripts/benchmark.py --update-baseline  # 以本次结果作为新基线
+
+文档中的网络图片改为指向本地HTTP服务，测试过程不访问外网。
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from queue import Empty
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+TEST_DIR = BACKEND_DIR.parent / "test"
+DEFAULT_BASELINE = BACKEND_DIR / "scripts" / "benchmark_baseline.json"
+
+STAGES = ["parse", "highlight", "assets", "layout", "pdf_write"]
+
+_IMAGE_URL_RE = re.compile(r"(!\[[^\]]*\]\()https?://[^/)\s]+")
+
+
+def make_image(width: int, height: int, image_format: str) -> bytes:
+    """生成测试图片（渐变色，避免被过度压缩）"""
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, image_format)
+    return output.getvalue()
+
+
+class ImageServer:
+    """本地图片服务，替代文档中的网络图片"""
+
+    def __init__(self):
+        images = {
+            "/photo.png": (make_image(3000, 2000, "PNG"), "image/png"),
+            "/photo.jpg": (make_image(4000, 3000, "JPEG"), "image/jpeg"),
+            "/icon.png": (make_image(64, 64, "PNG"), "image/png"),
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                image = images.get(self.path)
+                if image is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", image[1])
+                self.send_header("Content-Length", str(len(image[0])))
+                self.end_headers()
+                self.wfile.write(image[0])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def origin(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self) -> "ImageServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def large_document(size: int) -> str:
+    """合成的大文档：标题、段落、列表、表格、代码块和图片交替出现"""
+    rng = random.Random(1)
+    words = ["markdown", "pdf", "render", "layout", "cache", "font", "page", "table", "image", "code"]
+    parts: List[str] = []
+    total = 0
+    chapter = 0
+    while total < size:
+        chapter += 1
+        block = [f"# 第{chapter}章 Chapter {chapter}", ""]
+        for section in range(1, 4):
+            block += [f"## {chapter}.{section} 小节", ""]
+            block.append(" ".join(rng.choice(words) for _ in range(120)) + "。")
+            block.append("")
+            block += [f"- 列表项 {i}: " + " ".join(rng.choice(words) for _ in range(8)) for i in range(5)]
+            block += ["", "| 名称 | 数值 | 说明 |", "| --- | ---: | --- |"]
+            block += [f"| item{i} | {rng.randint(0, 10000)} | {rng.choice(words)} |" for i in range(8)]
+            block += ["", "```python"]
+            block += [f"def func_{chapter}_{section}_{i}(x):\n    return x * {i} + {rng.randint(0, 99)}" for i in range(4)]
+            block += ["```", ""]
+        block += ["![图片](https://example.com/photo.png)", ""]
+        text = "\n".join(block) + "\n"
+        parts.append(text)
+        total += len(text.encode("utf-8"))
+    return "".join(parts)
+
+
+def cjk_document(size: int) -> str:
+    """合成的中文密集文档：使用大量不同汉字，覆盖字体子集化的开销"""
+    rng = random.Random(2)
+    characters = [chr(code) for code in range(0x4E00, 0x4E00 + 6000)]
+    parts: List[str] = []
+    total = 0
+    chapter = 0
+    while total < size:
+        chapter += 1
+        paragraphs = [
+            "".join(rng.choice(characters) for _ in range(300)) + "。" for _ in range(6)
+        ]
+        text = f"# 第{chapter}章\n\n" + "\n\n".join(paragraphs) + "\n\n"
+        parts.append(text)
+        total += len(text.encode("utf-8"))
+    return "".join(parts)
+
+
+def load_cases(large_size: int) -> Dict[str, str]:
+    """测试样本：在线测试的样本加上合成文档"""
+    sys.path.insert(0, str(TEST_DIR))
+    try:
+        from cases import CASES
+    finally:
+        sys.path.remove(str(TEST_DIR))
+
+    cases = dict(CASES)
+    cases["large_synthetic"] = large_document(large_size)
+    cases["cjk_heavy"] = cjk_document(large_size // 4)
+    return cases
+
+
+def run_case(content: str, cache_dir: str, queue: "multiprocessing.Queue[Any]") -> None:
+    """在子进程中以冷缓存执行一次完整转换，结果放入 queue"""
+    # 配置在导入应用模块时读取，必须先设置环境变量
+    os.environ.update({
+        "PDF_CACHE_DIR": os.path.join(cache_dir, "pdf"),
+        "ASSET_CACHE_DIR": os.path.join(cache_dir, "assets"),
+        "DIAGRAM_CACHE_DIR": os.path.join(cache_dir, "diagrams"),
+        "FONT_CACHE_DIR": os.path.join(cache_dir, "fonts"),
+        "TEMPLATE_BYTECODE_CACHE_DIR": os.path.join(cache_dir, "templates"),
+        "FRAGMENT_CACHE_PATH": os.path.join(cache_dir, "fragments.sqlite3"),
+        # 图片来自本机的测试服务
+        "ASSET_ALLOWED_PRIVATE_HOSTS": '["127.0.0.1"]',
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    try:
+        import asyncio
+        import resource
+
+        from app.converter import parser
+        from app.converter.assets import asset_fetcher
+        from app.converter.fonts import font_subset_cache, install_font_subset_cache
+        from app.converter.options import PdfOptions
+        from app.converter.renderer import build_document_html, layout_document
+        from app.converter.sanitize import sanitize_html
+        from app.converter.templates import pdf_templates
+
+        # 与常驻转换进程一致，模板加载不计入转换耗时
+        pdf_templates.load(parse_stylesheets=True)
+        install_font_subset_cache(font_subset_cache)
+        options = PdfOptions()
+        timings: Dict[str, float] = {}
+
+        # 统计解析过程中代码高亮的耗时
+        highlight_code_blocks = parser.highlight_code_blocks
+        highlight_time = [0.0]
+
+        def timed_highlight(html: str) -> str:
+            start = time.perf_counter()
+            try:
+                return highlight_code_blocks(html)
+            finally:
+                highlight_time[0] += time.perf_counter() - start
+
+        parser.highlight_code_blocks = timed_highlight
+        start = time.perf_counter()
+        body = sanitize_html(parser.markdown_to_html(content))
+        elapsed = time.perf_counter() - start
+        timings["highlight"] = highlight_time[0]
+        timings["parse"] = elapsed - highlight_time[0]
+
+        async def fetch_assets() -> Dict[str, Any]:
+            try:
+                return await asset_fetcher.prepare(body, options)
+            finally:
+                await asset_fetcher.aclose()
+
+        start = time.perf_counter()
+        assets = asyncio.run(fetch_assets())
+        timings["assets"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        document = layout_document(build_document_html(body, "benchmark", options), None, assets)
+        timings["layout"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pdf = document.write_pdf()
+        timings["pdf_write"] = time.perf_counter() - start
+
+        queue.put({
+            "timings": timings,
+            "pages": len(document.pages),
+            "pdf_size": len(pdf),
+            # Linux下单位为KB
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        })
+    except BaseException as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def collect(process: Any, queue: Any, timeout: float) -> Dict[str, Any]:
+    """等待子进程返回结果；子进程异常退出（如被OOM终止）或超时时返回失败结果"""
+    deadline = time.monotonic() + timeout
+    result: Optional[Dict[str, Any]] = None
+    while result is None:
+        try:
+            result = queue.get(timeout=0.5)
+        except Empty:
+            if process.exitcode is not None:
+                # 退出后再读一次，避免结果写入与进程退出的先后竞争
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {"error": f"子进程异常退出，退出码 {process.exitcode}"}
+            elif time.monotonic() > deadline:
+                process.kill()
+                result = {"error": f"超过 {timeout:.0f}s 未完成"}
+    process.join()
+    return result
+
+
+def measure(content: str, repeat: int, timeout: float) -> Dict[str, Any]:
+    """多次测量取各阶段中位数，峰值内存取最大值"""
+    context = multiprocessing.get_context("spawn")
+    runs: List[Dict[str, Any]] = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(content, cache_dir, queue))
+            process.start()
+            result = collect(process, queue, timeout)
+        if "error" in result:
+            return result
+        runs.append(result)
+
+    timings = {
+        stage: statistics.median(run["timings"][stage] for run in runs) for stage in STAGES
+    }
+    return {
+        "timings": timings,
+        "total": sum(timings.values()),
+        "input_size": len(content.encode("utf-8")),
+        "pages": runs[0]["pages"],
+        "pdf_size": runs[0]["pdf_size"],
+        "peak_rss": max(run["peak_rss"] for run in runs),
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    tolerance: float,
+    min_delta: float
+) -> List[str]:
+    """与基线比较，返回回退说明（总耗时、峰值内存、输出大小）"""
+    regressions: List[str] = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        # 输入大小不同（例如 --large-size 不同）的结果不可比较，由调用方提前报告
+        if base is None or "error" in result or base.get("input_size") != result["input_size"]:
+            continue
+        if result["total"] > base["total"] * (1 + tolerance) and result["total"] - base["total"] > min_delta:
+            regressions.append(f"{name}: 总耗时 {base['total']:.3f}s -> {result['total']:.3f}s")
+        for field in ("peak_rss", "pdf_size"):
+            if result[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{name}: {field} {base[field]} -> {result[field]}")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, Any]]) -> None:
+    header = f"{'用例':<18}" + "".join(f"{stage:>11}" for stage in STAGES)
+    header += f"{'总计':>10}{'页数':>7}{'峰值内存MB':>12}{'PDF KB':>10}"
+    print(header)
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<18}失败: {result['error']}")
+            continue
+        row = f"{name:<18}" + "".join(f"{result['timings'][stage]:>11.3f}" for stage in STAGES)
+        row += f"{result['total']:>10.3f}{result['pages']:>7}"
+        row += f"{result['peak_rss'] / 1024 / 1024:>12.1f}{result['pdf_size'] / 1024:>10.1f}"
+        print(row)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="离线转换性能测试")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的测量次数")
+    parser.add_argument("--case", action="append", help="只运行指定用例（可重复）")
+    parser.add_argument("--large-size", type=int, default=512 * 1024, help="合成大文档的大小（字节）")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--update-baseline", action="store_true", help="以本次结果覆盖基线")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对回退比例")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="耗时回退的最小绝对值（秒）")
+    parser.add_argument("--timeout", type=float, default=600, help="单次测量的超时时间（秒）")
+    parser.add_argument("--output", type=Path, help="将结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.large_size)
+    if args.case:
+        unknown = set(args.case) - set(cases)
+        if unknown:
+            parser.error(f"未知用例: {', '.join(sorted(unknown))}")
+        cases = {name: cases[name] for name in args.case}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with ImageServer() as server:
+        for name, content in cases.items():
+            print(f"运行 {name} ...", file=sys.stderr)
+            content = _IMAGE_URL_RE.sub(lambda m: m.group(1) + server.origin, content)
+            results[name] = measure(content, args.repeat, args.timeout)
+
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    failed = [name for name, result in results.items() if "error" in result]
+    if failed:
+        print(f"\n用例运行失败: {', '.join(failed)}")
+        return 1
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n基线已更新: {args.baseline}")
+        return 0
+
+    # 新检出的仓库或CI中可能还没有基线：明确提示并跳过比较，不作为失败
+    if not args.baseline.exists():
+        print(f"\n没有基线文件，跳过性能比较；请在参考机器上运行 --update-baseline 生成并提交: {args.baseline}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    missing = [
+        name for name, result in results.items()
+        if name not in baseline or baseline[name].get("input_size") != result["input_size"]
+    ]
+    if missing:
+        print(f"\n基线中没有可比较的结果，跳过这些用例（运行 --update-baseline 补充）: {', '.join(missing)}")
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    if regressions:
+        print("\n性能回退:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\n未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
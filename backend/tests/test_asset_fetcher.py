@@ -0,0 +1,232 @@
+"""图片预取测试
+
+在本地启动HTTP服务器提供图片，检查超时替换为占位图、ETag条件请求重新验证、
+单主机并发数限制、按纸张尺寸缩小图片，以及拒绝访问非公网地址（包括重定向）。
+"""
+import asyncio
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.converter.assets import (
+    PLACEHOLDER_MEDIA_TYPE,
+    AssetFetcher,
+    UnsafeUrlError,
+    check_public_url,
+    max_image_pixels,
+)
+from app.converter.cache import PdfCache
+from app.converter.fragments import FragmentCache, FragmentStore
+from app.converter.options import PdfOptions
+
+ETAG = '"v1"'
+
+
+def png_bytes(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, "PNG")
+    return output.getvalue()
+
+
+SMALL_PNG = png_bytes(20, 10)
+LARGE_PNG = png_bytes(4000, 100)
+
+
+class ImageServer(ThreadingHTTPServer):
+    """记录请求、并发数的图片服务器"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ImageHandler)
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # /slow：超过读取超时才返回；/busy：稍作停顿以便观察并发数；/large：大图；
+    # /redirect?to=地址：重定向到指定地址
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/redirect?to="):
+                self.send_response(302)
+                self.send_header("Location", self.path[len("/redirect?to="):])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if self.path.startswith("/slow"):
+                time.sleep(1.5)
+            elif self.path.startswith("/busy"):
+                time.sleep(0.2)
+
+            if self.path.startswith("/etag") and self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.send_header("ETag", ETAG)
+                self.end_headers()
+                return
+
+            body = LARGE_PNG if self.path.startswith("/large") else SMALL_PNG
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            if self.path.startswith("/etag"):
+                self.send_header("ETag", ETAG)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    image_server = ImageServer()
+    thread = threading.Thread(target=image_server.serve_forever, daemon=True)
+    thread.start()
+    yield image_server
+    image_server.shutdown()
+    image_server.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    """使用临时目录的预取器"""
+    monkeypatch.setattr(settings, "asset_fetch_timeout", 0.5)
+    monkeypatch.setattr(settings, "asset_connect_timeout", 0.5)
+    monkeypatch.setattr(settings, "asset_stage_timeout", 5.0)
+    monkeypatch.setattr(settings, "asset_fresh_seconds", 300)
+    # 测试服务在本机，只放行 127.0.0.1（localhost 仍按回环地址拒绝）
+    monkeypatch.setattr(settings, "asset_allowed_private_hosts", ["127.0.0.1"])
+    store = FragmentStore(str(tmp_path / "fragments.sqlite3"), 1000)
+    return AssetFetcher(
+        PdfCache(str(tmp_path / "assets"), 64 * 1024 * 1024, suffix=".asset"),
+        FragmentCache("asset", store, 100),
+    )
+
+
+def prepare(fetcher, urls):
+    """预取一组图片（每次使用新的事件循环，结束时关闭连接池）"""
+    html = "".join(f'<img src="{url}">' for url in urls)
+
+    async def run():
+        try:
+            return await fetcher.prepare(html, PdfOptions())
+        finally:
+            await fetcher.aclose()
+
+    return asyncio.run(run())
+
+
+def test_timeout_uses_placeholder(server, fetcher):
+    ok, slow = server.url("/ok.png"), server.url("/slow.png")
+    assets = prepare(fetcher, [ok, slow])
+
+    assert not assets[ok].fallback
+    assert assets[slow].fallback
+    assert assets[slow].media_type == PLACEHOLDER_MEDIA_TYPE
+
+    # 失败记录有效期内不再请求
+    requests = len(server.requests)
+    assert prepare(fetcher, [slow])[slow].fallback
+    assert len(server.requests) == requests
+
+
+def test_revalidates_with_etag(server, fetcher, monkeypatch):
+    url = server.url("/etag.png")
+    first = prepare(fetcher, [url])[url]
+    assert len(server.requests) == 1
+
+    # 有效期内直接使用本地文件
+    assert prepare(fetcher, [url])[url] == first
+    assert len(server.requests) == 1
+
+    monkeypatch.setattr(settings, "asset_fresh_seconds", 0)
+    second = prepare(fetcher, [url])[url]
+    _, headers = server.requests[-1]
+    assert len(server.requests) == 2
+    assert headers.get("If-None-Match") == ETAG
+    assert second == first
+    with open(second.path, "rb") as f:
+        assert f.read() == SMALL_PNG
+
+
+def test_limits_connections_per_host(server, fetcher, monkeypatch):
+    monkeypatch.setattr(settings, "asset_per_host_connections", 2)
+    urls = [server.url(f"/busy{index}.png") for index in range(6)]
+    assets = prepare(fetcher, urls)
+
+    assert len(server.requests) == 6
+    assert server.max_active == 2
+    assert not any(asset.fallback for asset in assets.values())
+
+
+def test_downscales_large_images(server, fetcher, monkeypatch):
+    monkeypatch.setattr(settings, "image_target_dpi", 72)
+    url = server.url("/large.png")
+    asset = prepare(fetcher, [url])[url]
+
+    max_width, max_height = max_image_pixels(PdfOptions(), 72)
+    with Image.open(asset.path) as image:
+        assert image.width <= max_width
+        assert image.height <= max_height
+        assert image.width < 4000
+    assert asset.media_type == "image/png"
+
+
+def test_rejects_private_addresses(server, fetcher, monkeypatch):
+    monkeypatch.setattr(settings, "asset_allowed_private_hosts", [])
+    url = server.url("/ok.png")
+    assert prepare(fetcher, [url])[url].fallback
+    assert server.requests == []
+
+
+def test_checks_every_redirect_hop(server, fetcher):
+    port = server.server_address[1]
+    allowed = server.url(f"/redirect?to=http://127.0.0.1:{port}/ok.png")
+    private = server.url(f"/redirect?to=http://localhost:{port}/ok.png")
+    assets = prepare(fetcher, [allowed, private])
+
+    assert not assets[allowed].fallback
+    assert assets[private].fallback
+    # 指向 localhost 的重定向没有被跟随
+    assert [path for path, _ in server.requests].count("/ok.png") == 1
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/a.png",
+    "http://localhost/a.png",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.1/a.png",
+    "http://192.168.1.1/a.png",
+    "http://[::1]/a.png",
+    "http://[::ffff:127.0.0.1]/a.png",
+    "http://0.0.0.0/a.png",
+    "file:///etc/passwd",
+])
+def test_check_public_url_rejects(url):
+    with pytest.raises(UnsafeUrlError):
+        asyncio.run(check_public_url(url))
+
+
+def test_check_public_url_accepts_public_address():
+    asyncio.run(check_public_url("https://93.184.216.34/a.png"))
@@ -0,0 +1,51 @@
+"""逐块渲染测试
+
+逐块渲染并缓存的结果必须与整篇交给Markdown渲染的结果完全一致。
+"""
+import markdown
+import pytest
+
+from app.converter import parser
+from app.converter.fragments import FragmentCache, FragmentStore
+from app.converter.highlight import highlight_code_blocks
+
+DOCUMENTS = {
+    "comment": "para\n\n<!-- first\n\nsecond -->\n\nafter",
+    "inline_comment": "<!-- note -->\n\ntext",
+    "definition_list": "Term\n\n:   one\n\n:   two\n\nnext",
+    "definition_items": "Apple\n:   fruit\n\n    more text\n\nOrange\n:   citrus\n\nend",
+    "footnote": "text[^1]\n\n[^1]: note\n\n    more\n\nafter",
+    "fenced_code": "before\n\n```python\na = 1\n\n\nb = 2\n```\n\nafter",
+    "raw_html": "a\n\n<div>\nhello\n</div>\n\nb\n\n<table><tr><td>x</td></tr></table>\n\nc",
+    "raw_html_last": "a\n\n<div>\n\nhello\n\n</div>",
+    "loose_list": "- a\n\n- b\n\n    continued\n\nend",
+    "duplicate_headings": "# A\n\ntext\n\n# A\n\n## B",
+}
+
+
+@pytest.fixture(autouse=True)
+def block_cache(tmp_path, monkeypatch):
+    """使用临时目录的片段缓存"""
+    store = FragmentStore(str(tmp_path / "fragments.sqlite3"), 1000)
+    monkeypatch.setattr(parser, "block_cache", FragmentCache("block", store, 100))
+
+
+def render_whole(content):
+    md = markdown.Markdown(extensions=parser.MARKDOWN_EXTENSIONS, output_format="html")
+    return highlight_code_blocks(md.convert(content))
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_blockwise_matches_whole_document(name):
+    content = DOCUMENTS[name]
+    assert parser.markdown_to_html(content) == render_whole(content)
+    # 第二次渲染命中块缓存，结果不变
+    assert parser.markdown_to_html(content) == render_whole(content)
+
+
+def test_comment_stays_in_one_block():
+    assert parser.split_blocks("a\n\n<!-- x\n\ny -->\n\nb") == ["a", "<!-- x\n\ny -->", "b"]
+
+
+def test_definition_joins_its_term():
+    assert parser.split_blocks("Term\n\n:   one\n\nnext") == ["Term\n\n:   one", "next"]
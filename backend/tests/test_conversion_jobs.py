@@ -0,0 +1,156 @@
+"""转换队列的任务恢复测试（SQLite）
+
+多个进程共用数据库时，启动和关闭只能处理租约已过期或属于本进程的未完成任务，
+不能影响其他存活进程正在执行的任务。失败和中断的任务退还提交时计入的转换次数。
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import jobs
+from app.config import settings
+from app.converter import ConversionError
+from db.models import Base, ConversionJob, JobStatus, MarkdownDocument, User, UserRole
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """建好表、写入一个用户和一篇文档的SQLite数据库，转换队列使用该数据库"""
+    path = tmp_path / "jobs.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert().values(
+            id=1,
+            username="user1",
+            email="user1@example.com",
+            hashed_password="x",
+            role=UserRole.FREE,
+            is_active=True,
+            is_verified=False,
+            total_documents=1,
+            total_conversions=0,
+        ))
+        connection.execute(MarkdownDocument.__table__.insert().values(
+            id=1, user_id=1, title="文档", content="内容", conversion_count=0
+        ))
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "AsyncSessionLocal", factory)
+    yield factory
+    asyncio.run(async_engine.dispose())
+
+
+async def add_job(factory, worker_id, heartbeat_at):
+    """写入一个未完成的任务，与提交时一样计入转换次数"""
+    async with factory() as db:
+        await jobs.MarkdownDocumentCRUD.increment_conversion_count(db, 1, 1)
+        db_job = ConversionJob(
+            user_id=1, document_id=1, status=JobStatus.QUEUED,
+            worker_id=worker_id, heartbeat_at=heartbeat_at,
+        )
+        db.add(db_job)
+        await db.commit()
+        return db_job.id
+
+
+async def statuses(factory):
+    async with factory() as db:
+        result = await db.execute(select(ConversionJob.id, ConversionJob.status))
+        return dict(result.all())
+
+
+async def usage(factory):
+    """（用户转换次数, 文档转换次数）"""
+    async with factory() as db:
+        user = await db.get(User, 1)
+        doc = await db.get(MarkdownDocument, 1)
+        return user.total_conversions, doc.conversion_count
+
+
+def test_recovery_keeps_jobs_of_live_workers(session_factory):
+    queue = jobs.ConversionQueue(maxsize=10, concurrency=1)
+
+    async def run():
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.conversion_job_lease + 60)
+        live = await add_job(session_factory, "other", now)
+        crashed = await add_job(session_factory, "crashed", stale)
+        legacy = await add_job(session_factory, None, None)
+        mine = await add_job(session_factory, queue.worker_id, now)
+
+        assert await usage(session_factory) == (4, 4)
+        await queue.start()
+        after_start = await statuses(session_factory)
+        # 中断的任务退还转换次数
+        assert await usage(session_factory) == (2, 2)
+        await queue.stop()
+        after_stop = await statuses(session_factory)
+        assert await usage(session_factory) == (1, 1)
+        return live, crashed, legacy, mine, after_start, after_stop
+
+    live, crashed, legacy, mine, after_start, after_stop = asyncio.run(run())
+
+    # 启动时只处理租约过期和没有持有进程的任务
+    assert after_start[live] == JobStatus.QUEUED
+    assert after_start[mine] == JobStatus.QUEUED
+    assert after_start[crashed] == JobStatus.FAILED
+    assert after_start[legacy] == JobStatus.FAILED
+    # 关闭时只处理本进程的任务
+    assert after_stop[mine] == JobStatus.FAILED
+    assert after_stop[live] == JobStatus.QUEUED
+
+
+def test_heartbeat_renews_own_jobs(session_factory):
+    queue = jobs.ConversionQueue(maxsize=10, concurrency=1)
+    old = datetime.utcnow() - timedelta(seconds=30)
+
+    async def run():
+        mine = await add_job(session_factory, queue.worker_id, old)
+        other = await add_job(session_factory, "other", old)
+        async with session_factory() as db:
+            renewed = await jobs.ConversionJobCRUD.renew_lease(db, queue.worker_id)
+        async with session_factory() as db:
+            result = await db.execute(select(ConversionJob.id, ConversionJob.heartbeat_at))
+            heartbeats = dict(result.all())
+        return renewed, heartbeats[mine], heartbeats[other]
+
+    renewed, mine, other = asyncio.run(run())
+    assert renewed == 1
+    assert mine.replace(tzinfo=None) > old
+    assert other.replace(tzinfo=None) == old
+
+
+def test_failed_conversion_is_refunded(session_factory, monkeypatch):
+    async def fail(*args):
+        raise ConversionError("PDF转换失败: 测试")
+
+    monkeypatch.setattr(jobs, "lookup_pdf", lambda *args: None)
+    monkeypatch.setattr(jobs, "get_pdf", fail)
+    queue = jobs.ConversionQueue(maxsize=10, concurrency=1)
+
+    async def run():
+        async with session_factory() as db:
+            document = await db.get(MarkdownDocument, 1)
+            db_job = await queue.submit(db, document, 1)
+        charged = await usage(session_factory)
+        await queue._queue.join()
+        refunded = await usage(session_factory)
+        async with session_factory() as db:
+            # 已失败的任务不会被再次退还
+            await jobs.ConversionJobCRUD.mark_failed(db, db_job.id, "重复标记")
+        again = await usage(session_factory)
+        job_status = (await statuses(session_factory))[db_job.id]
+        await queue.stop()
+        return charged, refunded, again, job_status
+
+    charged, refunded, again, job_status = asyncio.run(run())
+    assert charged == (1, 1)
+    assert refunded == (0, 0)
+    assert again == (0, 0)
+    assert job_status == JobStatus.FAILED
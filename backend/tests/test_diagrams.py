@@ -0,0 +1,65 @@
+"""图表渲染测试
+
+WeasyPrint无法渲染 <foreignObject>，生成的SVG中的标签必须是原生的 <text>。
+没有安装 mermaid-cli 时用一个按同样规则读取配置的替身检查调用参数。
+"""
+import asyncio
+import shutil
+import stat
+import sys
+
+import pytest
+
+from app.config import settings
+from app.converter.cache import PdfCache
+from app.converter.diagrams import DIAGRAM_SUFFIX, DiagramRenderer
+from app.converter.fragments import FragmentCache, FragmentStore
+
+FLOWCHART = "graph TD\n  A[开始] --> B{判断}\n  B -->|是| C[结束]"
+
+# 替身：读取 -c 指定的配置，未关闭 htmlLabels 时与 Mermaid 一样输出 foreignObject
+FAKE_MMDC = """#!{python}
+import json, sys
+args = sys.argv[1:]
+output = args[args.index("-o") + 1]
+config = {{}}
+if "-c" in args:
+    with open(args[args.index("-c") + 1], encoding="utf-8") as f:
+        config = json.load(f)
+html_labels = config.get("flowchart", {{}}).get("htmlLabels", config.get("htmlLabels", True))
+label = "<foreignObject><div>label</div></foreignObject>" if html_labels else "<text>label</text>"
+with open(output, "w", encoding="utf-8") as f:
+    f.write('<svg xmlns="http://www.w3.org/2000/svg">' + label + "</svg>")
+"""
+
+
+def render_svg(tmp_path, source):
+    store = FragmentStore(str(tmp_path / "fragments.sqlite3"), 1000)
+    renderer = DiagramRenderer(
+        PdfCache(str(tmp_path / "diagrams"), 64 * 1024 * 1024, suffix=DIAGRAM_SUFFIX),
+        FragmentCache("diagram-error", store, 10),
+    )
+    html = f'<pre><code class="language-mermaid">{source}</code></pre>'
+    assets, complete = asyncio.run(renderer.prepare(html))
+    assert complete
+    (asset,) = assets.values()
+    with open(asset.path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_labels_are_not_html(tmp_path, monkeypatch):
+    cli = tmp_path / "mmdc"
+    cli.write_text(FAKE_MMDC.format(python=sys.executable), encoding="utf-8")
+    cli.chmod(cli.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(settings, "mermaid_cli", str(cli))
+
+    svg = render_svg(tmp_path, FLOWCHART)
+    assert "foreignObject" not in svg
+    assert "<text>" in svg
+
+
+@pytest.mark.skipif(shutil.which(settings.mermaid_cli) is None, reason="未安装 mermaid-cli")
+def test_mermaid_cli_output_has_no_foreign_object(tmp_path):
+    svg = render_svg(tmp_path, FLOWCHART)
+    assert "<svg" in svg
+    assert "foreignObject" not in svg
@@ -0,0 +1,129 @@
+"""转换引擎与字体子集缓存测试
+
+渲染进程池用标准库函数代替渲染函数，验证进程复用、回收、超时与异常退出后的替换，
+不需要 WeasyPrint。
+"""
+import asyncio
+import operator
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.converter.cache import PdfCache
+from app.converter.engine import ConversionEngine
+from app.converter.errors import ConversionError
+from app.converter.fonts import FONT_SUFFIX, FontSubsetCache
+
+
+def run_engine(engine, steps):
+    """在同一个事件循环中依次执行 steps，结束后关闭引擎"""
+    async def run():
+        try:
+            return [await step(engine) for step in steps]
+        finally:
+            engine.shutdown()
+
+    return asyncio.run(run())
+
+
+async def worker_pid(engine):
+    return await engine._run(os.getpid)
+
+
+def test_reuses_and_recycles_workers():
+    engine = ConversionEngine(max_workers=1, timeout=60, max_jobs_per_worker=2)
+    pids = run_engine(engine, [worker_pid] * 3)
+
+    assert os.getpid() not in pids
+    # 同一进程执行两个任务后被替换
+    assert pids[0] == pids[1] != pids[2]
+    assert engine.recycled == 1
+
+
+def test_timeout_replaces_worker():
+    engine = ConversionEngine(max_workers=1, timeout=60)
+
+    async def slow(engine):
+        # 进程启动完成后再缩短超时
+        engine.timeout = 0.5
+        with pytest.raises(ConversionError, match="超时"):
+            await engine._run(time.sleep, 30)
+        engine.timeout = 60
+
+    before, _, after = run_engine(engine, [worker_pid, slow, worker_pid])
+    assert before != after
+    assert engine.recycled == 1
+
+
+def test_crashed_worker_is_replaced():
+    engine = ConversionEngine(max_workers=1, timeout=60)
+
+    async def crash(engine):
+        with pytest.raises(ConversionError, match="异常退出"):
+            await engine._run(os._exit, 1)
+
+    before, _, after = run_engine(engine, [worker_pid, crash, worker_pid])
+    assert before != after
+    assert engine.recycled == 1
+
+
+def test_errors_are_wrapped_and_worker_kept():
+    engine = ConversionEngine(max_workers=1, timeout=60)
+
+    async def fail(engine):
+        with pytest.raises(ConversionError, match="PDF转换失败") as info:
+            await engine._run(operator.truediv, 1, 0)
+        assert isinstance(info.value.__cause__, ZeroDivisionError)
+
+    before, _, after = run_engine(engine, [worker_pid, fail, worker_pid])
+    # 渲染函数抛出的异常不影响进程继续使用
+    assert before == after
+    assert engine.recycled == 0
+
+
+def make_font(content=b"font-data", **fields):
+    values = {
+        "hash": "font", "file_content": content, "index": 0, "missing": False, "tables": {},
+        "variations": {}, "weight": 400, "style": "normal", "font_size": 12,
+    }
+    values.update(fields)
+    return SimpleNamespace(**values)
+
+
+def make_font_cache(tmp_path, memory_bytes=1024):
+    store = PdfCache(str(tmp_path / "fonts"), 1024 * 1024, suffix=FONT_SUFFIX)
+    return FontSubsetCache(store, memory_bytes)
+
+
+def test_font_key_depends_on_glyphs_and_hinting(tmp_path):
+    cache = make_font_cache(tmp_path)
+    font = make_font()
+    key = cache.make_key(font, {1: "a", 2: "b"}, True)
+
+    assert cache.make_key(font, {2: "b", 1: "a"}, True) == key
+    assert cache.make_key(font, {1: "a"}, True) != key
+    assert cache.make_key(font, {1: "a", 2: "b"}, False) != key
+    assert cache.make_key(make_font(b"other-font", hash="other"), {1: "a", 2: "b"}, True) != key
+    # 可变字体按实例化参数区分
+    variable = make_font(tables={"fvar": None}, variations={"wght": 400})
+    bold = make_font(tables={"fvar": None}, variations={"wght": 700})
+    assert cache.make_key(variable, {1: "a"}, True) != cache.make_key(bold, {1: "a"}, True)
+
+
+def test_font_cache_memory_and_disk(tmp_path):
+    cache = make_font_cache(tmp_path, memory_bytes=10)
+    assert cache.get("a" * 64) is None
+
+    cache.put("a" * 64, b"subset-a")
+    cache.put("b" * 64, b"subset-b")
+    # 超出内存预算时淘汰最久未使用的条目，但磁盘上仍然保留
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a" * 64) == b"subset-a"
+
+    # 其他进程通过磁盘部分复用
+    other = FontSubsetCache(cache.store, 1024)
+    assert other.get("b" * 64) == b"subset-b"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
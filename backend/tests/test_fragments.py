@@ -0,0 +1,63 @@
+"""片段缓存测试
+
+读取不单独提交写事务：最近使用时间攒批后再写入；事件循环中通过 aget/aput 访问持久化存储。
+"""
+import asyncio
+import sqlite3
+
+from app.converter import fragments
+from app.converter.fragments import FragmentCache, FragmentStore
+
+
+def last_used(path, key):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT last_used FROM fragments WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_reads_batch_last_used(tmp_path, monkeypatch):
+    path = str(tmp_path / "fragments.sqlite3")
+    store = FragmentStore(path, 1000)
+    clock = [1000.0]
+    monkeypatch.setattr(fragments.time, "time", lambda: clock[0])
+    monkeypatch.setattr(fragments, "_TOUCH_BATCH", 3)
+    store.put("a", "A")
+    store.put("b", "B")
+
+    clock[0] = 2000.0
+    assert store.get("a") == "A"
+    assert store.get("b") == "B"
+    # 未攒够一批，读取没有写入
+    assert last_used(path, "a") == 1000
+
+    assert store.get("a") == "A"
+    store.put("c", "C")
+    # 写入时一并提交累计的使用时间
+    assert last_used(path, "a") == 2000
+    assert last_used(path, "b") == 2000
+
+    clock[0] = 3000.0
+    for _ in range(3):
+        store.get("c")
+    # 同一个键重复读取只记一条
+    assert last_used(path, "c") == 2000
+    store.get("b")
+    store.get("a")
+    # 不同的键攒够一批后由读取写入
+    assert last_used(path, "c") == 3000
+
+
+def test_async_access(tmp_path, monkeypatch):
+    store = FragmentStore(str(tmp_path / "fragments.sqlite3"), 1000)
+    writer = FragmentCache("html", store, 10)
+    reader = FragmentCache("html", store, 10)
+
+    async def run():
+        await writer.aput("key", "<p>x</p>")
+        assert await reader.aget("missing") is None
+        assert await reader.aget("key") == "<p>x</p>"
+        # 已在内存中时不访问持久化存储
+        monkeypatch.setattr(store, "get", lambda key: None)
+        return await reader.aget("key")
+
+    assert asyncio.run(run()) == "<p>x</p>"
+    assert reader.stats() == {"hits": 2, "misses": 1, "memory_entries": 1}
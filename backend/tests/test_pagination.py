@@ -0,0 +1,53 @@
+"""分页游标编码测试"""
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.pagination import InvalidCursorError, decode_cursor, encode_cursor
+from db.models import MarkdownDocument
+
+COLUMNS = (MarkdownDocument.updated_at, MarkdownDocument.id)
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+@pytest.mark.parametrize("backward", [False, True])
+def test_round_trip(backward):
+    updated_at = datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor([updated_at, 42], backward=backward)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, COLUMNS) == ([updated_at, 42], backward)
+
+
+def test_naive_datetime_round_trip():
+    updated_at = datetime(2026, 1, 2, 3, 4, 5)
+    assert decode_cursor(encode_cursor([updated_at, 1]), COLUMNS) == ([updated_at, 1], False)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "not base64!",
+        base64.urlsafe_b64encode(b"not json").decode("ascii"),
+        raw_cursor({"k": ["2026-01-01T00:00:00"], "b": False}),
+        raw_cursor({"k": ["2026-01-01T00:00:00", 1]}),
+        raw_cursor({"k": ["2026-01-01T00:00:00", 1], "b": "yes"}),
+        raw_cursor({"k": ["yesterday", 1], "b": False}),
+        raw_cursor({"k": ["2026-01-01T00:00:00", "1"], "b": False}),
+        raw_cursor({"k": ["2026-01-01T00:00:00", True], "b": False}),
+        raw_cursor([1, 2]),
+    ],
+    ids=[
+        "empty", "not_base64", "not_json", "short", "no_direction", "bad_direction",
+        "bad_datetime", "string_id", "bool_id", "not_object",
+    ],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, COLUMNS)
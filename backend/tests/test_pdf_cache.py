@@ -0,0 +1,135 @@
+"""PDF磁盘缓存测试：LRU淘汰、占用期间不淘汰、有效期"""
+import os
+
+from app.converter import cache as cache_module
+from app.converter.cache import TEMPORARY_SUFFIX, PdfCache
+
+KB = 1024
+
+
+def make_cache(tmp_path, max_bytes=3 * KB):
+    return PdfCache(str(tmp_path / "cache"), max_bytes)
+
+
+def key(name):
+    return name * 64
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path)
+    for name in "abc":
+        cache.put(key(name), b"x" * KB)
+    # 读取刷新访问顺序，a 不再是最久未使用
+    assert cache.get(key("a")) is not None
+
+    cache.put(key("d"), b"x" * KB)
+
+    assert cache.get(key("b")) is None
+    assert not os.path.exists(cache.path_for(key("b")))
+    for name in "acd":
+        assert cache.get(key(name)) is not None
+    assert cache.stats() == {"entries": 3, "bytes": 3 * KB}
+
+
+def test_reload_restores_order(tmp_path):
+    cache = make_cache(tmp_path)
+    for index, name in enumerate("abc"):
+        path = cache.put(key(name), b"x" * KB)
+        os.utime(path, (1000 + index, 1000 + index))
+    # a 最近被访问
+    os.utime(cache.path_for(key("a")), (2000, 2000))
+
+    reloaded = make_cache(tmp_path)
+    reloaded.put(key("d"), b"x" * KB)
+    assert reloaded.get(key("b")) is None
+    assert reloaded.get(key("a")) is not None
+
+
+def test_pinned_entries_are_not_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=2 * KB)
+    cache.put(key("a"), b"x" * KB)
+    path = cache.acquire(key("a"))
+    assert path is not None
+    assert cache.acquire(key("a")) == path
+
+    cache.put(key("b"), b"x" * KB)
+    cache.put(key("c"), b"x" * KB)
+    # a 被占用，淘汰 b
+    assert os.path.exists(path)
+    assert cache.get(key("b")) is None
+
+    cache.release(key("a"))
+    cache.release(key("a"))
+    assert cache.get(key("a")) == path
+
+
+def test_release_evicts_over_budget(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=KB)
+    cache.put(key("a"), b"x" * KB)
+    path = cache.acquire(key("a"))
+    cache.put(key("b"), b"x" * KB)
+    # 占用中的文件与刚写入的结果都保留，暂时超出预算
+    assert os.path.exists(path)
+    assert cache.total_bytes == 2 * KB
+
+    cache.release(key("a"))
+    # 释放后超出预算的部分随即淘汰
+    assert not os.path.exists(path)
+    assert cache.stats() == {"entries": 1, "bytes": KB}
+
+
+def test_ttl_entries_expire(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock[0])
+    cache = make_cache(tmp_path)
+    tmp = cache.reserve()
+    with open(tmp, "wb") as f:
+        f.write(b"partial")
+    path = cache.commit(key("a"), tmp, ttl=60)
+    assert path.endswith(TEMPORARY_SUFFIX + ".pdf")
+    assert cache.ttl(key("a")) == 60
+    assert cache.get(key("a")) == path
+
+    clock[0] += 61
+    assert cache.ttl(key("a")) == 0
+    assert cache.get(key("a")) is None
+    assert not os.path.exists(path)
+    assert cache.stats() == {"entries": 0, "bytes": 0}
+
+
+def test_expired_entry_kept_while_pinned(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock[0])
+    cache = make_cache(tmp_path)
+    tmp = cache.reserve()
+    with open(tmp, "wb") as f:
+        f.write(b"partial")
+    path = cache.commit(key("a"), tmp, ttl=60)
+    assert cache.acquire(key("a")) == path
+
+    clock[0] += 61
+    assert cache.get(key("a")) == path
+    cache.release(key("a"))
+    assert cache.get(key("a")) is None
+
+
+def test_complete_result_replaces_partial(tmp_path):
+    cache = make_cache(tmp_path)
+    tmp = cache.reserve()
+    partial = cache.commit(key("a"), tmp, ttl=60)
+    path = cache.put(key("a"), b"complete")
+    assert path == cache.path_for(key("a"))
+    assert not os.path.exists(partial)
+    assert cache.ttl(key("a")) is None
+
+
+def test_partial_entries_dropped_on_reload(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(key("a"), b"complete")
+    tmp = cache.reserve()
+    partial = cache.commit(key("b"), tmp, ttl=60)
+
+    reloaded = make_cache(tmp_path)
+    assert reloaded.get(key("b")) is None
+    assert not os.path.exists(partial)
+    assert reloaded.get(key("a")) is not None
@@ -0,0 +1,128 @@
+"""PDF后处理测试：叠加水印与优化
+
+基础PDF与水印页用 pypdf 生成，不需要 WeasyPrint。
+"""
+import zlib
+
+import pikepdf
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ContentStream, DictionaryObject, NameObject
+
+from app.converter.optimize import optimize_pdf
+from app.converter.watermark import stamp_watermark
+
+
+def write_text_pdf(path, texts):
+    """每页一行文字的PDF（使用标准字体，无需嵌入）"""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for text in texts:
+        page = writer.add_blank_page(200, 200)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        content = ContentStream(None, writer)
+        content.set_data(f"BT /F1 12 Tf 20 100 Td ({text}) Tj ET".encode("ascii"))
+        page.replace_contents(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def add_duplicate_images(path, copies):
+    """在每页上放置 copies 个内容相同但各自独立的图片对象"""
+    pixels = zlib.compress(bytes(range(256)) * 48)
+    with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+        for page in pdf.pages:
+            names = []
+            for _ in range(copies):
+                image = pdf.make_stream(
+                    pixels,
+                    Type=pikepdf.Name.XObject,
+                    Subtype=pikepdf.Name.Image,
+                    Width=64,
+                    Height=64,
+                    ColorSpace=pikepdf.Name.DeviceRGB,
+                    BitsPerComponent=8,
+                    Filter=pikepdf.Name.FlateDecode,
+                )
+                names.append(page.add_resource(image, pikepdf.Name.XObject, prefix="Im"))
+            draw = " ".join(f"q 32 0 0 32 {i * 40} 0 cm {name} Do Q" for i, name in enumerate(names))
+            page.contents_add(pdf.make_stream(draw.encode("ascii")))
+        pdf.save(path)
+
+
+def image_streams(path):
+    with pikepdf.open(path) as pdf:
+        return [
+            obj for obj in pdf.objects
+            if isinstance(obj, pikepdf.Stream) and obj.stream_dict.get("/Subtype") == "/Image"
+        ]
+
+
+def test_stamp_watermark_shares_one_form(tmp_path):
+    base = write_text_pdf(tmp_path / "base.pdf", ["one", "two", "three"])
+    watermark = write_text_pdf(tmp_path / "watermark.pdf", ["CONFIDENTIAL"])
+    output = tmp_path / "out.pdf"
+
+    size = stamp_watermark(base, watermark, str(output))
+
+    assert size == output.stat().st_size
+    reader = PdfReader(str(output))
+    assert len(reader.pages) == 3
+    for page, text in zip(reader.pages, ["one", "two", "three"]):
+        extracted = page.extract_text()
+        assert text in extracted
+        assert "CONFIDENTIAL" in extracted
+
+    with pikepdf.open(output) as pdf:
+        forms = set()
+        for page in pdf.pages:
+            for xobject in page.resources.XObject.values():
+                if xobject.get("/Subtype") == "/Form":
+                    forms.add(xobject.objgen)
+        # 水印只复制进文档一次，各页引用同一个表单XObject
+        assert len(forms) == 1
+
+
+def test_stamp_watermark_optimized(tmp_path):
+    base = write_text_pdf(tmp_path / "base.pdf", ["one", "two"])
+    watermark = write_text_pdf(tmp_path / "watermark.pdf", ["DRAFT"])
+    output = tmp_path / "out.pdf"
+
+    stamp_watermark(base, watermark, str(output), optimize=True)
+
+    with pikepdf.open(output) as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 2
+
+
+def test_optimize_dedupes_images_and_linearizes(tmp_path):
+    path = write_text_pdf(tmp_path / "doc.pdf", ["one", "two"])
+    add_duplicate_images(path, copies=3)
+    assert len(image_streams(path)) == 6
+
+    result = optimize_pdf(path)
+
+    assert result.size < result.original_size
+    assert len(image_streams(path)) == 1
+    with pikepdf.open(path) as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 2
+    assert not (tmp_path / "doc.pdf.opt").exists()
+    # 内容不变
+    assert [page.extract_text().strip() for page in PdfReader(path).pages] == ["one", "two"]
+
+
+def test_optimize_keeps_original_on_error(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"not a pdf")
+    with pytest.raises(pikepdf.PdfError):
+        optimize_pdf(str(path))
+    assert path.read_bytes() == b"not a pdf"
+    assert not (tmp_path / "broken.pdf.opt").exists()
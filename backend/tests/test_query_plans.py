@@ -0,0 +1,135 @@
+"""文档列表查询的执行计划测试（SQLite）
+
+执行CRUD中的真实查询，记录发出的SQL，再用 EXPLAIN QUERY PLAN 检查：
+列表与计数必须走对应的索引，不能全表扫描，也不能为 ORDER BY 额外排序。
+"""
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.crud import MarkdownDocumentCRUD
+from db.models import Base, MarkdownDocument, User, UserRole
+
+# 表的全表扫描（SCAN后没有 USING INDEX）
+FULL_SCAN_RE = re.compile(r"^SCAN markdown_documents(?! USING)")
+
+
+@pytest.fixture
+def database(tmp_path):
+    """建好表和索引、写入少量数据的SQLite数据库，返回（同步引擎, 异步引擎）"""
+    path = tmp_path / "plans.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        for user_id in (1, 2):
+            connection.execute(User.__table__.insert().values(
+                id=user_id,
+                username=f"user{user_id}",
+                email=f"user{user_id}@example.com",
+                hashed_password="x",
+                role=UserRole.FREE,
+                is_active=True,
+                is_verified=False,
+                total_documents=0,
+                total_conversions=0,
+            ))
+        connection.execute(MarkdownDocument.__table__.insert(), [
+            {
+                "user_id": 1 + index % 2,
+                "title": f"文档{index}",
+                "content": "内容",
+                "is_public": index % 3 == 0,
+                "is_deleted": index % 7 == 0,
+                "view_count": index % 5,
+                "conversion_count": 0,
+                "updated_at": start + timedelta(minutes=index),
+            }
+            for index in range(200)
+        ])
+        # 公开文档计数同时满足两个部分索引的条件，没有统计信息时SQLite按索引的建立顺序二选一，
+        # 而建立顺序随集合的迭代顺序变化；收集统计信息后按实际行数选择，计划才是确定的
+        connection.execute(text("ANALYZE"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield engine, async_engine
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
+
+
+def query_plans(database, operation):
+    """执行 operation(db)，返回其中每条 SELECT 的执行计划（每条计划为若干行说明）"""
+    engine, async_engine = database
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    async def run():
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            async with AsyncSession(async_engine) as db:
+                await operation(db)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    asyncio.run(run())
+    assert statements, "没有执行任何查询"
+    with engine.connect() as connection:
+        return [
+            [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            for statement, parameters in statements
+        ]
+
+
+def assert_uses_index(plans, index_name):
+    """每条计划都通过指定索引读取文档表，且没有全表扫描和额外排序"""
+    for plan in plans:
+        assert not any(FULL_SCAN_RE.match(line) for line in plan), plan
+        assert not any("USE TEMP B-TREE FOR ORDER BY" in line for line in plan), plan
+        assert any(index_name in line for line in plan), plan
+
+
+def test_user_documents_use_owner_index(database):
+    async def operation(db):
+        first = await MarkdownDocumentCRUD.get_user_documents(db, 1, limit=10)
+        second = await MarkdownDocumentCRUD.get_user_documents(db, 1, limit=10, cursor=first.next_cursor)
+        await MarkdownDocumentCRUD.get_user_documents(db, 1, limit=10, cursor=second.prev_cursor)
+
+    assert_uses_index(query_plans(database, operation), "ix_markdown_documents_user_updated")
+
+
+def test_user_document_count_uses_owner_index(database):
+    async def operation(db):
+        assert await MarkdownDocumentCRUD.count_user_documents(db, 1) == 85
+
+    assert_uses_index(query_plans(database, operation), "ix_markdown_documents_user_updated")
+
+
+def test_user_document_ids_use_owner_index(database):
+    async def operation(db):
+        await MarkdownDocumentCRUD.get_user_document_ids(db, 1)
+
+    assert_uses_index(query_plans(database, operation), "ix_markdown_documents_user_updated")
+
+
+def test_public_documents_use_public_index(database):
+    async def operation(db):
+        first = await MarkdownDocumentCRUD.get_public_documents(db, limit=10)
+        await MarkdownDocumentCRUD.get_public_documents(db, limit=10, cursor=first.next_cursor)
+        await MarkdownDocumentCRUD.count_public_documents(db)
+
+    assert_uses_index(query_plans(database, operation), "ix_markdown_documents_public_views")
+
+
+def test_get_by_id_uses_primary_key(database):
+    async def operation(db):
+        assert await MarkdownDocumentCRUD.get_by_id(db, 4, user_id=2) is not None
+        assert await MarkdownDocumentCRUD.get_by_id(db, 4, user_id=1) is None
+
+    for plan in query_plans(database, operation):
+        assert plan == ["SEARCH markdown_documents USING INTEGER PRIMARY KEY (rowid=?)"], plan
@@ -0,0 +1,92 @@
+"""渲染冒烟测试（需要 WeasyPrint 及其系统依赖 Pango，缺少时整个模块跳过）"""
+import io
+
+import pytest
+
+try:
+    import weasyprint  # noqa: F401
+except (ImportError, OSError) as e:
+    # 缺少 Pango 等系统库时导入抛出 OSError
+    pytest.skip(f"WeasyPrint 不可用: {e}", allow_module_level=True)
+
+from pypdf import PdfReader
+
+from app.converter.cache import PdfCache
+from app.converter.engine import (
+    merge_sections_to_file,
+    render_document,
+    render_section_to_file,
+)
+from app.converter.fonts import FONT_SUFFIX, FontSubsetCache, install_font_subset_cache
+from app.converter.options import PdfOptions, WatermarkOptions
+from app.converter.parser import render_document_html
+from app.converter.sections import split_sections
+from app.converter.watermark import render_watermark_to_file, stamp_watermark
+
+CONTENT = """# 第一章
+
+正文 **加粗** 与 `代码`，跳到[第二章](#第二章)。
+
+```python
+print("hello")
+```
+
+# 第二章
+
+| 列 | 值 |
+| -- | -- |
+| a  | 1  |
+"""
+
+
+def test_render_document():
+    pdf = render_document(CONTENT, "冒烟测试", PdfOptions())
+    assert pdf.startswith(b"%PDF")
+
+
+def test_render_sections_and_merge(tmp_path):
+    options = PdfOptions()
+    part_options = options.model_copy(update={"page_numbers": False})
+    sections = split_sections(render_document_html(CONTENT))
+    assert len(sections) == 2
+
+    parts = []
+    for index, body in enumerate(sections):
+        path = str(tmp_path / f"part{index}.pdf")
+        render_section_to_file(path, body, "冒烟测试", part_options)
+        parts.append(path)
+    output = tmp_path / "merged.pdf"
+    merge_sections_to_file(str(output), parts, "冒烟测试", options)
+
+    reader = PdfReader(str(output))
+    assert len(reader.pages) >= 2
+    assert reader.metadata.title == "冒烟测试"
+
+
+def test_watermark(tmp_path):
+    options = PdfOptions()
+    base = tmp_path / "base.pdf"
+    base.write_bytes(render_document(CONTENT, "冒烟测试", options))
+    watermark = tmp_path / "watermark.pdf"
+    render_watermark_to_file(str(watermark), WatermarkOptions(text="机密"), options)
+    output = tmp_path / "out.pdf"
+
+    stamp_watermark(str(base), str(watermark), str(output))
+
+    assert len(PdfReader(str(output)).pages) == len(PdfReader(str(base)).pages)
+
+
+def test_font_subset_cache_hits(tmp_path, monkeypatch):
+    from weasyprint.pdf.fonts import Font
+
+    # 测试结束后恢复原来的字体处理
+    monkeypatch.setattr(Font, "clean", Font.clean)
+    store = PdfCache(str(tmp_path / "fonts"), 64 * 1024 * 1024, suffix=FONT_SUFFIX)
+    cache = FontSubsetCache(store, 1024 * 1024)
+    assert install_font_subset_cache(cache)
+
+    first = render_document(CONTENT, "冒烟测试", PdfOptions())
+    assert cache.stats()["misses"] > 0
+    second = render_document(CONTENT, "冒烟测试", PdfOptions())
+    assert cache.stats()["hits"] > 0
+    assert len(PdfReader(io.BytesIO(second)).pages) == len(PdfReader(io.BytesIO(first)).pages)
@@ -0,0 +1,144 @@
+"""分段渲染的分组与合并测试
+
+合并只依赖 pypdf，各段PDF用 pypdf 直接生成，不需要 WeasyPrint。
+"""
+import io
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import Link
+from pypdf.generic import ContentStream, DictionaryObject, NameObject
+
+from app.converter.sections import (
+    SECTION_LINK_PREFIX,
+    group_sections,
+    link_across_sections,
+    merge_section_pdfs,
+    split_sections,
+)
+
+
+def make_pdf(path, pages, anchors=(), links=(), outline=None):
+    """生成 pages 页空白PDF；anchors 为命名目标，links 为第一页上的跨段链接"""
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(200, 200)
+    for name in anchors:
+        writer.add_named_destination(name, 0)
+    for index, target in enumerate(links):
+        rect = (10, 10 + index * 20, 100, 25 + index * 20)
+        writer.add_annotation(0, Link(rect=rect, url=SECTION_LINK_PREFIX + target))
+    if outline:
+        writer.add_outline_item(outline, 0)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def text_page(text):
+    """只包含一行文字的页面（使用标准字体，无需嵌入）"""
+    writer = PdfWriter()
+    page = writer.add_blank_page(200, 200)
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+    })
+    content = ContentStream(None, writer)
+    content.set_data(f"BT /F1 12 Tf 90 10 Td ({text}) Tj ET".encode("ascii"))
+    page.replace_contents(content)
+    return page
+
+
+def link_targets(page):
+    """页面上链接注释的（URI, 命名目标）"""
+    targets = []
+    for ref in page.get("/Annots") or []:
+        annotation = ref.get_object()
+        action = annotation.get("/A")
+        uri = str(action.get_object().get("/URI")) if action is not None else None
+        dest = annotation.get("/Dest")
+        targets.append((uri, str(dest) if dest is not None else None))
+    return targets
+
+
+def test_group_sections_keeps_order_and_balances():
+    sections = ["a" * 10, "b" * 10, "c" * 10, "d" * 10]
+    groups = group_sections(sections, 2)
+    assert groups == ["a" * 10 + "b" * 10, "c" * 10 + "d" * 10]
+    assert "".join(group_sections(sections, 3)) == "".join(sections)
+    assert len(group_sections(sections, 3)) == 3
+
+
+def test_group_sections_bounds():
+    sections = ["x" * 100, "y", "z"]
+    # 组数不超过分段数，每组至少一段
+    assert group_sections(sections, 10) == sections
+    assert group_sections(sections, 0) == ["".join(sections)]
+    # 大段单独成组，剩余分段只够每组一段时立即结束当前组
+    assert group_sections(sections, 2) == ["x" * 100, "yz"]
+
+
+def test_split_sections_top_level_headings_only():
+    html = (
+        "<p>前言</p><h2>一</h2><p>a</p>"
+        "<blockquote><h2>引用中的标题</h2></blockquote>"
+        "<h2>二</h2><h3>小节</h3><p>b</p>"
+    )
+    sections = split_sections(html)
+    assert "".join(sections) == html
+    assert len(sections) == 2
+    assert sections[0].startswith("<p>前言</p><h2>一</h2>")
+    assert sections[1].startswith("<h2>二</h2>")
+
+
+def test_link_across_sections():
+    html = '<h2 id="local">x</h2><a href="#local">本段</a><a href="#remote">他段</a>'
+    result = link_across_sections(html)
+    assert 'href="#local"' in result
+    assert f'href="{SECTION_LINK_PREFIX}remote"' in result
+
+
+def test_merge_resolves_links_across_sections(tmp_path):
+    first = make_pdf(tmp_path / "1.pdf", 2, links=["second", "missing"], outline="第一章")
+    second = make_pdf(tmp_path / "2.pdf", 1, anchors=["second"], outline="第二章")
+    output = tmp_path / "out.pdf"
+
+    size = merge_section_pdfs(str(output), [first, second], title="文档")
+
+    assert size == output.stat().st_size
+    reader = PdfReader(str(output))
+    assert len(reader.pages) == 3
+    assert reader.metadata.title == "文档"
+    assert reader.page_mode == "/UseOutlines"
+    assert [item.title for item in reader.outline] == ["第一章", "第二章"]
+    # 命名目标随页面一起复制并指向合并后的页码
+    assert reader.get_destination_page_number(reader.named_destinations["second"]) == 2
+    # 指向存在目标的链接改为文档内跳转，目标不存在的移除链接动作
+    assert link_targets(reader.pages[0]) == [(None, "second"), (None, None)]
+
+
+def test_merge_overlays_continuous_page_numbers(tmp_path):
+    first = make_pdf(tmp_path / "1.pdf", 2)
+    second = make_pdf(tmp_path / "2.pdf", 2)
+    requested = []
+
+    def page_numbers(pages):
+        requested.append(pages)
+        writer = PdfWriter()
+        for number in range(1, pages + 1):
+            page = writer.add_blank_page(200, 200)
+            page.merge_page(text_page(str(number)))
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    output = tmp_path / "out.pdf"
+    merge_section_pdfs(str(output), [first, second], page_numbers)
+
+    assert requested == [4]
+    reader = PdfReader(str(output))
+    assert [page.extract_text().strip() for page in reader.pages] == ["1", "2", "3", "4"]
+
@@ -0,0 +1,10 @@
+"""Markdown转换测试样本，在线测试与离线性能测试共用"""
+
+# 测试用的 Markdown 样本
+CASES = {
+    "style_lost": "# 标题1\n## 子标题\n- 项目1\n- 项目2",
+    "image_broken": "![不存在图片](https://example.com/image-not-exist.png)",
+    "code_block_error": "```python\nprint('Hello World')\n```",
+    "emoji_fail": "# 欢迎 😊",
+    "long_content": "# 长内容\n" + "\n".join(["这是第 %d 行" % i for i in range(1, 500)]),
+}
@@ -2,18 +2,11 @@ import asyncio
 from playwright.async_api import async_playwright
 import os
 
+from cases import CASES
+
 # 测试页面 URL（可替换为你自己部署或测试的网址）
 TEST_PAGE = "https://www.markdowntopdf.com"
 
-# 测试用的 Markdown 样本
-CASES = {
-    "style_lost": "# 标题1\n## 子标题\n- 项目1\n- 项目2",
-    "image_broken": "![不存在图片](https://example.com/image-not-exist.png)",
-    "code_block_error": "```python\nprint('Hello World')\n```",
-    "emoji_fail": "# 欢迎 😊",
-    "long_content": "# 长内容\n" + "\n".join(["这是第 %d 行" % i for i in range(1, 500)]),
-}
-
 # 存储生成的 PDF 路径
 OUTPUT_DIR = "pdf_outputs"
 os.makedirs(OUTPUT_DIR, exist_ok=True)